@@ -1,15 +1,68 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from app.services.graphrag_service import GraphRAGService
+from typing import List, Dict, Any, Literal, Optional, Union
+from app.config.graphrag_config import graphrag_config
+from app.exception import BaseAppException, ValidationException
+from app.services.graphrag_service import (
+    GraphRAGService,
+    graphrag_answer_cache,
+    graphrag_concurrency_pools,
+    graphrag_corpus_registry,
+    graphrag_import_report,
+    graphrag_semantic_cache,
+    graphrag_trace_histograms,
+)
+from app.services.graphrag_trace import GraphRAGTrace
 from app.services.tool_service import ToolService
+from app.utils.request import get_request_id
 
 api_router = APIRouter()
 
 
+# 搜索模式
+SearchMode = Literal["local", "global", "drift"]
+# 支持只检索上下文的搜索模式
+ContextMode = Literal["local", "global"]
+# 支持流式输出的搜索模式
+StreamMode = Literal["local", "global"]
+# 全局搜索的社区报告档位：quality 使用报告全文，fast 使用紧凑摘要，auto 按报告总token数选择
+ReportProfile = Literal["quality", "fast", "auto"]
+
+
 # 请求模型
 class ChatRequest(BaseModel):
     query: str
+    mode: SearchMode = "local"
+    corpus: Optional[str] = None  # 语料名称，默认使用 DEFAULT_CORPUS
+    include_timings: bool = False  # 为True时在响应中返回各阶段耗时和token数
+    profile: Optional[ReportProfile] = None  # 全局搜索的报告档位，默认使用服务端配置，其他搜索模式忽略
+
+
+class StreamChatRequest(BaseModel):
+    query: str
+    mode: StreamMode = "local"
+    corpus: Optional[str] = None  # 语料名称，默认使用 DEFAULT_CORPUS
+    include_timings: bool = False  # 为True时在最后返回各阶段耗时和token数
+
+
+class ContextRequest(BaseModel):
+    query: str
+    mode: ContextMode = "local"
+    corpus: Optional[str] = None  # 语料名称，默认使用 DEFAULT_CORPUS
+    profile: Optional[ReportProfile] = None  # 全局搜索的报告档位，默认使用服务端配置
+
+
+class BatchQuery(BaseModel):
+    query: str
+    mode: SearchMode = "local"
+
+
+class BatchChatRequest(BaseModel):
+    queries: List[BatchQuery]
+    corpus: Optional[str] = None  # 语料名称，默认使用 DEFAULT_CORPUS
+    stream: bool = False  # 为True时以NDJSON逐条返回先完成的结果
 
 
 # 响应模型
@@ -18,9 +71,161 @@ class ToolInfo(BaseModel):
     description: str
 
 
+class RequestTimings(BaseModel):
+    request_id: str
+    mode: str
+    corpus: Optional[str] = None
+    total: float  # 请求总耗时(秒)
+    first_token: Optional[float] = None  # 流式请求产出首个回答片段的耗时(秒)
+    stages: Dict[str, float]  # 各阶段自身的耗时(秒)，并发的LLM调用累加
+    llm_calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    llm_errors: int = 0  # 失败的LLM调用数
+    cache: Optional[str] = None  # 命中的缓存：answer 或 semantic
+    error: Optional[str] = None
+
+
 class ChatResponse(BaseModel):
     tool_info: ToolInfo
     result: str
+    timings: Optional[RequestTimings] = None
+
+
+class ContextResponse(BaseModel):
+    mode: str
+    version: str  # 语料及其索引版本
+    context_text: Union[str, List[str]]  # 拼接后交给LLM的上下文文本（全局搜索为多批）
+    context_data: Dict[str, Any]  # 按类型（entities、relationships、reports、sources等）的上下文记录
+    context_tokens: int
+    chunk_tokens: List[int]
+    record_counts: Dict[str, int]
+
+
+class BatchChatResult(BaseModel):
+    index: int
+    query: str
+    mode: str
+    result: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult]
+
+
+class EngineStatus(BaseModel):
+    state: str
+    build_time: Optional[float] = None
+    error: Optional[str] = None
+
+
+class ReadinessResponse(BaseModel):
+    ready: bool
+    version: Optional[str] = None
+    engines: Dict[str, EngineStatus]
+
+
+class IndexVersion(BaseModel):
+    version: str
+    inflight: int
+    created_at: float
+
+
+class IndexStatusResponse(BaseModel):
+    current: IndexVersion
+    building: Optional[str] = None
+    retired: List[IndexVersion]
+    last_error: Optional[str] = None
+    last_swap_at: Optional[float] = None
+
+
+class IndexReloadRequest(BaseModel):
+    corpus: Optional[str] = None
+    force: bool = False
+
+
+class IndexReloadResponse(BaseModel):
+    accepted: bool
+    status: IndexStatusResponse
+
+
+class CorpusStatus(BaseModel):
+    name: str
+    resident: bool
+    version: Optional[str] = None
+    inflight: int = 0
+    resident_bytes: int = 0  # 私有内存占用，计入内存预算
+    mapped_bytes: int = 0  # 内存映射的数据大小，多个进程共享页缓存，不计入内存预算
+    load_time: Optional[float] = None  # 当前索引版本各搜索引擎的构建耗时之和(秒)
+    loaded_at: Optional[float] = None
+    last_used: Optional[float] = None
+    engines: Dict[str, EngineStatus] = {}
+
+
+class CorporaResponse(BaseModel):
+    default: Optional[str] = None
+    memory_budget: int
+    resident_bytes: int
+    resident: int
+    evictions: int
+    corpora: List[CorpusStatus]
+
+
+class ImportedModule(BaseModel):
+    module: str
+    self_time: float  # 模块自身代码的导入耗时(秒)
+    cumulative: float  # 包含其导入的子模块的耗时(秒)
+
+
+class StartupReport(BaseModel):
+    loaded: bool  # GraphRAG查询栈是否已导入
+    total: Optional[float] = None  # 导入总耗时(秒)
+    module_count: int = 0
+    packages: Dict[str, float] = {}  # 按顶层包汇总的导入耗时(秒)
+    modules: List[ImportedModule] = []  # 自身导入耗时最长的模块
+
+
+class HistogramSnapshot(BaseModel):
+    count: int
+    sum: float
+    buckets: Dict[str, int]  # 桶上界 -> 不超过该值的观测数（累积）
+
+
+class SemanticCacheStats(BaseModel):
+    enabled: bool
+    entries: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+    version: Optional[str] = None
+
+
+class CacheStatsResponse(BaseModel):
+    enabled: bool
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+    coalesced: int
+    evictions: int
+    hit_rate: float
+    semantic: SemanticCacheStats
+
+
+class PoolStats(BaseModel):
+    limit: int
+    min_limit: int
+    max_limit: int
+    queue_size: int
+    active: int
+    queued: int
+    latency: Optional[float] = None
+    baseline_latency: Optional[float] = None
+    completed: int
+    rejected: int
+    timeouts: int
 
 
 class ToolParameter(BaseModel):
@@ -50,21 +255,243 @@ def get_tool_service():
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     graphrag_service: GraphRAGService = Depends(get_graphrag_service),
 ):
-    """聊天接口，接受查询并返回结果"""
+    """聊天接口，按指定的搜索模式(local/global/drift)查询并返回结果
+
+    include_timings 为True时在 timings 字段返回向量化、检索、上下文构建、LLM首token和生成等阶段的耗时及token数。
+    全局搜索可以用 profile 选择社区报告全文（quality）或摘要（fast），摘要大幅减少 map 阶段的 prompt token 数。
+    """
+    trace = GraphRAGTrace(request.mode, request_id=get_request_id(http_request))
     try:
-        result = await graphrag_service.local_search(request.query)
+        result = await graphrag_service.search(
+            request.query, request.mode, request.corpus, trace, request.profile
+        )
         return ChatResponse(
             tool_info=ToolInfo(
-                name="local_asearch", description="为斗破苍穹小说提供相关的知识补充"
+                name=f"{request.mode}_asearch",
+                description="为斗破苍穹小说提供相关的知识补充",
             ),
             result=result,
+            timings=trace.to_dict() if request.include_timings else None,
         )
+    except BaseAppException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@api_router.post("/context", response_model=ContextResponse)
+async def context(
+    request: ContextRequest,
+    graphrag_service: GraphRAGService = Depends(get_graphrag_service),
+):
+    """上下文检索接口，只执行搜索引擎的上下文构建，不调用LLM
+
+    返回local/global搜索会交给LLM的上下文文本、结构化的上下文记录和token数，供自行生成回答的调用方使用。
+    """
+    try:
+        result = await graphrag_service.build_context(
+            request.query, request.mode, request.corpus, request.profile
+        )
+        return ContextResponse(mode=request.mode, **result)
+    except BaseAppException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@api_router.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(
+    request: BatchChatRequest,
+    http_request: Request,
+    graphrag_service: GraphRAGService = Depends(get_graphrag_service),
+):
+    """批量聊天接口，在并发上限内同时执行多个查询
+
+    默认按请求顺序返回全部结果；stream为True时以NDJSON格式每完成一条返回一行。
+    单条查询失败时该条的error字段为错误信息，不影响其他查询。
+    """
+    if len(request.queries) > graphrag_config.BATCH_MAX_QUERIES:
+        raise ValidationException(
+            message=f"单次批量请求最多支持{graphrag_config.BATCH_MAX_QUERIES}条查询",
+            error_details={"count": len(request.queries)},
+        )
+    queries = [(item.query, item.mode) for item in request.queries]
+    results = graphrag_service.batch_search(
+        queries,
+        concurrency=graphrag_config.BATCH_CONCURRENCY,
+        corpus=request.corpus,
+        request_id=get_request_id(http_request),
+    )
+
+    def to_result(index: int, result: Optional[str], error: Optional[str]):
+        query, mode = queries[index]
+        return BatchChatResult(
+            index=index, query=query, mode=mode, result=result, error=error
+        )
+
+    if request.stream:
+
+        async def ndjson_stream():
+            async for index, result, error in results:
+                item = to_result(index, result, error)
+                yield json.dumps(item.dict(), ensure_ascii=False) + "\n"
+
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+    ordered = [None] * len(queries)
+    async for index, result, error in results:
+        ordered[index] = to_result(index, result, error)
+    return BatchChatResponse(results=ordered)
+
+
+def _sse_event(event: str, data: Any) -> str:
+    """格式化一条Server-Sent Events消息"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@api_router.post("/chat/stream")
+async def chat_stream(
+    request: StreamChatRequest,
+    http_request: Request,
+    graphrag_service: GraphRAGService = Depends(get_graphrag_service),
+):
+    """流式聊天接口，以SSE逐段返回回答，上下文数据作为最后一个事件返回
+
+    支持local和global搜索模式，其他搜索模式在请求校验时拒绝（400）。
+
+    事件类型：
+        token: 回答片段，data为 {"content": "..."}
+        context: 检索到的上下文数据
+        error: 搜索失败，data为 {"message": "..."}
+        timings: include_timings 为True时返回各阶段耗时和token数，格式同 /chat 的 timings 字段
+        done: 结束标记
+    """
+
+    trace = GraphRAGTrace(request.mode, request_id=get_request_id(http_request))
+    chunks = graphrag_service.stream_search(
+        request.query, request.mode, request.corpus, trace
+    )
+    first_chunk, first_error = None, None
+    try:
+        # 先取第一段再开始响应，准入被拒绝时直接返回429/503，而不是在事件流中返回错误
+        first_chunk = await chunks.__anext__()
+    except BaseAppException:
+        raise
+    except StopAsyncIteration:
+        pass
+    except Exception as e:
+        first_error = e
+
+    def to_event(chunk: Any) -> str:
+        if isinstance(chunk, str):
+            return _sse_event("token", {"content": chunk})
+        return _sse_event("context", chunk)
+
+    async def event_stream():
+        try:
+            if first_error is not None:
+                raise first_error
+            if first_chunk is not None:
+                yield to_event(first_chunk)
+                async for chunk in chunks:
+                    yield to_event(chunk)
+        except Exception as e:
+            yield _sse_event("error", {"message": str(e)})
+        if request.include_timings:
+            yield _sse_event("timings", trace.to_dict())
+        yield _sse_event("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@api_router.get(
+    "/ready",
+    response_model=ReadinessResponse,
+    responses={503: {"model": ReadinessResponse}},
+)
+async def readiness():
+    """就绪检查接口，默认语料预热的搜索引擎全部构建完成前返回503"""
+    corpus = graphrag_corpus_registry.peek()
+    if corpus is None:
+        # 默认语料尚未加载，不在就绪检查中触发加载
+        content = ReadinessResponse(
+            ready=False,
+            engines={
+                mode: EngineStatus(state="pending") for mode in graphrag_config.WARMUP_MODES
+            },
+        )
+        return JSONResponse(status_code=503, content=content.dict())
+    index = corpus.manager.current
+    ready = index.registry.is_ready(graphrag_config.WARMUP_MODES)
+    content = ReadinessResponse(
+        ready=ready, version=index.version, engines=index.registry.status()
+    )
+    return JSONResponse(status_code=200 if ready else 503, content=content.dict())
+
+
+@api_router.get("/corpora", response_model=CorporaResponse)
+async def corpora_status():
+    """获取各语料的加载状态、内存占用和加载耗时"""
+    return CorporaResponse(
+        corpora=graphrag_corpus_registry.status(), **graphrag_corpus_registry.stats()
+    )
+
+
+@api_router.get("/index", response_model=IndexStatusResponse)
+async def index_status(corpus: Optional[str] = Query(None)):
+    """获取语料的当前索引版本、构建中的新版本和等待释放的旧版本"""
+    return (await graphrag_corpus_registry.aget(corpus)).manager.status()
+
+
+@api_router.post("/index/reload", response_model=IndexReloadResponse, status_code=202)
+async def reload_index(request: IndexReloadRequest = IndexReloadRequest()):
+    """检查语料的输出目录并在后台构建新的索引版本，构建完成后原子切换；force 为 True 时即使快照未变化也重新构建"""
+    manager = (await graphrag_corpus_registry.aget(request.corpus)).manager
+    accepted = manager.request_reload(request.force)
+    return IndexReloadResponse(accepted=accepted, status=manager.status())
+
+
+@api_router.get("/startup", response_model=StartupReport)
+async def startup_report():
+    """获取GraphRAG查询栈的导入耗时报告，查询栈在首次使用或预热时才导入"""
+    return StartupReport(loaded=bool(graphrag_import_report), **graphrag_import_report)
+
+
+@api_router.get("/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats():
+    """获取回答缓存的命中统计"""
+    return CacheStatsResponse(
+        enabled=graphrag_config.ANSWER_CACHE_ENABLED,
+        semantic=SemanticCacheStats(
+            enabled=graphrag_config.SEMANTIC_CACHE_ENABLED,
+            **graphrag_semantic_cache.stats(),
+        ),
+        **graphrag_answer_cache.stats(),
+    )
+
+
+@api_router.get("/pools", response_model=Dict[str, PoolStats])
+async def pool_stats():
+    """获取各搜索模式并发池的当前并发上限、延迟、占用和排队情况"""
+    return graphrag_concurrency_pools.stats()
+
+
+@api_router.get(
+    "/timings", response_model=Dict[str, Dict[str, HistogramSnapshot]]
+)
+async def timing_histograms():
+    """获取各搜索模式请求总耗时、各阶段耗时和token数的直方图（搜索模式 -> 指标 -> 直方图）"""
+    return graphrag_trace_histograms.snapshot()
+
+
 @api_router.get("/tools", response_model=ToolsResponse)
 async def get_tools(tool_service: ToolService = Depends(get_tool_service)):
     """获取支持的工具列表"""
@@ -1,6 +1,7 @@
 from app.config.settings import app_settings, AppSettings
 from app.config.database import sqlite_config, SQLiteConfig
 from app.config.logger import logging_config, LoggingConfig
+from app.config.graphrag_config import graphrag_config, GraphRAGConfig
 
 
 # 导出配置实例和类型
@@ -9,8 +10,10 @@ __all__ = [
     "app_settings",
     "sqlite_config",
     "logging_config",
+    "graphrag_config",
     # 配置类型
     "AppSettings",
     "SQLiteConfig",
     "LoggingConfig",
+    "GraphRAGConfig",
 ]
@@ -1,5 +1,5 @@
-from pydantic_settings import BaseSettings
-from typing import Optional
+from app.config.base import BaseSettings
+from typing import Dict, List, Optional
 
 
 class GraphRAGConfig(BaseSettings):
@@ -11,6 +11,11 @@ class GraphRAGConfig(BaseSettings):
     LANCEDB_URI: str = (
         "design_docs/mcp_rag_agent_graphrag_demo/doupocangqiong/output/lancedb"
     )
+    # 多语料配置：CORPORA_DIR 下每个包含 output 索引目录的子目录是一个语料，CORPORA 可补充或覆盖
+    CORPORA_DIR: str = "design_docs/mcp_rag_agent_graphrag_demo"
+    CORPORA: Dict[str, str] = {}  # 语料名称 -> 索引输出目录
+    DEFAULT_CORPUS: str = "doupocangqiong"  # 请求未指定语料时使用的语料
+    CORPUS_MEMORY_BUDGET: int = 4 * 1024 * 1024 * 1024  # 所有已加载语料的内存预算(4GB)，0表示不限制
     # 社区级别
     COMMUNITY_LEVEL: int = 2
     # API配置
@@ -18,6 +23,40 @@ class GraphRAGConfig(BaseSettings):
     BASE_URL: Optional[str] = None
     MODEL: str = "qwen-turbo"
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    # 引擎预热配置
+    WARMUP_ON_STARTUP: bool = True  # 应用启动时是否在后台预热搜索引擎
+    WARMUP_MODES: List[str] = ["local", "global", "drift"]  # 需要预热的搜索模式
+    ENGINE_BUILD_WORKERS: int = 3  # 构建搜索引擎的线程数
+
+    # 索引热更新配置
+    INDEX_WATCH_INTERVAL: float = 60.0  # 检查输出目录是否有新索引快照的间隔(秒)，0表示只能通过管理接口触发重载
+
+    # 回答缓存配置（按规范化查询、搜索模式和上下文参数精确匹配）
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1024  # 最大缓存条目数
+    ANSWER_CACHE_TTL: int = 3600  # 缓存有效期(秒)
+    ANSWER_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 缓存最大内存占用(64MB)
+
+    # 语义回答缓存配置（按查询向量的余弦相似度匹配历史问题）
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95  # 命中所需的最小余弦相似度
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1024  # 最大缓存条目数
+
+    # 按搜索模式隔离的并发池配置
+    MODE_CONCURRENCY: Dict[str, int] = {"local": 16, "global": 2, "drift": 4}  # 各模式最大并发查询数
+    MODE_QUEUE_SIZE: Dict[str, int] = {"local": 64, "global": 8, "drift": 16}  # 各模式最大排队数
+    GLOBAL_MAP_CONCURRENCY: int = 32  # 单个全局搜索 map 阶段同时请求LLM的最大协程数
+
+    # 自适应准入控制配置（AIMD，按上游延迟在最小并发数和 MODE_CONCURRENCY 之间调整并发上限）
+    ADMISSION_MIN_CONCURRENCY: int = 1  # 各模式并发上限的下限
+    ADMISSION_QUEUE_TIMEOUT: float = 30.0  # 最长排队秒数，超时返回503
+    ADMISSION_LATENCY_TOLERANCE: float = 2.0  # 延迟超过基线延迟的倍数时视为上游拥塞
+    ADMISSION_BACKOFF: float = 0.7  # 上游拥塞时并发上限的缩减系数
+
+    # 批量查询配置
+    BATCH_MAX_QUERIES: int = 100  # 单次批量请求的最大查询数
+    BATCH_CONCURRENCY: int = 8  # 单次批量请求内同时执行的最大查询数
+
+
+# 创建GraphRAG配置实例
+graphrag_config = GraphRAGConfig()
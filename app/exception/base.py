@@ -5,10 +5,12 @@ class BaseAppException(Exception):
         message: str = "服务器内部错误",
         code: int = 500,
         error_details: dict = None,
-        log_level: str = "error"
+        log_level: str = "error",
+        headers: dict = None
     ):
         self.message = message
         self.code = code
         self.error_details = error_details or {}
         self.log_level = log_level
+        self.headers = headers or {}  # 需要随错误响应返回的HTTP头，如Retry-After
         super().__init__(self.message)
@@ -11,6 +11,7 @@ from app.utils.request import get_request_id
 async def custom_exception_handler(request: Request, exc: Exception):
     """全局异常处理器"""
     request_id = get_request_id(request)
+    headers = None
     
     # 1. 处理自定义异常
     if isinstance(exc, BaseAppException):
@@ -21,6 +22,7 @@ async def custom_exception_handler(request: Request, exc: Exception):
             request_id=request_id
         )
         log_level = exc.log_level
+        headers = exc.headers
     
     # 2. 处理FastAPI参数验证异常
     elif isinstance(exc, RequestValidationError):
@@ -44,6 +46,7 @@ async def custom_exception_handler(request: Request, exc: Exception):
             request_id=request_id
         )
         log_level = "warning" if exc.status_code < 500 else "error"
+        headers = getattr(exc, "headers", None)
     
     # 4. 处理数据库异常
     elif isinstance(exc, SQLAlchemyError):
@@ -78,7 +81,8 @@ async def custom_exception_handler(request: Request, exc: Exception):
     # 返回标准化错误响应
     return JSONResponse(
         status_code=error_response.code,
-        content=error_response.dict()
+        content=error_response.dict(),
+        headers=headers or None
     )
 
 
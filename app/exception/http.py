@@ -10,3 +10,29 @@ class ValidationException(BaseAppException):
         log_level: str = "info"
     ):
         super().__init__(message, code, error_details, log_level)
+
+class TooManyRequestsException(BaseAppException):
+    """请求过多异常"""
+    def __init__(
+        self,
+        message: str = "请求过多，请稍后重试",
+        code: int = 429,
+        error_details: dict = None,
+        log_level: str = "warning",
+        retry_after: int = None
+    ):
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        super().__init__(message, code, error_details, log_level, headers)
+
+class ServiceUnavailableException(BaseAppException):
+    """服务暂不可用异常"""
+    def __init__(
+        self,
+        message: str = "服务暂不可用，请稍后重试",
+        code: int = 503,
+        error_details: dict = None,
+        log_level: str = "warning",
+        retry_after: int = None
+    ):
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        super().__init__(message, code, error_details, log_level, headers)
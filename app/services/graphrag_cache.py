@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import json
+import re
+import sys
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本：统一全半角、去除首尾空白、合并连续空白并转为小写"""
+    query = unicodedata.normalize("NFKC", query)
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def make_cache_key(
+    query: str,
+    mode: str,
+    params: Optional[Dict[str, Any]] = None,
+    version: Optional[str] = None,
+) -> str:
+    """根据规范化查询、搜索模式、上下文参数和索引版本生成缓存键"""
+    payload = json.dumps(
+        {
+            "query": normalize_query(query),
+            "mode": mode,
+            "params": params or {},
+            "version": version,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """GraphRAG回答缓存
+
+    按LRU顺序淘汰，条目超过TTL后失效，并限制条目数和总内存占用。
+    相同键的并发请求只会触发一次上游计算（single-flight），其余请求等待同一结果。
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # 键 -> (过期时间, 占用字节数, 值)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """获取缓存值，不存在或已过期时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _, value = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        size = sys.getsizeof(value) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """获取缓存值，未命中时计算并缓存；相同键的并发请求共享一次计算
+
+        发起计算的请求被取消（如客户端断开）时不影响等待同一结果的其他请求，由其中一个等待者重新计算。
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    # 本请求被取消
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 避免无人等待时出现 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            # 空回答通常意味着上游调用失败，不写入缓存
+            if value:
+                self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+class SemanticAnswerCache:
+    """GraphRAG语义回答缓存
+
+    用文本向量模型对查询编码，在内存向量索引中查找相似的历史查询，余弦相似度超过阈值时
+    直接返回历史回答，用于命中措辞不同但语义相同的问题。
+    按LRU顺序淘汰，索引数据版本变化时清空全部条目。
+    """
+
+    def __init__(
+        self,
+        embedder: Any,
+        threshold: float = 0.95,
+        max_entries: int = 1024,
+        version_provider: Optional[Callable[[], str]] = None,
+    ):
+        """初始化语义缓存
+
+        Args:
+            embedder: 文本向量模型，需提供异步的 aembed(text) 方法
+            threshold: 命中所需的最小余弦相似度
+            max_entries: 最大缓存条目数
+            version_provider: 返回当前索引数据版本的函数
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.version_provider = version_provider
+        self._version: Optional[str] = None
+        self._matrix: Optional[np.ndarray] = None
+        # 槽位 -> (命名空间, 回答)，按LRU顺序排列
+        self._slots: "OrderedDict[int, Tuple[str, Any]]" = OrderedDict()
+        self._free_slots: List[int] = list(range(max_entries - 1, -1, -1))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_version(self) -> None:
+        """索引数据版本变化时清空缓存"""
+        version = self.version_provider() if self.version_provider else None
+        if version != self._version:
+            self.clear()
+            self._version = version
+
+    async def embed(self, query: str) -> Optional[np.ndarray]:
+        """对查询编码并归一化，向量模长为0（无法计算相似度）时返回None，跳过语义缓存"""
+        embedding = np.asarray(await self.embedder.aembed(normalize_query(query)), dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if not np.isfinite(norm) or norm == 0:
+            return None
+        return embedding / norm
+
+    def lookup(self, embedding: np.ndarray, namespace: str) -> Optional[Any]:
+        """查找同一命名空间下最相似的历史查询，相似度低于阈值时返回None"""
+        self._check_version()
+        slots = [slot for slot, (ns, _) in self._slots.items() if ns == namespace]
+        if not slots or self._matrix is None or self._matrix.shape[1] != embedding.shape[0]:
+            self.misses += 1
+            return None
+        scores = self._matrix[slots] @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+        slot = slots[best]
+        self._slots.move_to_end(slot)
+        self.hits += 1
+        return self._slots[slot][1]
+
+    def store(self, embedding: np.ndarray, namespace: str, answer: Any) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self._check_version()
+        if self._matrix is None or self._matrix.shape[1] != embedding.shape[0]:
+            self.clear()
+            self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+        if not self._free_slots:
+            slot, _ = self._slots.popitem(last=False)
+            self._free_slots.append(slot)
+            self.evictions += 1
+        slot = self._free_slots.pop()
+        self._matrix[slot] = embedding
+        self._slots[slot] = (namespace, answer)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._slots.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._slots),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "version": self._version,
+        }
@@ -0,0 +1,300 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from app.config.logger import logger
+from app.exception import NotFoundException
+from app.services.graphrag_index import GraphRAGIndex, GraphRAGIndexManager
+
+# 语料输出目录中用于识别GraphRAG索引的表
+CORPUS_MARKER_TABLE = "create_final_nodes.parquet"
+
+
+def discover_corpora(root: str) -> Dict[str, str]:
+    """扫描根目录，每个包含 output/create_final_nodes.parquet 的子目录是一个语料
+
+    Returns:
+        语料名称到索引输出目录的映射
+    """
+    corpora = {}
+    if not os.path.isdir(root):
+        return corpora
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        output_dir = os.path.join(entry.path, "output")
+        if entry.is_dir() and os.path.exists(os.path.join(output_dir, CORPUS_MARKER_TABLE)):
+            corpora[entry.name] = output_dir
+    return corpora
+
+
+class GraphRAGCorpus:
+    """一个已加载到内存的语料"""
+
+    def __init__(
+        self,
+        name: str,
+        manager: GraphRAGIndexManager,
+        size_provider: Optional[Callable[[], int]] = None,
+        release: Optional[Callable[[], None]] = None,
+        mapped_size_provider: Optional[Callable[[], int]] = None,
+    ):
+        """初始化语料
+
+        Args:
+            name: 语料名称
+            manager: 该语料的索引版本管理器
+            size_provider: 返回该语料当前私有内存占用（字节）的函数，用于内存预算
+            release: 淘汰该语料时释放已加载数据的函数
+            mapped_size_provider: 返回该语料内存映射数据大小（字节）的函数，多个进程共享，不计入内存预算
+        """
+        self.name = name
+        self.manager = manager
+        self._size_provider = size_provider
+        self._mapped_size_provider = mapped_size_provider
+        self._release = release
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        # 正在使用该语料的查询数，大于0时不会被淘汰
+        self.inflight = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._size_provider() if self._size_provider else 0
+
+    @property
+    def mapped_bytes(self) -> int:
+        return self._mapped_size_provider() if self._mapped_size_provider else 0
+
+    @property
+    def load_time(self) -> float:
+        """当前索引版本各搜索引擎的构建耗时之和"""
+        engines = self.manager.current.registry.status().values()
+        return sum(engine["build_time"] or 0.0 for engine in engines)
+
+    def release(self) -> None:
+        """关闭搜索引擎并释放已加载的数据"""
+        self.manager.shutdown()
+        if self._release:
+            self._release()
+
+    def status(self) -> Dict[str, Any]:
+        index = self.manager.current
+        return {
+            "name": self.name,
+            "resident": True,
+            "version": index.version,
+            "inflight": self.inflight,
+            "resident_bytes": self.resident_bytes,
+            "mapped_bytes": self.mapped_bytes,
+            "load_time": self.load_time,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "engines": index.registry.status(),
+        }
+
+
+class GraphRAGCorpusRegistry:
+    """GraphRAG多语料注册表
+
+    每个请求指定一个语料，语料的索引在首次使用时加载。所有已加载语料的内存占用之和超过预算时，
+    按最近最少使用的顺序淘汰没有进行中查询的语料，被淘汰的语料下次使用时重新加载。
+    """
+
+    def __init__(
+        self,
+        corpora: Dict[str, str],
+        loader: Callable[[str, str], GraphRAGCorpus],
+        default: Optional[str] = None,
+        memory_budget: int = 0,
+    ):
+        """初始化语料注册表
+
+        Args:
+            corpora: 语料名称到索引输出目录的映射
+            loader: 根据语料名称和输出目录加载语料的函数
+            default: 请求未指定语料时使用的语料，默认为第一个语料
+            memory_budget: 所有已加载语料的内存预算（字节），0表示不限制
+        """
+        self.corpora = dict(corpora)
+        self._loader = loader
+        self.default = default or next(iter(self.corpora), None)
+        self.memory_budget = memory_budget
+        self._lock = threading.RLock()
+        # 已加载的语料，按最近使用顺序排列
+        self._resident: "OrderedDict[str, GraphRAGCorpus]" = OrderedDict()
+        self._watch_interval = 0.0
+        # 语料名称 -> 最近一次看到的索引版本，被淘汰的语料保留原版本
+        self._versions: Dict[str, str] = {}
+        self.evictions = 0
+
+    @classmethod
+    def for_manager(
+        cls, manager: GraphRAGIndexManager, name: str = "default"
+    ) -> "GraphRAGCorpusRegistry":
+        """只包含一个语料的注册表，语料已加载"""
+        corpora = cls({name: ""}, lambda name, data_dir: GraphRAGCorpus(name, manager))
+        corpora._resident[name] = GraphRAGCorpus(name, manager)
+        return corpora
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.corpora)
+
+    def _resolve(self, name: Optional[str]) -> str:
+        name = name or self.default
+        if name not in self.corpora:
+            raise NotFoundException(message=f"Corpus not found: {name}")
+        return name
+
+    def peek(self, name: Optional[str] = None) -> Optional[GraphRAGCorpus]:
+        """获取已加载的语料，未加载时返回None"""
+        return self._resident.get(self._resolve(name))
+
+    def _load(self, name: Optional[str] = None) -> GraphRAGCorpus:
+        """获取语料，未加载时加载，不启动索引快照检查，可以在线程中执行"""
+        name = self._resolve(name)
+        with self._lock:
+            corpus = self._resident.get(name)
+            if corpus is None:
+                logger.info(f"加载GraphRAG语料 {name}: {self.corpora[name]}")
+                corpus = self._loader(name, self.corpora[name])
+                self._resident[name] = corpus
+            self._touch(corpus)
+            return corpus
+
+    def _watch(self, corpus: GraphRAGCorpus) -> None:
+        """在事件循环线程中启动语料的索引快照检查，没有运行中的事件循环时等下次异步获取语料时再启动"""
+        if self._watch_interval <= 0:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        corpus.manager.start_watching(self._watch_interval)
+
+    def get(self, name: Optional[str] = None) -> GraphRAGCorpus:
+        """获取语料，未加载时加载；未知语料抛出 NotFoundException"""
+        corpus = self._load(name)
+        self._watch(corpus)
+        return corpus
+
+    def _touch(self, corpus: GraphRAGCorpus) -> None:
+        """标记语料为最近使用，查询开始和结束时都会更新"""
+        with self._lock:
+            if self._resident.get(corpus.name) is corpus:
+                self._resident.move_to_end(corpus.name)
+            corpus.last_used = time.time()
+
+    async def aget(self, name: Optional[str] = None) -> GraphRAGCorpus:
+        """获取语料，首次加载（可能需要导入GraphRAG查询栈）在线程中执行，不阻塞事件循环"""
+        if self.peek(name) is not None:
+            return self.get(name)
+        corpus = await asyncio.get_running_loop().run_in_executor(None, self._load, name)
+        # 索引快照检查是事件循环中的任务，加载完成后回到事件循环线程启动
+        self._watch(corpus)
+        return corpus
+
+    def manager(self, name: Optional[str] = None) -> GraphRAGIndexManager:
+        """语料的索引版本管理器"""
+        return self.get(name).manager
+
+    async def warm_up(
+        self, modes: Optional[Iterable[str]] = None, name: Optional[str] = None
+    ) -> None:
+        """加载语料并在后台预热其搜索引擎"""
+        corpus = await self.aget(name)
+        corpus.manager.warm_up(modes)
+
+    @asynccontextmanager
+    async def acquire(self, name: Optional[str] = None) -> AsyncIterator[GraphRAGIndex]:
+        """在查询期间固定使用语料的当前索引版本，查询结束后按内存预算淘汰冷语料"""
+        corpus = await self.aget(name)
+        corpus.inflight += 1
+        try:
+            async with corpus.manager.acquire() as index:
+                yield index
+        finally:
+            corpus.inflight -= 1
+            self._touch(corpus)
+            # 搜索引擎在查询中按需构建，查询结束后语料的内存占用才确定
+            self.enforce_budget()
+
+    def enforce_budget(self) -> List[str]:
+        """内存占用超过预算时按LRU顺序淘汰没有进行中查询的语料，返回被淘汰的语料名称"""
+        if self.memory_budget <= 0:
+            return []
+        evicted = []
+        with self._lock:
+            sizes = {name: corpus.resident_bytes for name, corpus in self._resident.items()}
+            total = sum(sizes.values())
+            # 最近使用的语料不淘汰，单个语料超过预算时也保留
+            for name in list(self._resident)[:-1]:
+                if total <= self.memory_budget:
+                    break
+                corpus = self._resident[name]
+                if corpus.inflight > 0:
+                    continue
+                self._versions[name] = corpus.manager.current.version
+                del self._resident[name]
+                total -= sizes[name]
+                evicted.append(corpus)
+            self.evictions += len(evicted)
+        for corpus in evicted:
+            corpus.release()
+            logger.info(
+                f"内存占用超过预算，已淘汰GraphRAG语料 {corpus.name} "
+                f"({sizes[corpus.name] / 1024 / 1024:.1f}MB)"
+            )
+        if total > self.memory_budget:
+            logger.warning(
+                f"GraphRAG语料内存占用 {total / 1024 / 1024:.1f}MB 超过预算 "
+                f"{self.memory_budget / 1024 / 1024:.1f}MB，没有可淘汰的语料"
+            )
+        return [corpus.name for corpus in evicted]
+
+    def version(self) -> str:
+        """所有语料当前索引版本的组合标识，任一语料热更新后变化，语料被淘汰时不变"""
+        with self._lock:
+            for name, corpus in self._resident.items():
+                self._versions[name] = corpus.manager.current.version
+            return ",".join(f"{name}@{self._versions[name]}" for name in sorted(self._versions))
+
+    def start_watching(self, interval: float) -> None:
+        """已加载和之后加载的语料都定期检查新的索引快照，interval 为0时不检查"""
+        self._watch_interval = interval
+        with self._lock:
+            corpora = list(self._resident.values())
+        for corpus in corpora:
+            corpus.manager.start_watching(interval)
+
+    def status(self) -> List[Dict[str, Any]]:
+        """各语料的加载状态、内存占用和加载耗时"""
+        with self._lock:
+            resident = dict(self._resident)
+        return [
+            resident[name].status() if name in resident else {"name": name, "resident": False}
+            for name in self.corpora
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            resident_bytes = sum(corpus.resident_bytes for corpus in self._resident.values())
+            resident = len(self._resident)
+        return {
+            "default": self.default,
+            "memory_budget": self.memory_budget,
+            "resident_bytes": resident_bytes,
+            "resident": resident,
+            "evictions": self.evictions,
+        }
+
+    def shutdown(self) -> None:
+        """释放所有已加载的语料"""
+        with self._lock:
+            corpora = list(self._resident.values())
+            self._resident.clear()
+        for corpus in corpora:
+            corpus.release()
@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from app.config.logger import logger
+from app.services.graphrag_registry import GraphRAGEngineRegistry
+
+
+class GraphRAGIndex:
+    """一个版本的GraphRAG索引及其搜索引擎"""
+
+    def __init__(self, version: str, registry: GraphRAGEngineRegistry):
+        self.version = version
+        self.registry = registry
+        self.created_at = time.time()
+        # 正在使用该版本的查询数
+        self.inflight = 0
+        self.retired = False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "inflight": self.inflight,
+            "created_at": self.created_at,
+        }
+
+
+class GraphRAGIndexManager:
+    """GraphRAG索引版本管理器
+
+    检测到新的索引快照（轮询输出目录或手动触发）后，在后台构建新版本的搜索引擎，
+    全部构建成功后原子地切换为当前版本。切换前开始的查询继续使用旧版本，
+    旧版本在最后一个查询结束后释放。新版本构建失败时继续使用旧版本。
+    """
+
+    def __init__(
+        self,
+        registry_factory: Callable[[], GraphRAGEngineRegistry],
+        version_provider: Callable[[], str],
+        warm_modes: Optional[Iterable[str]] = None,
+    ):
+        """初始化索引管理器
+
+        Args:
+            registry_factory: 创建新版本搜索引擎注册表的函数
+            version_provider: 返回索引输出目录当前快照版本的函数
+            warm_modes: 切换前需要构建完成的搜索模式，默认为全部模式
+        """
+        self._registry_factory = registry_factory
+        self._version_provider = version_provider
+        self._warm_modes = list(warm_modes) if warm_modes is not None else None
+        self._lock = threading.Lock()
+        self._current: Optional[GraphRAGIndex] = None
+        self._retired: List[GraphRAGIndex] = []
+        self._building: Optional[str] = None
+        self._reload_task: Optional[asyncio.Task] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+        self.last_swap_at: Optional[float] = None
+
+    @classmethod
+    def for_registry(cls, registry: GraphRAGEngineRegistry, version: str = "static") -> "GraphRAGIndexManager":
+        """使用固定注册表的索引管理器，不会切换版本"""
+        manager = cls(lambda: registry, lambda: version)
+        manager._current = GraphRAGIndex(version, registry)
+        return manager
+
+    @property
+    def current(self) -> GraphRAGIndex:
+        """当前版本，首次访问时按输出目录的快照创建"""
+        with self._lock:
+            if self._current is None:
+                self._current = GraphRAGIndex(self._version_provider(), self._registry_factory())
+            return self._current
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[GraphRAGIndex]:
+        """在查询期间固定使用当前版本，版本切换不影响进行中的查询"""
+        index = self.current
+        index.inflight += 1
+        try:
+            yield index
+        finally:
+            index.inflight -= 1
+            if index.retired and index.inflight == 0:
+                self._release(index)
+
+    def _release(self, index: GraphRAGIndex) -> None:
+        """释放已退役且没有进行中查询的版本"""
+        with self._lock:
+            if index not in self._retired:
+                return
+            self._retired.remove(index)
+        index.registry.shutdown()
+        logger.info(f"GraphRAG索引版本 {index.version} 已释放")
+
+    def indexes(self) -> List[GraphRAGIndex]:
+        """已创建的版本：当前版本和等待释放的旧版本，不会创建当前版本"""
+        with self._lock:
+            return ([self._current] if self._current else []) + list(self._retired)
+
+    def warm_up(self, modes: Optional[Iterable[str]] = None) -> None:
+        """在后台预热当前版本的搜索引擎"""
+        self.current.registry.warm_up(modes)
+
+    async def reload(self, force: bool = False) -> bool:
+        """检查输出目录，快照版本变化（或 force 为 True）时构建新版本并切换
+
+        Returns:
+            是否切换到了新版本
+        """
+        version = self._version_provider()
+        if not force and version == self.current.version:
+            return False
+        if self._building is not None:
+            logger.info(f"GraphRAG索引版本 {self._building} 正在构建，忽略本次重载")
+            return False
+
+        self._building = version
+        registry = self._registry_factory()
+        modes = self._warm_modes if self._warm_modes is not None else list(registry.modes)
+        logger.info(f"开始构建GraphRAG索引版本 {version}: {modes}")
+        try:
+            await asyncio.gather(*(registry.get_engine(mode) for mode in modes))
+        except Exception as e:
+            registry.shutdown()
+            self.last_error = f"{version}: {e}"
+            logger.error(f"GraphRAG索引版本 {version} 构建失败，继续使用旧版本: {e}")
+            return False
+        finally:
+            self._building = None
+
+        self._swap(GraphRAGIndex(version, registry))
+        return True
+
+    def request_reload(self, force: bool = False) -> bool:
+        """在后台触发重载，已有重载任务在运行时返回False"""
+        if self._reload_task is not None and not self._reload_task.done():
+            return False
+        self._reload_task = asyncio.ensure_future(self.reload(force))
+        return True
+
+    def _swap(self, index: GraphRAGIndex) -> None:
+        with self._lock:
+            old, self._current = self._current, index
+            if old is not None:
+                old.retired = True
+                self._retired.append(old)
+        self.last_error = None
+        self.last_swap_at = time.time()
+        logger.info(f"GraphRAG索引已切换到版本 {index.version}")
+        if old is not None and old.inflight == 0:
+            self._release(old)
+
+    async def _watch(self, interval: float) -> None:
+        """定期检查输出目录，快照版本连续两次检查一致后才重载，避免在索引写入过程中切换"""
+        candidate = None
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                version = self._version_provider()
+                if version != self.current.version and version == candidate:
+                    await self.reload()
+                candidate = version
+            except Exception as e:
+                logger.error(f"检查GraphRAG索引版本失败: {e}")
+
+    def start_watching(self, interval: float) -> None:
+        """开始在后台轮询输出目录，interval 为0时不轮询"""
+        if interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.ensure_future(self._watch(interval))
+
+    def status(self) -> Dict[str, Any]:
+        """当前版本、构建中的版本和等待释放的旧版本"""
+        with self._lock:
+            retired = [index.status() for index in self._retired]
+        return {
+            "current": self.current.status(),
+            "building": self._building,
+            "retired": retired,
+            "last_error": self.last_error,
+            "last_swap_at": self.last_swap_at,
+        }
+
+    def shutdown(self) -> None:
+        """停止轮询并关闭所有版本的构建线程池"""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        with self._lock:
+            indexes = self._retired + ([self._current] if self._current else [])
+        for index in indexes:
+            index.registry.shutdown()
@@ -0,0 +1,210 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from app.exception import ServiceUnavailableException, TooManyRequestsException
+
+
+class SlotOutcome:
+    """名额内上游调用的结果
+
+    graphrag 的搜索引擎吞掉LLM调用的异常并返回空回答，调用方据此把没有抛出异常的调用标记为失败。
+    """
+
+    def __init__(self):
+        self.ok = True
+
+    def fail(self) -> None:
+        self.ok = False
+
+
+class ModeConcurrencyPool:
+    """单个搜索模式的自适应并发池（准入控制）
+
+    最多 limit 个请求同时执行，其余请求按先来先服务排队：
+    排队数达到 queue_size 时直接返回429，排队超过 queue_timeout 秒返回503，均带 Retry-After。
+
+    并发上限按 AIMD 调整：请求延迟在基线延迟的 latency_tolerance 倍以内时每个请求加 1/limit，
+    延迟超出或上游报错时乘以 backoff（每个基线延迟周期最多缩减一次），范围为 [min_limit, max_limit]。
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        limit: int,
+        queue_size: int,
+        min_limit: int = 1,
+        queue_timeout: Optional[float] = None,
+        latency_tolerance: float = 2.0,
+        backoff: float = 0.7,
+    ):
+        self.mode = mode
+        self.max_limit = limit
+        self.min_limit = min(min_limit, limit)
+        self.limit = float(limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # 延迟的指数移动平均和基线（近期最小延迟，缓慢上浮以适应上游的正常变化）
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def retry_after(self) -> int:
+        """按当前排队数、并发上限和平均延迟估算的重试等待秒数"""
+        rounds = (len(self._waiters) + 1) / max(int(self.limit), 1)
+        return max(1, math.ceil(rounds * (self.latency or 1.0)))
+
+    async def acquire(self) -> None:
+        """获取执行名额，排队已满或排队超时时抛出异常"""
+        if self.active < int(self.limit) and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            raise TooManyRequestsException(
+                message=f"{self.mode}搜索排队已满，请稍后重试",
+                error_details={"mode": self.mode, "queue_size": self.queue_size},
+                retry_after=self.retry_after(),
+            )
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # 名额由 _wake 直接转交给排队的请求
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.timeouts += 1
+            raise ServiceUnavailableException(
+                message=f"{self.mode}搜索排队超时，请稍后重试",
+                error_details={"mode": self.mode, "queue_timeout": self.queue_timeout},
+                retry_after=self.retry_after(),
+            )
+        except asyncio.CancelledError:
+            self._discard(waiter)
+            raise
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        """移除放弃排队的请求，名额已转交时归还名额"""
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+        elif waiter in self._waiters:
+            self._waiters.remove(waiter)
+
+    def release(self, latency: Optional[float] = None, ok: bool = True) -> None:
+        """释放执行名额
+
+        Args:
+            latency: 本次请求的耗时(秒)，为None时不参与并发上限调整
+            ok: 上游调用是否成功
+        """
+        self.active -= 1
+        self.completed += 1
+        if latency is not None:
+            self._observe(latency, ok)
+        self._wake()
+
+    def _observe(self, latency: float, ok: bool) -> None:
+        """根据请求延迟和结果调整并发上限
+
+        只有成功的调用更新延迟和基线：连接被拒绝、立即返回5xx等快速失败的耗时不代表上游的正常延迟，
+        计入基线会把基线拉到接近0，之后正常的延迟都被判为拥塞。失败只作为拥塞信号。
+        """
+        if ok:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * 0.01
+        congested = not ok or latency > self.baseline * self.latency_tolerance
+        now = time.monotonic()
+        if congested:
+            if now - self._last_decrease >= (self.baseline or 0.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def _wake(self) -> None:
+        """按当前并发上限把名额转交给排队最久的请求"""
+        while self._waiters and self.active < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.active += 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[SlotOutcome]:
+        """在名额内执行上游调用，按耗时和结果调整并发上限；调用方可以通过 SlotOutcome.fail 标记失败"""
+        await self.acquire()
+        start = time.monotonic()
+        outcome = SlotOutcome()
+        try:
+            yield outcome
+        except asyncio.CancelledError:
+            # 客户端断开不代表上游拥塞，不参与并发上限调整
+            self.release()
+            raise
+        except Exception:
+            self.release(time.monotonic() - start, ok=False)
+            raise
+        else:
+            self.release(time.monotonic() - start, ok=outcome.ok)
+
+    def stats(self) -> Dict[str, Any]:
+        """并发池统计信息"""
+        return {
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "queued": len(self._waiters),
+            "latency": self.latency,
+            "baseline_latency": self.baseline,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+class GraphRAGConcurrencyPools:
+    """按搜索模式隔离的并发池，避免少量昂贵的全局搜索占满LLM连接、饿死廉价的本地搜索"""
+
+    def __init__(self, limits: Dict[str, int], queue_sizes: Dict[str, int], **options: Any):
+        """初始化并发池
+
+        Args:
+            limits: 搜索模式 -> 最大并发数
+            queue_sizes: 搜索模式 -> 最大排队数，未配置的模式不排队
+            options: 传给每个 ModeConcurrencyPool 的自适应参数
+        """
+        self._pools = {
+            mode: ModeConcurrencyPool(mode, limit, queue_sizes.get(mode, 0), **options)
+            for mode, limit in limits.items()
+        }
+
+    def slot(self, mode: str):
+        """获取指定搜索模式的执行名额，未配置并发池的模式不限制"""
+        pool = self._pools.get(mode)
+        if pool is None:
+            return _unlimited()
+        return pool.slot()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各搜索模式的并发池统计信息"""
+        return {mode: pool.stats() for mode, pool in self._pools.items()}
+
+
+@asynccontextmanager
+async def _unlimited() -> AsyncIterator[SlotOutcome]:
+    yield SlotOutcome()
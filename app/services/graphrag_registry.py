@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from app.config.logger import logger
+
+
+def _failed(future: Future) -> bool:
+    """构建任务是否以失败（异常或取消）结束"""
+    return future.cancelled() or future.exception() is not None
+
+
+class GraphRAGEngineRegistry:
+    """GraphRAG搜索引擎注册表
+
+    进程内共享已构建的搜索引擎：每种搜索模式只构建一次，构建过程在后台线程中执行，
+    不会阻塞事件循环。所有请求共享同一个构建结果。
+    """
+
+    def __init__(
+        self,
+        builders: Dict[str, Callable[[], Any]],
+        max_workers: int = 3,
+        dataset: Any = None,
+        release: Optional[Callable[[], None]] = None,
+    ):
+        """初始化注册表
+
+        Args:
+            builders: 搜索模式到引擎构建函数的映射，如 {"local": build_local_search_engine}
+            max_workers: 构建引擎的线程数
+            dataset: 这些搜索引擎共享的索引数据集，用于统计内存占用
+            release: 关闭注册表时释放已加载数据的函数
+        """
+        self._builders = builders
+        self._max_workers = max_workers
+        self.dataset = dataset
+        self._release = release
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self._build_times: Dict[str, float] = {}
+
+    @property
+    def modes(self) -> Iterable[str]:
+        """支持的搜索模式"""
+        return self._builders.keys()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_workers, thread_name_prefix="graphrag-build"
+            )
+        return self._executor
+
+    def _build(self, mode: str) -> Any:
+        """在后台线程中构建指定模式的搜索引擎"""
+        logger.info(f"开始构建GraphRAG {mode} 搜索引擎")
+        start_time = time.perf_counter()
+        try:
+            engine = self._builders[mode]()
+        except Exception:
+            logger.exception(f"GraphRAG {mode} 搜索引擎构建失败")
+            raise
+        self._build_times[mode] = time.perf_counter() - start_time
+        logger.info(
+            f"GraphRAG {mode} 搜索引擎构建完成，耗时 {self._build_times[mode]:.2f}s"
+        )
+        return engine
+
+    def _submit(self, mode: str) -> Future:
+        """提交构建任务，同一模式同一时间只会有一个构建任务"""
+        if mode not in self._builders:
+            raise ValueError(f"Unsupported search mode: {mode}")
+        with self._lock:
+            future = self._futures.get(mode)
+            # 构建失败的引擎在下次请求时重新构建
+            if future is None or (future.done() and _failed(future)):
+                future = self._get_executor().submit(self._build, mode)
+                self._futures[mode] = future
+            return future
+
+    def warm_up(self, modes: Optional[Iterable[str]] = None) -> None:
+        """在后台预热搜索引擎，立即返回"""
+        for mode in modes or self.modes:
+            self._submit(mode)
+
+    async def get_engine(self, mode: str) -> Any:
+        """获取指定模式的搜索引擎，引擎尚未构建时等待共享的构建任务完成"""
+        return await asyncio.wrap_future(self._submit(mode))
+
+    def peek(self, mode: str) -> Optional[Any]:
+        """获取已构建完成的搜索引擎，未就绪时返回None"""
+        future = self._futures.get(mode)
+        if future is None or not future.done() or _failed(future):
+            return None
+        return future.result()
+
+    def is_ready(self, modes: Optional[Iterable[str]] = None) -> bool:
+        """指定模式的搜索引擎是否全部就绪"""
+        return all(self.peek(mode) is not None for mode in modes or self.modes)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """获取各搜索引擎的构建状态"""
+        result = {}
+        for mode in self.modes:
+            future = self._futures.get(mode)
+            if future is None:
+                state, error = "pending", None
+            elif not future.done():
+                state, error = "building", None
+            elif future.cancelled():
+                state, error = "failed", "cancelled"
+            elif future.exception() is not None:
+                state, error = "failed", str(future.exception())
+            else:
+                state, error = "ready", None
+            result[mode] = {
+                "state": state,
+                "build_time": self._build_times.get(mode),
+                "error": error,
+            }
+        return result
+
+    def shutdown(self) -> None:
+        """关闭构建线程池并释放已加载的数据"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._release is not None:
+            self._release()
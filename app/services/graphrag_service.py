@@ -1,6 +1,42 @@
-from typing import List, Dict, Any
+from types import ModuleType
+from typing import TYPE_CHECKING, AsyncGenerator, List, Dict, Any, Optional, Tuple, Union
+import asyncio
+import functools
+import json
+import math
 import os
 import sys
+import threading
+import time
+
+from app.config.graphrag_config import graphrag_config
+from app.config.logger import logger
+from app.exception import ServiceUnavailableException
+from app.services.graphrag_cache import (
+    AnswerCache,
+    SemanticAnswerCache,
+    make_cache_key,
+)
+from app.services.graphrag_corpus import (
+    GraphRAGCorpus,
+    GraphRAGCorpusRegistry,
+    discover_corpora,
+)
+from app.services.graphrag_index import GraphRAGIndexManager
+from app.services.graphrag_pool import GraphRAGConcurrencyPools
+from app.services.graphrag_registry import GraphRAGEngineRegistry
+from app.services.graphrag_trace import (
+    GraphRAGTrace,
+    GraphRAGTraceHistograms,
+    instrument_engine,
+    log_trace,
+    stage,
+    trace_async_iter,
+)
+from app.utils.import_timer import ImportTimer
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # 获取当前文件的绝对路径
 current_file_path = os.path.abspath(__file__)
@@ -10,68 +46,588 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(current_file_path
 graphrag_server_path = os.path.join(
     project_root, "design_docs", "mcp_rag_agent_graphrag_demo"
 )
-# 添加到Python路径
-sys.path.insert(0, graphrag_server_path)
-
-# 打印路径信息，用于调试
-print(f"Project root: {project_root}")
-print(f"GraphRAG server path: {graphrag_server_path}")
-print(f"Python path: {sys.path[:3]}")
-
-# 从graphrag_server.py导入核心功能
-try:
-    from graphrag_server import (
-        build_local_search_engine,
-        build_global_search_engine,
-        build_drift_search_engine,
+
+# GraphRAG查询栈（graphrag_server 及 pandas、tiktoken、graphrag 等依赖）在首次使用或预热时才导入，
+# 导入本模块没有副作用，不使用GraphRAG的进程和测试不承担导入开销
+_graphrag_server: Optional[ModuleType] = None
+_graphrag_server_lock = threading.Lock()
+# GraphRAG查询栈的导入耗时报告
+graphrag_import_report: Dict[str, Any] = {}
+
+
+def load_graphrag_server() -> ModuleType:
+    """导入GraphRAG查询栈，只在首次调用时执行，并记录各模块的导入耗时"""
+    global _graphrag_server
+    with _graphrag_server_lock:
+        if _graphrag_server is None:
+            if graphrag_server_path not in sys.path:
+                sys.path.insert(0, graphrag_server_path)
+            with ImportTimer() as timer:
+                module = __import__("graphrag_server")
+            graphrag_import_report.update(timer.report())
+            packages = ", ".join(
+                f"{name} {seconds:.2f}s"
+                for name, seconds in list(graphrag_import_report["packages"].items())[:5]
+            )
+            logger.info(f"GraphRAG查询栈导入完成，耗时 {timer.total:.2f}s: {packages}")
+            _graphrag_server = module
+        return _graphrag_server
+
+
+async def aload_graphrag_server() -> ModuleType:
+    """在线程中导入GraphRAG查询栈，不阻塞事件循环"""
+    if _graphrag_server is not None:
+        return _graphrag_server
+    return await asyncio.get_running_loop().run_in_executor(None, load_graphrag_server)
+
+
+class LazyTextEmbedder:
+    """GraphRAG共享文本向量模型的代理，首次使用时才导入GraphRAG查询栈"""
+
+    async def aembed(self, text: str, **kwargs: Any) -> List[float]:
+        server = await aload_graphrag_server()
+        return await server.text_embedder.aembed(text, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(load_graphrag_server().text_embedder, name)
+
+
+def _build_instrumented(dataset: Any, builder: Any) -> Any:
+    """固定索引版本的数据集快照后构建搜索引擎，并替换其组件为计时代理"""
+    dataset.pin()
+    return instrument_engine(builder())
+
+
+def create_engine_registry(dataset: Any) -> GraphRAGEngineRegistry:
+    """创建语料一个索引版本的搜索引擎注册表
+
+    首次构建搜索引擎时固定该版本的数据集，切换到新版本后旧版本按需构建的搜索引擎仍然读取旧版本的数据；
+    注册表关闭（版本释放或语料淘汰）时清空数据集，并丢弃构建时按该数据集常驻的 token 编码缓存。
+    """
+    server = load_graphrag_server()
+    builders = {
+        "local": functools.partial(server.build_local_search_engine, dataset=dataset),
+        "global": functools.partial(
+            server.build_global_search_engine,
+            concurrent_coroutines=graphrag_config.GLOBAL_MAP_CONCURRENCY,
+            dataset=dataset,
+        ),
+        "drift": functools.partial(server.build_drift_search_engine, dataset=dataset),
+    }
+    return GraphRAGEngineRegistry(
+        builders={
+            mode: functools.partial(_build_instrumented, dataset, builder)
+            for mode, builder in builders.items()
+        },
+        max_workers=graphrag_config.ENGINE_BUILD_WORKERS,
+        dataset=dataset,
+        release=functools.partial(server.release_dataset, dataset),
     )
 
-    print("Successfully imported from graphrag_server")
-except ModuleNotFoundError as e:
-    print(f"Error importing from graphrag_server: {e}")
-    # 尝试另一种导入方式
-    import importlib.util
 
-    spec = importlib.util.spec_from_file_location(
-        "graphrag_server", os.path.join(graphrag_server_path, "graphrag_server.py")
+def upstream_unavailable(mode: str, retry_after: float) -> ServiceUnavailableException:
+    return ServiceUnavailableException(
+        message=f"{mode}搜索的上游LLM服务暂不可用（所有端点已熔断），请稍后重试",
+        error_details={"mode": mode, "reason": "circuit_open"},
+        retry_after=max(1, math.ceil(retry_after)),
     )
-    graphrag_server = importlib.util.module_from_spec(spec)
-    sys.modules["graphrag_server"] = graphrag_server
-    spec.loader.exec_module(graphrag_server)
 
-    # 从动态导入的模块中获取函数
-    build_local_search_engine = graphrag_server.build_local_search_engine
-    build_global_search_engine = graphrag_server.build_global_search_engine
-    build_drift_search_engine = graphrag_server.build_drift_search_engine
-    print("Successfully imported using dynamic import")
+
+def context_params(engine: Any, profile: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """搜索引擎在指定档位下的上下文参数，用于构建上下文和区分缓存"""
+    resolve = getattr(engine, "context_params_for", None)
+    if resolve is not None:
+        return resolve(profile)
+    return getattr(engine, "context_builder_params", None)
+
+
+def search_options(engine: Any, profile: Optional[str]) -> Dict[str, Any]:
+    """只有支持档位的搜索引擎（全局搜索）才传入 profile"""
+    if profile is None or not hasattr(engine, "context_params_for"):
+        return {}
+    return {"profile": profile}
+
+
+def check_upstream(engine: Any, mode: str) -> None:
+    """上游LLM的所有端点都已熔断时立即失败，不占用并发池名额、不构建上下文"""
+    retry_after = getattr(getattr(engine, "llm", None), "retry_after", None)
+    seconds = retry_after() if callable(retry_after) else None
+    if seconds is not None:
+        raise upstream_unavailable(mode, seconds)
+
+
+def version_datasets(manager: GraphRAGIndexManager) -> List[Any]:
+    """语料各个已创建索引版本的数据集"""
+    return [
+        index.registry.dataset
+        for index in manager.indexes()
+        if getattr(index.registry, "dataset", None) is not None
+    ]
+
+
+def load_corpus(name: str, data_dir: str) -> GraphRAGCorpus:
+    """加载语料：创建索引版本管理器，搜索引擎在首次使用时构建，新索引快照在后台构建后原子切换
+
+    每个索引版本使用各自的数据集，内存占用按所有未释放版本的数据集统计。
+    """
+    dataset_class = load_graphrag_server().GraphRAGDataset
+    manager = GraphRAGIndexManager(
+        registry_factory=lambda: create_engine_registry(dataset_class(data_dir)),
+        # 只读取输出目录的文件状态，不加载数据
+        version_provider=dataset_class(data_dir).snapshot_version,
+        warm_modes=graphrag_config.WARMUP_MODES,
+    )
+    return GraphRAGCorpus(
+        name,
+        manager,
+        size_provider=lambda: sum(dataset.memory_usage() for dataset in version_datasets(manager)),
+        mapped_size_provider=lambda: sum(dataset.mapped_bytes() for dataset in version_datasets(manager)),
+    )
+
+
+def configured_corpora() -> Dict[str, str]:
+    """配置的语料：CORPORA_DIR 下自动发现的语料，加上 CORPORA 中显式配置的语料"""
+    corpora = discover_corpora(os.path.join(project_root, graphrag_config.CORPORA_DIR))
+    for name, data_dir in graphrag_config.CORPORA.items():
+        corpora[name] = os.path.join(project_root, data_dir)
+    return corpora
+
+
+# 进程内共享的语料注册表，按请求指定的语料加载索引，所有请求复用已加载语料的搜索引擎
+graphrag_corpus_registry = GraphRAGCorpusRegistry(
+    corpora=configured_corpora(),
+    loader=load_corpus,
+    default=graphrag_config.DEFAULT_CORPUS,
+    memory_budget=graphrag_config.CORPUS_MEMORY_BUDGET,
+)
+
+# 进程内共享的按搜索模式隔离的自适应并发池
+graphrag_concurrency_pools = GraphRAGConcurrencyPools(
+    limits=graphrag_config.MODE_CONCURRENCY,
+    queue_sizes=graphrag_config.MODE_QUEUE_SIZE,
+    min_limit=graphrag_config.ADMISSION_MIN_CONCURRENCY,
+    queue_timeout=graphrag_config.ADMISSION_QUEUE_TIMEOUT,
+    latency_tolerance=graphrag_config.ADMISSION_LATENCY_TOLERANCE,
+    backoff=graphrag_config.ADMISSION_BACKOFF,
+)
+
+# 进程内共享的回答缓存
+graphrag_answer_cache = AnswerCache(
+    max_entries=graphrag_config.ANSWER_CACHE_MAX_ENTRIES,
+    ttl=graphrag_config.ANSWER_CACHE_TTL,
+    max_bytes=graphrag_config.ANSWER_CACHE_MAX_BYTES,
+)
+
+# 进程内共享的语义回答缓存，命名空间按语料和索引版本区分，任一语料热更新后清空全部条目
+graphrag_semantic_cache = SemanticAnswerCache(
+    embedder=LazyTextEmbedder(),
+    threshold=graphrag_config.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=graphrag_config.SEMANTIC_CACHE_MAX_ENTRIES,
+    version_provider=graphrag_corpus_registry.version,
+)
+
+
+# 进程内共享的各搜索模式请求耗时分解直方图
+graphrag_trace_histograms = GraphRAGTraceHistograms()
+
+
+# 支持流式输出的搜索模式（DRIFT搜索没有流式接口）
+STREAMING_MODES = ("local", "global")
+
+# 构建上下文时需要对查询文本向量化的搜索模式
+EMBEDDING_MODES = ("local", "drift")
+
+# 支持只检索上下文的搜索模式（DRIFT搜索构建上下文时需要调用LLM）
+CONTEXT_MODES = ("local", "global")
+
+# 流式搜索的上游输出结束标记
+_STREAM_END = object()
+
+
+def serialize_context_data(
+    context_data: Union[str, List["pd.DataFrame"], Dict[str, "pd.DataFrame"]],
+) -> Union[str, List[Any], Dict[str, Any]]:
+    """将搜索结果中的上下文数据（DataFrame）转换为可JSON序列化的记录列表"""
+    # 上下文数据来自已构建的搜索引擎，此时pandas已随GraphRAG查询栈导入
+    import pandas as pd
+
+    if isinstance(context_data, pd.DataFrame):
+        return context_data.to_dict(orient="records")
+    if isinstance(context_data, dict):
+        return {key: serialize_context_data(value) for key, value in context_data.items()}
+    if isinstance(context_data, list):
+        return [serialize_context_data(value) for value in context_data]
+    return context_data
 
 
 class GraphRAGService:
     """GraphRAG服务类，封装核心搜索功能"""
 
-    def __init__(self):
-        """初始化GraphRAG服务"""
-        self.local_search_engine = None
-        self.global_search_engine = None
-        self.drift_search_engine = None
+    def __init__(
+        self,
+        registry: GraphRAGEngineRegistry = None,
+        index_manager: GraphRAGIndexManager = None,
+        corpora: GraphRAGCorpusRegistry = None,
+        answer_cache: AnswerCache = None,
+        semantic_cache: SemanticAnswerCache = None,
+        embedder: Any = None,
+        pools: GraphRAGConcurrencyPools = None,
+        histograms: GraphRAGTraceHistograms = None,
+    ):
+        """初始化GraphRAG服务
+
+        Args:
+            registry: 固定的搜索引擎注册表，不参与索引热更新
+            index_manager: 固定的索引版本管理器，作为唯一的语料
+            corpora: 语料注册表，未指定 registry 和 index_manager 时默认使用进程内共享的注册表
+            answer_cache: 回答缓存，默认在开启缓存时使用进程内共享的缓存
+            semantic_cache: 语义回答缓存，默认在开启语义缓存时使用进程内共享的缓存
+            embedder: 带缓存的文本向量模型，批量查询时用于预取查询向量，默认使用搜索引擎共享的向量模型
+            pools: 按搜索模式隔离的并发池，默认使用进程内共享的并发池
+            histograms: 请求耗时分解的直方图，默认使用进程内共享的直方图
+        """
+        if registry is not None:
+            index_manager = GraphRAGIndexManager.for_registry(registry)
+        if index_manager is not None:
+            corpora = GraphRAGCorpusRegistry.for_manager(index_manager)
+        self.corpora = corpora or graphrag_corpus_registry
+        self.embedder = embedder if embedder is not None else LazyTextEmbedder()
+        self.pools = pools or graphrag_concurrency_pools
+        self.histograms = histograms or graphrag_trace_histograms
+        if answer_cache is None and graphrag_config.ANSWER_CACHE_ENABLED:
+            answer_cache = graphrag_answer_cache
+        self.answer_cache = answer_cache
+        if semantic_cache is None and graphrag_config.SEMANTIC_CACHE_ENABLED:
+            semantic_cache = graphrag_semantic_cache
+        self.semantic_cache = semantic_cache
+
+    @property
+    def index_manager(self) -> Optional[GraphRAGIndexManager]:
+        """已加载的默认语料的索引版本管理器，默认语料未加载时返回None，不触发加载"""
+        corpus = self.corpora.peek()
+        return corpus.manager if corpus is not None else None
+
+    @property
+    def registry(self) -> Optional[GraphRAGEngineRegistry]:
+        """已加载的默认语料当前索引版本的搜索引擎注册表，默认语料未加载时返回None"""
+        manager = self.index_manager
+        return manager.current.registry if manager is not None else None
+
+    def _peek_engine(self, mode: str):
+        registry = self.registry
+        return registry.peek(mode) if registry is not None else None
+
+    @property
+    def local_search_engine(self):
+        """已就绪的本地搜索引擎"""
+        return self._peek_engine("local")
+
+    @property
+    def global_search_engine(self):
+        """已就绪的全局搜索引擎"""
+        return self._peek_engine("global")
+
+    @property
+    def drift_search_engine(self):
+        """已就绪的DRIFT搜索引擎"""
+        return self._peek_engine("drift")
+
+    async def search(
+        self,
+        query: str,
+        mode: str = "local",
+        corpus: Optional[str] = None,
+        trace: Optional[GraphRAGTrace] = None,
+        profile: Optional[str] = None,
+    ) -> str:
+        """在指定语料（默认语料）中按搜索模式执行搜索，相同查询优先从回答缓存返回
+
+        查询开始时固定使用语料的当前索引版本，期间发生的版本切换不影响本次查询。
+        各阶段耗时和token数记录到 trace（未指定时新建），结束后写入日志和直方图。
+        profile 为全局搜索的社区报告档位（quality/fast/auto），未指定时使用搜索引擎的默认档位，其他搜索模式忽略。
+        """
+        corpus = corpus or self.corpora.default
+        trace = trace or GraphRAGTrace(mode)
+        trace.corpus = corpus
+        try:
+            with trace.activate():
+                async with self.corpora.acquire(corpus) as index:
+                    return await self._search(
+                        index, query, mode, f"{corpus}@{index.version}", trace, profile
+                    )
+        except Exception as e:
+            trace.error = str(e)
+            raise
+        finally:
+            self._finish_trace(trace)
+
+    def _finish_trace(self, trace: GraphRAGTrace) -> None:
+        trace.finish()
+        self.histograms.observe(trace)
+        log_trace(trace)
+
+    async def _engine(self, index, mode: str, trace: GraphRAGTrace):
+        """获取搜索引擎，冷启动时等待构建的时间计入 engine"""
+        start = time.perf_counter()
+        engine = await index.registry.get_engine(mode)
+        trace.add("engine", time.perf_counter() - start)
+        return engine
+
+    async def _asearch(
+        self, engine, query: str, mode: str, trace: GraphRAGTrace, profile: Optional[str] = None
+    ):
+        """在并发池名额内执行搜索，排队时间计入 queue"""
+        check_upstream(engine, mode)
+        start = time.perf_counter()
+        async with self.pools.slot(mode) as outcome:
+            trace.add("queue", time.perf_counter() - start)
+            result = await engine.asearch(query, **search_options(engine, profile))
+            # 空回答通常意味着上游调用失败，按失败调整并发上限
+            if not result.response:
+                outcome.fail()
+        # 搜索引擎吞掉了LLM调用的异常，上游熔断导致的空回答不返回也不缓存
+        if trace.upstream_retry_after is not None:
+            raise upstream_unavailable(mode, trace.upstream_retry_after)
+        return result
+
+    async def _search(
+        self, index, query: str, mode: str, version: str, trace: GraphRAGTrace, profile: Optional[str]
+    ) -> str:
+        engine = await self._engine(index, mode, trace)
+        params = context_params(engine, profile)
+        # 语义缓存只在相同语料、索引版本、搜索模式和上下文参数的查询之间匹配
+        namespace = make_cache_key("", mode, params, version)
+        trace.cache = "answer"
+
+        async def compute() -> str:
+            trace.cache = None
+            # 命中缓存的请求不占用并发池名额
+            if self.semantic_cache is None:
+                result = await self._asearch(engine, query, mode, trace, profile)
+                return result.response
+            return await self._semantic_search(engine, query, namespace, mode, trace, profile)
+
+        if self.answer_cache is None:
+            return await compute()
+        key = make_cache_key(query, mode, params, version)
+        return await self.answer_cache.get_or_compute(key, compute)
+
+    async def _semantic_search(
+        self,
+        engine,
+        query: str,
+        namespace: str,
+        mode: str,
+        trace: GraphRAGTrace,
+        profile: Optional[str] = None,
+    ) -> str:
+        """先查语义缓存，未命中时执行搜索并写入语义缓存"""
+        try:
+            with stage("embed"):
+                embedding = await self.semantic_cache.embed(query)
+        except Exception as e:
+            # 向量模型不可用时跳过语义缓存，不影响正常搜索
+            logger.warning(f"语义缓存查询向量化失败，跳过语义缓存: {e}")
+            embedding = None
+        if embedding is not None:
+            answer = self.semantic_cache.lookup(embedding, namespace)
+            if answer is not None:
+                trace.cache = "semantic"
+                return answer
+        result = await self._asearch(engine, query, mode, trace, profile)
+        if embedding is not None and result.response:
+            self.semantic_cache.store(embedding, namespace, result.response)
+        return result.response
+
+    async def build_context(
+        self,
+        query: str,
+        mode: str = "local",
+        corpus: Optional[str] = None,
+        profile: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """只执行搜索引擎的上下文构建，不调用LLM
+
+        复用已构建的搜索引擎及其上下文参数（全局搜索按 profile 选择报告全文或摘要），
+        返回检索到的上下文文本、结构化的上下文数据和token数。相同查询优先从回答缓存返回。
+        """
+        if mode not in CONTEXT_MODES:
+            raise ValueError(f"Context retrieval is not supported for search mode: {mode}")
+        corpus = corpus or self.corpora.default
+        async with self.corpora.acquire(corpus) as index:
+            version = f"{corpus}@{index.version}"
+            engine = await index.registry.get_engine(mode)
+            params = context_params(engine, profile) or {}
+
+            async def compute() -> str:
+                result = await self._build_context(engine, query, mode, params)
+                # 以JSON字符串缓存，回答缓存按字符串长度统计内存占用
+                return json.dumps(
+                    {"version": version, **result}, ensure_ascii=False, default=str
+                )
+
+            if self.answer_cache is None:
+                return json.loads(await compute())
+            key = make_cache_key(query, f"{mode}:context", params, version)
+            return json.loads(await self.answer_cache.get_or_compute(key, compute))
+
+    async def _build_context(
+        self, engine, query: str, mode: str, params: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        if mode == "global":
+            result = await engine.context_builder.build_context(query, **params)
+        else:
+            # 本地搜索的上下文构建是同步的：先异步预取查询向量（写入向量缓存），再在线程中构建，不阻塞事件循环
+            await self.prefetch_embeddings([query])
+            result = await asyncio.get_running_loop().run_in_executor(
+                None,
+                functools.partial(engine.context_builder.build_context, query, **params),
+            )
+        chunks = result.context_chunks
+        chunk_list = [chunks] if isinstance(chunks, str) else list(chunks)
+        token_encoder = engine.token_encoder
+        count = getattr(token_encoder, "count", None) or (
+            lambda text: len(token_encoder.encode(text))
+        )
+        chunk_tokens = [count(chunk) for chunk in chunk_list]
+        return {
+            "context_text": chunks,
+            "context_data": serialize_context_data(result.context_records),
+            "context_tokens": sum(chunk_tokens),
+            "chunk_tokens": chunk_tokens,
+            "record_counts": {
+                name: len(records) for name, records in result.context_records.items()
+            },
+        }
 
     async def local_search(self, query: str) -> str:
         """本地搜索接口"""
-        if not self.local_search_engine:
-            self.local_search_engine = build_local_search_engine()
-        result = await self.local_search_engine.asearch(query)
-        return result.response
+        return await self.search(query, "local")
 
     async def global_search(self, query: str) -> str:
         """全局搜索接口"""
-        if not self.global_search_engine:
-            self.global_search_engine = build_global_search_engine()
-        result = await self.global_search_engine.asearch(query)
-        return result.response
+        return await self.search(query, "global")
 
     async def drift_search(self, query: str) -> str:
         """DRIFT搜索接口"""
-        if not self.drift_search_engine:
-            self.drift_search_engine = build_drift_search_engine()
-        result = await self.drift_search_engine.asearch(query)
-        return result.response
+        return await self.search(query, "drift")
+
+    async def prefetch_embeddings(self, queries: List[str]) -> None:
+        """去重后并发预取查询向量，写入向量缓存
+
+        搜索引擎构建上下文时同步调用向量模型，会阻塞事件循环；预取后这些调用直接命中缓存。
+        预取失败不影响搜索，搜索时会重新请求向量接口。
+        """
+        distinct = list(dict.fromkeys(queries))
+        results = await asyncio.gather(
+            *(self.embedder.aembed(query) for query in distinct), return_exceptions=True
+        )
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures:
+            logger.warning(f"批量预取查询向量失败 {len(failures)}/{len(distinct)}: {failures[0]}")
+
+    async def batch_search(
+        self,
+        queries: List[Tuple[str, str]],
+        concurrency: int = 8,
+        corpus: Optional[str] = None,
+        request_id: str = "",
+    ) -> AsyncGenerator[Tuple[int, Optional[str], Optional[str]], None]:
+        """批量搜索接口
+
+        在并发上限内同时在指定语料中执行多个 (查询, 搜索模式)，每完成一个产出一次 (序号, 回答, 错误信息)，
+        单个查询失败不影响其他查询。每个查询的耗时分解以 "请求ID#序号" 记录。
+        """
+        await self.prefetch_embeddings(
+            [query for query, mode in queries if mode in EMBEDDING_MODES]
+        )
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(index: int, query: str, mode: str):
+            async with semaphore:
+                trace = GraphRAGTrace(mode, request_id=f"{request_id}#{index}")
+                try:
+                    return index, await self.search(query, mode, corpus, trace), None
+                except Exception as e:
+                    logger.warning(f"批量查询第{index}条失败: {e}")
+                    return index, None, str(e)
+
+        tasks = [
+            asyncio.ensure_future(run(index, query, mode))
+            for index, (query, mode) in enumerate(queries)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 客户端断开时取消尚未完成的查询
+            for task in tasks:
+                task.cancel()
+
+    async def _stream_upstream(
+        self, engine, query: str, mode: str, trace: GraphRAGTrace, chunks: asyncio.Queue
+    ) -> None:
+        """在并发池名额内把搜索引擎的流式输出放入队列，结束时放入 _STREAM_END"""
+        start = time.perf_counter()
+        try:
+            async with self.pools.slot(mode) as outcome:
+                trace.add("queue", time.perf_counter() - start)
+                answered = False
+                async for chunk in trace_async_iter(trace, engine.astream_search(query)):
+                    answered = answered or (isinstance(chunk, str) and bool(chunk))
+                    chunks.put_nowait(chunk)
+                # 没有回答片段通常意味着上游调用失败，按失败调整并发上限
+                if not answered:
+                    outcome.fail()
+        finally:
+            chunks.put_nowait(_STREAM_END)
+
+    async def stream_search(
+        self,
+        query: str,
+        mode: str = "local",
+        corpus: Optional[str] = None,
+        trace: Optional[GraphRAGTrace] = None,
+    ) -> AsyncGenerator:
+        """流式搜索接口
+
+        依次产出LLM生成的文本片段(str)，最后产出一次上下文数据(dict)。
+        各阶段耗时和首个回答片段的耗时记录到 trace，流结束（或客户端断开）后写入日志和直方图。
+        """
+        if mode not in STREAMING_MODES:
+            raise ValueError(f"Streaming is not supported for search mode: {mode}")
+        corpus = corpus or self.corpora.default
+        trace = trace or GraphRAGTrace(mode)
+        trace.corpus = corpus
+        try:
+            async with self.corpora.acquire(corpus) as index:
+                engine = await self._engine(index, mode, trace)
+                check_upstream(engine, mode)
+                # 上游生成在单独的任务中进行，生成结束即释放并发池名额，客户端读取慢不占用名额、不计入延迟
+                chunks: asyncio.Queue = asyncio.Queue()
+                producer = asyncio.ensure_future(
+                    self._stream_upstream(engine, query, mode, trace, chunks)
+                )
+                context_data = {}
+                try:
+                    # 搜索引擎先产出上下文数据，再逐段产出回答；这里把上下文数据留到最后，尽早输出首个token
+                    while True:
+                        chunk = await chunks.get()
+                        if chunk is _STREAM_END:
+                            break
+                        if isinstance(chunk, str):
+                            trace.mark_first_token()
+                            yield chunk
+                        else:
+                            context_data = chunk
+                    # 上游的异常在这里抛出
+                    await producer
+                finally:
+                    # 客户端断开时停止上游生成
+                    producer.cancel()
+            yield serialize_context_data(context_data)
+        except Exception as e:
+            trace.error = str(e)
+            raise
+        finally:
+            self._finish_trace(trace)
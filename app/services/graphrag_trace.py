@@ -0,0 +1,420 @@
+import inspect
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config.logger import logger
+
+# 请求耗时分解中的阶段，均为各阶段自身的耗时（不含嵌套在其中的其他阶段），并发执行的调用累加
+#   engine: 等待搜索引擎构建（冷启动）
+#   queue: 在搜索模式并发池中排队
+#   embed: 查询文本向量化（含向量缓存命中）
+#   retrieve: 向量库检索
+#   build_context: 上下文构建中除向量化、检索和LLM调用以外的部分
+#   llm_ttft: LLM调用从发出请求到收到首个token
+#   llm_completion: LLM调用从首个token到生成结束
+STAGES = ("engine", "queue", "embed", "retrieve", "build_context", "llm_ttft", "llm_completion")
+
+# 延迟直方图的桶上界(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# token数直方图的桶上界
+TOKEN_BUCKETS = (100, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+
+class _Frame:
+    """正在计时的阶段，累计嵌套在其中的阶段耗时，用于计算自身耗时"""
+
+    __slots__ = ("children",)
+
+    def __init__(self):
+        self.children = 0.0
+
+
+# 当前请求的耗时记录，每个请求（及其派生的任务）独立
+_current_trace: ContextVar[Optional["GraphRAGTrace"]] = ContextVar("graphrag_trace", default=None)
+_current_frame: ContextVar[Optional[_Frame]] = ContextVar("graphrag_trace_frame", default=None)
+
+
+class GraphRAGTrace:
+    """单个GraphRAG请求的耗时分解和token数"""
+
+    def __init__(self, mode: str, request_id: str = "", corpus: Optional[str] = None):
+        self.mode = mode
+        self.request_id = request_id
+        self.corpus = corpus
+        self.stages: Dict[str, float] = {}
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # 失败的LLM调用数；graphrag 的搜索引擎会吞掉LLM调用的异常，返回空回答
+        self.llm_errors = 0
+        # LLM调用因上游所有端点熔断而失败时，距离上游放行探测请求的秒数
+        self.upstream_retry_after: Optional[float] = None
+        # 流式请求从开始到产出首个回答片段的耗时
+        self.first_token: Optional[float] = None
+        # 命中的缓存："answer" 或 "semantic"
+        self.cache: Optional[str] = None
+        self.error: Optional[str] = None
+        self.total: Optional[float] = None
+        self._start = time.perf_counter()
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def mark_first_token(self) -> None:
+        if self.first_token is None:
+            self.first_token = self.elapsed()
+
+    @contextmanager
+    def activate(self) -> Iterator["GraphRAGTrace"]:
+        """在上下文中把搜索引擎各组件的耗时记录到本请求"""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def finish(self) -> None:
+        if self.total is None:
+            self.total = self.elapsed()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "mode": self.mode,
+            "corpus": self.corpus,
+            "total": self.total if self.total is not None else self.elapsed(),
+            "first_token": self.first_token,
+            "stages": {stage: self.stages[stage] for stage in STAGES if stage in self.stages},
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_errors": self.llm_errors,
+            "cache": self.cache,
+            "error": self.error,
+        }
+
+    def summary(self) -> str:
+        """一行日志摘要"""
+        parts = [f"mode={self.mode}", f"corpus={self.corpus}", f"total={(self.total or 0.0) * 1000:.0f}ms"]
+        if self.first_token is not None:
+            parts.append(f"first_token={self.first_token * 1000:.0f}ms")
+        if self.cache:
+            parts.append(f"cache={self.cache}")
+        parts.extend(
+            f"{stage}={self.stages[stage] * 1000:.0f}ms" for stage in STAGES if stage in self.stages
+        )
+        parts.append(f"llm_calls={self.llm_calls}")
+        parts.append(f"tokens={self.prompt_tokens}/{self.completion_tokens}")
+        if self.llm_errors:
+            parts.append(f"llm_errors={self.llm_errors}")
+        if self.error:
+            parts.append(f"error={self.error}")
+        return " ".join(parts)
+
+
+def current_trace() -> Optional[GraphRAGTrace]:
+    return _current_trace.get()
+
+
+def _record(elapsed: float, stages: Dict[str, float]) -> None:
+    """把一段耗时记入当前请求，并从外层阶段的自身耗时中扣除"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_frame.get()
+    if parent is not None:
+        parent.children += elapsed
+    for stage, seconds in stages.items():
+        trace.add(stage, max(seconds, 0.0))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """记录一个阶段的自身耗时，未在请求中时不计时"""
+    if _current_trace.get() is None:
+        yield
+        return
+    frame = _Frame()
+    token = _current_frame.set(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_frame.reset(token)
+        _record(elapsed, {name: elapsed - frame.children})
+
+
+async def trace_async_iter(trace: GraphRAGTrace, iterable: AsyncIterable) -> AsyncIterator:
+    """逐步迭代异步生成器，每一步都在请求的耗时记录中执行
+
+    流式响应的各段可能在不同的任务中消费，不能在生成器中长期持有上下文变量。
+    """
+    iterator = iterable.__aiter__()
+    while True:
+        with trace.activate():
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+        yield item
+
+
+def _count_tokens(token_encoder: Any) -> Callable[[str], int]:
+    count = getattr(token_encoder, "count", None)
+    if count is not None:
+        return count
+    return lambda text: len(token_encoder.encode(text))
+
+
+def _message_text(messages: Any) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(message.get("content", "")) for message in messages)
+
+
+class _Instrumented:
+    """搜索引擎组件的计时代理，未计时的属性和方法直接转发给被包装的对象"""
+
+    def __init__(self, wrapped: Any):
+        self._wrapped = wrapped
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "_wrapped":
+            raise AttributeError(name)
+        return getattr(self._wrapped, name)
+
+
+class _LLMCall:
+    """一次LLM调用的计时，作为 graphrag 的LLM回调接收生成的token"""
+
+    def __init__(self, llm: "InstrumentedLLM", messages: Any):
+        self._llm = llm
+        self._messages = messages
+        self._start = time.perf_counter()
+        self._first_token: Optional[float] = None
+
+    def on_llm_new_token(self, token: str) -> None:
+        if token and self._first_token is None:
+            self._first_token = time.perf_counter()
+
+    def finish(self, text: str) -> None:
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        end = time.perf_counter()
+        # 非流式调用的回答一次性到达，首个token时间即调用结束时间
+        first_token = self._first_token or end
+        _record(end - self._start, {
+            "llm_ttft": first_token - self._start,
+            "llm_completion": end - first_token,
+        })
+        trace.llm_calls += 1
+        trace.prompt_tokens += self._llm.count_tokens(_message_text(self._messages))
+        trace.completion_tokens += self._llm.count_tokens(text)
+
+    def fail(self, error: BaseException) -> None:
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        trace.llm_errors += 1
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            trace.upstream_retry_after = retry_after
+
+
+class InstrumentedLLM(_Instrumented):
+    """记录LLM调用的首token延迟、生成耗时和token数"""
+
+    def __init__(self, wrapped: Any, token_encoder: Any = None):
+        super().__init__(wrapped)
+        self._count = _count_tokens(token_encoder) if token_encoder is not None else None
+
+    def count_tokens(self, text: str) -> int:
+        return self._count(text) if self._count is not None and text else 0
+
+    def generate(self, messages: Any, streaming: bool = True, callbacks: Optional[List[Any]] = None, **kwargs: Any) -> str:
+        call = _LLMCall(self, messages)
+        try:
+            text = self._wrapped.generate(
+                messages, streaming=streaming, callbacks=[*(callbacks or []), call], **kwargs
+            )
+        except Exception as e:
+            call.fail(e)
+            raise
+        call.finish(text)
+        return text
+
+    async def agenerate(
+        self, messages: Any, streaming: bool = True, callbacks: Optional[List[Any]] = None, **kwargs: Any
+    ) -> str:
+        call = _LLMCall(self, messages)
+        try:
+            text = await self._wrapped.agenerate(
+                messages, streaming=streaming, callbacks=[*(callbacks or []), call], **kwargs
+            )
+        except Exception as e:
+            call.fail(e)
+            raise
+        call.finish(text)
+        return text
+
+    async def astream_generate(self, messages: Any, callbacks: Optional[List[Any]] = None, **kwargs: Any) -> AsyncIterator[str]:
+        call = _LLMCall(self, messages)
+        pieces = []
+        try:
+            async for piece in self._wrapped.astream_generate(messages, callbacks=callbacks, **kwargs):
+                call.on_llm_new_token(piece)
+                pieces.append(piece)
+                yield piece
+        except Exception as e:
+            call.fail(e)
+            raise
+        finally:
+            call.finish("".join(pieces))
+
+
+class InstrumentedEmbedder(_Instrumented):
+    """记录查询文本向量化的耗时"""
+
+    def embed(self, text: str, **kwargs: Any) -> List[float]:
+        with stage("embed"):
+            return self._wrapped.embed(text, **kwargs)
+
+    async def aembed(self, text: str, **kwargs: Any) -> List[float]:
+        with stage("embed"):
+            return await self._wrapped.aembed(text, **kwargs)
+
+
+class InstrumentedVectorStore(_Instrumented):
+    """记录向量库检索的耗时，按文本检索时的向量化单独计入 embed"""
+
+    def similarity_search_by_text(self, *args: Any, **kwargs: Any) -> Any:
+        with stage("retrieve"):
+            return self._wrapped.similarity_search_by_text(*args, **kwargs)
+
+    def similarity_search_by_vector(self, *args: Any, **kwargs: Any) -> Any:
+        with stage("retrieve"):
+            return self._wrapped.similarity_search_by_vector(*args, **kwargs)
+
+
+class InstrumentedContextBuilder(_Instrumented):
+    """记录上下文构建的耗时，同步和异步的 build_context 都保持原有的调用方式"""
+
+    def __init__(self, wrapped: Any):
+        super().__init__(wrapped)
+        if inspect.iscoroutinefunction(wrapped.build_context):
+            self.build_context = self._abuild_context
+
+    def build_context(self, *args: Any, **kwargs: Any) -> Any:
+        with stage("build_context"):
+            return self._wrapped.build_context(*args, **kwargs)
+
+    async def _abuild_context(self, *args: Any, **kwargs: Any) -> Any:
+        with stage("build_context"):
+            return await self._wrapped.build_context(*args, **kwargs)
+
+
+# 搜索引擎及其组件中需要计时的属性
+_INSTRUMENTED_ATTRS: Tuple[Tuple[str, Callable[..., _Instrumented]], ...] = (
+    ("llm", InstrumentedLLM),
+    ("chat_llm", InstrumentedLLM),
+    ("text_embedder", InstrumentedEmbedder),
+    ("entity_text_embeddings", InstrumentedVectorStore),
+    ("context_builder", InstrumentedContextBuilder),
+)
+# 包含上述属性的组件（DRIFT搜索的 primer、内部的本地搜索及其上下文构建器，全局搜索的报告预筛选）
+_COMPONENT_ATTRS = (
+    "context_builder", "primer", "local_search", "local_mixed_context", "dynamic_community_selection"
+)
+
+
+def instrument_engine(engine: Any) -> Any:
+    """把搜索引擎的LLM、向量模型、向量库和上下文构建器替换为计时代理，返回原搜索引擎
+
+    代理只在请求的耗时记录（GraphRAGTrace.activate）中计时，其他调用原样转发。
+    """
+    token_encoder = getattr(engine, "token_encoder", None)
+    seen = set()
+
+    def visit(component: Any) -> None:
+        if component is None or id(component) in seen or not hasattr(component, "__dict__"):
+            return
+        seen.add(id(component))
+        attrs = vars(component)
+        for attr in _COMPONENT_ATTRS:
+            visit(attrs.get(attr))
+        for attr, proxy in _INSTRUMENTED_ATTRS:
+            value = attrs.get(attr)
+            if value is None or isinstance(value, _Instrumented):
+                continue
+            if proxy is InstrumentedLLM:
+                setattr(component, attr, InstrumentedLLM(value, token_encoder))
+            else:
+                setattr(component, attr, proxy(value))
+
+    visit(engine)
+    return engine
+
+
+class Histogram:
+    """累积直方图，桶上界之外的观测值计入 +Inf"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets, cumulative = {}, 0
+        for bound, count in zip([*map(str, self.bounds), "+Inf"], self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class GraphRAGTraceHistograms:
+    """按搜索模式汇总各阶段耗时和token数的直方图"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def _histogram(self, mode: str, name: str) -> Histogram:
+        key = (mode, name)
+        if key not in self._histograms:
+            buckets = TOKEN_BUCKETS if name.endswith("_tokens") else LATENCY_BUCKETS
+            self._histograms[key] = Histogram(buckets)
+        return self._histograms[key]
+
+    def observe(self, trace: GraphRAGTrace) -> None:
+        self._histogram(trace.mode, "total").observe(trace.total or 0.0)
+        if trace.first_token is not None:
+            self._histogram(trace.mode, "first_token").observe(trace.first_token)
+        for name, seconds in trace.stages.items():
+            self._histogram(trace.mode, name).observe(seconds)
+        if trace.llm_calls:
+            self._histogram(trace.mode, "prompt_tokens").observe(trace.prompt_tokens)
+            self._histogram(trace.mode, "completion_tokens").observe(trace.completion_tokens)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """搜索模式 -> 指标 -> 直方图"""
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for (mode, name), histogram in sorted(self._histograms.items()):
+            result.setdefault(mode, {})[name] = histogram.snapshot()
+        return result
+
+
+def log_trace(trace: GraphRAGTrace) -> None:
+    logger.info(f"GraphRAG请求耗时 {trace.summary()}", extra={"request_id": trace.request_id})
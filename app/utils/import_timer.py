@@ -0,0 +1,77 @@
+import builtins
+import importlib.util
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+
+class ImportTimer:
+    """统计上下文中首次导入的各模块耗时
+
+    与 python -X importtime 的口径一致：self 为模块自身代码的执行时间，cumulative 包含其导入的子模块。
+    只统计进入上下文的线程中的导入，其他线程同时发生的导入不计入。
+    """
+
+    def __init__(self):
+        # 模块名 -> (self耗时, cumulative耗时)，单位秒
+        self.records: Dict[str, tuple] = {}
+        self.total = 0.0
+        self._stack: List[float] = []
+        self._thread: Optional[int] = None
+        self._original = None
+
+    def __enter__(self) -> "ImportTimer":
+        self._thread = threading.get_ident()
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.total = time.perf_counter() - self._start
+        builtins.__import__ = self._original
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if threading.get_ident() != self._thread:
+            return self._original(name, globals, locals, fromlist, level)
+        try:
+            module_name = (
+                importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+                if level
+                else name
+            )
+        except (ImportError, ValueError):
+            module_name = name
+        if module_name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.records.setdefault(module_name, (elapsed - children, elapsed))
+
+    def report(self, top: int = 20) -> Dict[str, Any]:
+        """导入耗时报告：总耗时、按顶层包汇总的耗时，以及自身耗时最长的模块"""
+        packages = defaultdict(float)
+        for module_name, (self_time, _) in self.records.items():
+            packages[module_name.split(".")[0]] += self_time
+        modules = sorted(self.records.items(), key=lambda item: item[1][0], reverse=True)
+        return {
+            "total": self.total,
+            "module_count": len(self.records),
+            "packages": dict(
+                sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+            ),
+            "modules": [
+                {"module": module_name, "self_time": self_time, "cumulative": cumulative}
+                for module_name, (self_time, cumulative) in modules[:top]
+            ],
+        }
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""GraphRAG 查询基准测试
+
+在进程内启动 mock_llm_server 作为 LLM 和向量模型替身，对示例索引 doupocangqiong 跑 local、global、DRIFT 查询，
+测量以下指标并写入 JSON 文件，升级 graphrag、pandas、tiktoken 等依赖后对比前后两次结果即可发现性能回退：
+
+- cold_start：导入 GraphRAG 查询栈（graphrag_server）的耗时
+- modes.<模式>.build_time：搜索引擎的构建耗时（首个模式包含读取索引表）
+- modes.<模式>.context：上下文构建延迟的 p50/p95/p99，不调用 LLM
+- modes.<模式>.throughput：各并发度下端到端查询的吞吐量和延迟分位数，LLM 延迟由替身服务的参数决定
+- llm_router：LLM 路由器各端点的延迟、错误率和对冲统计
+- http：共用连接池中的连接数和 DNS 缓存命中数
+- peak_rss_mb：各阶段结束时的进程峰值内存（替身服务与基准测试在同一进程中，也计入其中）
+
+索引目录会先复制到临时目录，Arrow 缓存、社区报告向量、查询向量缓存都写在临时目录中，不修改示例索引；
+每次运行都从冷缓存开始。某个模式构建失败时记录错误并继续测试其他模式。
+
+使用示例:
+    python graphrag_benchmark.py --output benchmark.json
+    python graphrag_benchmark.py --modes global --concurrency 1,8,32 --requests 64 --ttft fixed:0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from importlib import metadata
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import uvicorn
+
+from mock_llm_server import LatencyDistribution, MockLLMConfig, create_app
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(SCRIPT_DIR, 'doupocangqiong', 'output')
+
+MODES = ('local', 'global', 'drift')
+
+# 结果中记录版本号的依赖，便于把性能变化对应到依赖升级
+TRACKED_PACKAGES = ('graphrag', 'pandas', 'pyarrow', 'numpy', 'tiktoken', 'lancedb', 'openai')
+
+QUERIES = [
+    '萧炎是谁，他有哪些主要的人物关系？',
+    '药老和萧炎之间是什么关系？',
+    '云岚宗在故事中扮演了什么角色？',
+    '纳兰嫣然退婚之后发生了什么？',
+    '这个故事的主要主题是什么？',
+    '迦南学院有哪些重要人物？',
+    '异火对修炼有什么作用？',
+    '萧薰儿的身世是什么？',
+]
+
+
+def percentiles(samples: Sequence[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {'count': 0, 'mean': None, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    values = np.asarray(samples, dtype=float)
+    return {
+        'count': len(values),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)),
+        'max': float(values.max()),
+    }
+
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存（MB），Linux 上 ru_maxrss 单位为KB，macOS 上为字节"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def package_versions() -> Dict[str, Optional[str]]:
+    versions = {}
+    for package in TRACKED_PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def error_message(e: BaseException) -> str:
+    return f'{type(e).__name__}: {e}'
+
+
+class MockLLMServer:
+    """在后台线程中运行的 LLM 替身服务"""
+
+    def __init__(self, config: MockLLMConfig, host: str = '127.0.0.1'):
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            self.port = sock.getsockname()[1]
+        self.base_url = f'http://{host}:{self.port}/v1'
+        self._server = uvicorn.Server(
+            uvicorn.Config(create_app(config), host=host, port=self.port, log_level='warning')
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self) -> 'MockLLMServer':
+        self._thread.start()
+        deadline = time.time() + 10
+        while not self._server.started:
+            if time.time() > deadline or not self._thread.is_alive():
+                raise RuntimeError('Mock LLM server failed to start')
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+class GraphRAGBenchmark:
+    def __init__(self, server: Any, dataset: Any, queries: Sequence[str]):
+        """初始化基准测试
+
+        Args:
+            server: 已导入的 graphrag_server 模块
+            dataset: 复制到临时目录的索引数据集
+            queries: 轮流使用的测试查询
+        """
+        self.server = server
+        self.dataset = dataset
+        self.queries = list(queries)
+        self.engines: Dict[str, Any] = {}
+        self.http_stats: Dict[str, Any] = {}
+
+    def build_engine(self, mode: str) -> Any:
+        builders: Dict[str, Callable[[], Any]] = {
+            'local': lambda: self.server.build_local_search_engine(dataset=self.dataset),
+            'global': lambda: self.server.build_global_search_engine(dataset=self.dataset),
+            'drift': lambda: self.server.build_drift_search_engine(dataset=self.dataset),
+        }
+        self.engines[mode] = builders[mode]()
+        return self.engines[mode]
+
+    async def build_context(self, mode: str, query: str) -> None:
+        """只构建上下文，不调用 LLM（local 需要向量化查询，首次遇到的查询会请求一次向量接口）"""
+        context_builder = self.engines[mode].context_builder
+        if mode == 'global':
+            await context_builder.build_context(
+                query=query, conversation_history=None, **self.engines[mode].context_builder_params
+            )
+        elif mode == 'local':
+            context_builder.build_context(
+                query=query, conversation_history=None, **self.engines[mode].context_builder_params
+            )
+        else:
+            context_builder.build_context(query)
+
+    async def search(self, mode: str, query: str) -> None:
+        await self.engines[mode].asearch(query)
+
+    async def measure_latency(
+            self, func: Callable[[str], Awaitable[None]], iterations: int
+    ) -> Dict[str, Any]:
+        """依次执行 iterations 次，返回延迟分位数和失败次数"""
+        latencies, errors = [], []
+        for i in range(iterations):
+            start = time.perf_counter()
+            try:
+                await func(self.queries[i % len(self.queries)])
+            except Exception as e:
+                errors.append(error_message(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+        return {**percentiles(latencies), 'errors': len(errors), 'first_error': errors[0] if errors else None}
+
+    async def measure_throughput(self, mode: str, concurrency: int, requests: int) -> Dict[str, Any]:
+        """以固定并发度执行 requests 次端到端查询"""
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], []
+
+        async def run(i: int) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await self.search(mode, self.queries[i % len(self.queries)])
+                except Exception as e:
+                    errors.append(error_message(e))
+                    return
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(run(i) for i in range(requests)))
+        wall_time = time.perf_counter() - start
+        return {
+            'concurrency': concurrency,
+            'requests': requests,
+            'wall_time': wall_time,
+            'throughput': len(latencies) / wall_time if wall_time > 0 else None,
+            'latency': percentiles(latencies),
+            'errors': len(errors),
+            'first_error': errors[0] if errors else None,
+        }
+
+    async def run_mode(
+            self, mode: str, context_iterations: int, concurrency_levels: Sequence[int], requests: int
+    ) -> Dict[str, Any]:
+        result: Dict[str, Any] = {'mode': mode}
+        start = time.perf_counter()
+        try:
+            self.build_engine(mode)
+        except Exception as e:
+            result.update(build_time=None, error=error_message(e), traceback=traceback.format_exc())
+            result['peak_rss_mb'] = peak_rss_mb()
+            print(f'[{mode}] 搜索引擎构建失败: {error_message(e)}')
+            return result
+        result['build_time'] = time.perf_counter() - start
+        print(f'[{mode}] 搜索引擎构建耗时 {result["build_time"]:.3f}s')
+
+        result['context'] = await self.measure_latency(
+            lambda query: self.build_context(mode, query), context_iterations
+        )
+        print(f'[{mode}] 上下文构建 p50={result["context"]["p50"]} p95={result["context"]["p95"]}')
+
+        result['throughput'] = []
+        for concurrency in concurrency_levels:
+            level = await self.measure_throughput(mode, concurrency, requests)
+            result['throughput'].append(level)
+            print(f'[{mode}] 并发 {concurrency}: {level["throughput"]} 查询/s，失败 {level["errors"]}')
+        result['peak_rss_mb'] = peak_rss_mb()
+        return result
+
+    async def run(
+            self, modes: Sequence[str], context_iterations: int, concurrency_levels: Sequence[int], requests: int
+    ) -> Dict[str, Dict[str, Any]]:
+        try:
+            return {
+                mode: await self.run_mode(mode, context_iterations, concurrency_levels, requests)
+                for mode in modes
+            }
+        finally:
+            # 在事件循环关闭前关闭共用的连接池，关闭前记录连接数
+            self.http_stats = self.server.http_clients.stats()
+            await self.server.http_clients.aclose()
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix='graphrag_benchmark_')
+    data_dir = os.path.join(workdir, 'output')
+    shutil.copytree(args.data_dir, data_dir)
+
+    mock_config = MockLLMConfig(
+        ttft=LatencyDistribution(args.ttft),
+        token_rate=args.token_rate,
+        output_tokens=args.output_tokens,
+        embedding_latency=LatencyDistribution(args.embedding_latency),
+        seed=args.seed,
+    )
+    result: Dict[str, Any] = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'packages': package_versions(),
+        'config': {
+            'data_dir': args.data_dir,
+            'modes': args.modes,
+            'context_iterations': args.context_iterations,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'ttft': args.ttft,
+            'token_rate': args.token_rate,
+            'output_tokens': args.output_tokens,
+            'embedding_latency': args.embedding_latency,
+        },
+    }
+    try:
+        with MockLLMServer(mock_config) as mock_server:
+            # graphrag_server 在导入时读取这些环境变量创建 LLM 和向量模型客户端
+            os.environ.update({
+                'BASE_URL': mock_server.base_url,
+                'API_KEY': 'mock',
+                'MODEL': 'mock',
+                'EMBEDDING_CACHE_PATH': os.path.join(workdir, 'cache', 'query_embedding', 'embeddings.sqlite'),
+            })
+            rss_before = peak_rss_mb()
+            start = time.perf_counter()
+            sys.path.insert(0, SCRIPT_DIR)
+            import graphrag_server
+            from graphrag_dataset import GraphRAGDataset
+            result['cold_start'] = {
+                'import_time': time.perf_counter() - start,
+                'peak_rss_mb_before': rss_before,
+                'peak_rss_mb_after': peak_rss_mb(),
+            }
+            print(f'导入 GraphRAG 查询栈耗时 {result["cold_start"]["import_time"]:.3f}s')
+
+            dataset = GraphRAGDataset(data_dir, cache_dir=os.path.join(workdir, 'cache'))
+            benchmark = GraphRAGBenchmark(graphrag_server, dataset, QUERIES)
+            # 所有模式在同一个事件循环中运行，LLM 客户端的连接池绑定在创建它的事件循环上
+            result['modes'] = asyncio.run(
+                benchmark.run(args.modes, args.context_iterations, args.concurrency, args.requests)
+            )
+            result['dataset_memory_mb'] = {
+                kind: size / 1024 / 1024 for kind, size in dataset.memory_breakdown().items()
+            }
+            result['token_cache'] = graphrag_server.token_encoder.stats()
+            result['llm_router'] = graphrag_server.llm.snapshot()
+            result['http'] = benchmark.http_stats
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def parse_list(value: str, item_type: Callable = str) -> List:
+    return [item_type(item) for item in value.split(',') if item]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='GraphRAG 查询基准测试，结果写入 JSON 文件')
+    parser.add_argument('--output', default='graphrag_benchmark.json', help='结果文件路径')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='索引输出目录')
+    parser.add_argument('--modes', type=parse_list, default=list(MODES), help='测试的搜索模式，逗号分隔')
+    parser.add_argument('--context-iterations', type=int, default=50, help='每个模式构建上下文的次数')
+    parser.add_argument('--concurrency', type=lambda value: parse_list(value, int), default=[1, 4, 16],
+                        help='测试吞吐量的并发度，逗号分隔')
+    parser.add_argument('--requests', type=int, default=32, help='每个并发度执行的查询数')
+    parser.add_argument('--ttft', default='fixed:0.05', help='替身 LLM 的首 token 延迟分布')
+    parser.add_argument('--token-rate', type=float, default=0.0, help='替身 LLM 的生成速度(token/s)，0表示不限速')
+    parser.add_argument('--output-tokens', type=int, default=200, help='替身 LLM 普通文本回答的token数')
+    parser.add_argument('--embedding-latency', default='fixed:0.01', help='替身向量接口的延迟分布')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f'未知的搜索模式: {", ".join(sorted(unknown))}')
+
+    benchmark_result = run_benchmark(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(benchmark_result, f, ensure_ascii=False, indent=2)
+    print(f'基准测试结果已写入 {args.output}')
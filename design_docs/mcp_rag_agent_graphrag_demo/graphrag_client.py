@@ -19,7 +19,9 @@ import os
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
 import traceback
 
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from graphrag_http import HTTPPoolConfig, SharedHTTPClients
 
 
 class MCPClient(object):
@@ -30,9 +32,12 @@ class MCPClient(object):
         print(os.getenv("API_KEY"))
         print(os.getenv("BASE_URL"))
         print(os.getenv("MODEL"))
-        self.client = OpenAI(
+        # 异步客户端使用共用的连接池，调用LLM时不阻塞事件循环中的MCP会话
+        self.http_clients = SharedHTTPClients(HTTPPoolConfig.from_env())
+        self.client = AsyncOpenAI(
             api_key=os.getenv("API_KEY"),
-            base_url=os.getenv("BASE_URL")
+            base_url=os.getenv("BASE_URL"),
+            http_client=self.http_clients.async_client
         )
         self.model = os.getenv("MODEL")
         self.messages = []
@@ -44,6 +49,7 @@ class MCPClient(object):
         }]
     async def cleanup(self):
         await self.exit_stack.aclose()
+        await self.http_clients.aclose()
         print("清理完成")
 
     async def connect_server(self, server_script_path):
@@ -82,7 +88,7 @@ class MCPClient(object):
             }
         } for tool in tools_info.tools]
 
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             tools=available_tools
@@ -104,7 +110,7 @@ class MCPClient(object):
                 "content": result.content[0].text,
                 "tool_call_id": tool_call.id
             })
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages
             )
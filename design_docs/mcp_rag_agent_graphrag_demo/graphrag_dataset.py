@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""GraphRAG索引数据集
+
+统一加载 output 目录下的 parquet 表和 LanceDB 向量集合，并缓存 read_indexer_* 转换后的对象。
+每张表按文件的修改时间和大小判断是否变化，只有发生变化的表及依赖它的对象会被重新加载。
+
+parquet 表首次读取时转换为未压缩的 Arrow IPC 文件并以内存映射方式打开：表数据由操作系统页缓存承载，
+同一台机器上的多个 uvicorn worker 共享同一份物理内存。各个转换只读取所需的列，
+向量列可以直接取为连续的 NumPy 矩阵，不经过逐行的 Python 列表。
+
+共享的范围：内存映射的 Arrow 表、向量矩阵和投影出的 DataFrame 中的数值列（零拷贝、只读）。
+字符串和列表列转换为 DataFrame 时必然生成 Python 对象，read_indexer_* 转换出的实体、报告等对象也是如此，
+这部分是每个 worker 私有的内存。memory_breakdown 分别统计内存映射（mapped）和私有（materialized）的字节数。
+
+索引热更新时每个索引版本使用各自的数据集，并在首次构建搜索引擎时用 pin 固定该版本的索引表，
+之后输出目录被新的索引覆盖，旧版本按需构建的搜索引擎仍然读取旧版本的数据。
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from graphrag.query.indexer_adapters import (
+    read_indexer_entities,
+    read_indexer_communities,
+    read_indexer_reports,
+    read_indexer_text_units,
+    read_indexer_relationships,
+)
+
+from graphrag_vector_store import NumpyVectorStore, lancedb_signature
+
+logger = logging.getLogger(__name__)
+
+ENTITY_NODES_TABLE = 'create_final_nodes'
+ENTITY_EMBEDDING_TABLE = 'create_final_entities'
+COMMUNITIES_TABLE = 'create_final_communities'
+COMMUNITY_REPORT_TABLE = 'create_final_community_reports'
+TEXT_UNIT_TABLE = 'create_final_text_units'
+RELATIONSHIP_TABLE = 'create_final_relationships'
+# COVARIATE_TABLE = 'create_final_covariates'
+
+# 带有 full_content 向量的社区报告表，由 DRIFT 搜索首次构建时生成
+COMMUNITY_REPORT_EMBEDDING_TABLE = f'{COMMUNITY_REPORT_TABLE}_with_embeddings'
+# 社区报告的紧凑摘要和 token 数，由 graphrag_report_summary 离线生成
+COMMUNITY_REPORT_SUMMARY_TABLE = f'{COMMUNITY_REPORT_TABLE}_summaries'
+# 构建搜索引擎时由社区报告表生成的表，不属于索引快照，读取时按报告内容与社区报告表对应
+DERIVED_TABLES = (COMMUNITY_REPORT_EMBEDDING_TABLE, COMMUNITY_REPORT_SUMMARY_TABLE)
+
+# 实体描述向量集合
+ENTITY_DESCRIPTION_COLLECTION = 'default-entity-description'
+
+# 各转换需要读取的列（表中不存在的列会被忽略，兼容不同版本的索引输出）
+NODE_COLUMNS = ['id', 'title', 'community', 'level', 'degree']
+ENTITY_COLUMNS = [
+    'id', 'human_readable_id', 'title', 'name', 'type', 'description', 'text_unit_ids',
+    'description_embedding',
+]
+REPORT_COLUMNS = ['id', 'community', 'level', 'title', 'summary', 'full_content', 'rank']
+COMMUNITY_COLUMNS = ['id', 'community', 'level', 'title']
+TEXT_UNIT_COLUMNS = [
+    'id', 'text', 'n_tokens', 'document_ids', 'entity_ids', 'relationship_ids', 'covariate_ids',
+]
+RELATIONSHIP_COLUMNS = [
+    'id', 'human_readable_id', 'source', 'target', 'description', 'weight', 'combined_degree',
+    'rank', 'text_unit_ids',
+]
+
+# 表文件签名：(修改时间ns, 文件大小)
+TableSignature = Tuple[int, int]
+# 表投影：(表名, 列名元组)，列名为None时读取全部列
+Projection = Tuple[str, Optional[Tuple[str, ...]]]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _private_bytes(frame: pd.DataFrame) -> int:
+    """DataFrame 中复制出的数据大小，零拷贝引用 Arrow 缓冲区的只读数值列不计入"""
+    usage = frame.memory_usage(deep=True)
+    total = int(usage.get('Index', 0))
+    for position, column in enumerate(frame.columns):
+        values = frame.iloc[:, position].values
+        if isinstance(values, np.ndarray) and not values.flags.writeable:
+            continue
+        total += int(usage.iloc[position + 1])
+    return total
+
+
+class GraphRAGDataset:
+    """GraphRAG索引数据集，多个搜索引擎共享同一份表和转换结果"""
+
+    def __init__(self, data_dir: str, cache_dir: Optional[str] = None):
+        self.data_dir = data_dir
+        self.lancedb_uri = os.path.join(data_dir, 'lancedb')
+        cache_dir = cache_dir or os.path.join(os.path.dirname(data_dir), 'cache')
+        # parquet 转换后的 Arrow IPC 文件目录
+        self.arrow_cache_dir = os.path.join(cache_dir, 'arrow')
+        # 向量集合转换后的 .npy 缓存目录
+        self.vector_cache_dir = os.path.join(cache_dir, 'vector_store')
+        self._lock = threading.RLock()
+        # 表名 -> (签名, 内存映射的 Arrow 表)
+        self._tables: Dict[str, Tuple[TableSignature, pa.Table]] = {}
+        # 表投影 -> (签名, DataFrame, 私有内存字节数)
+        self._frames: Dict[Projection, Tuple[TableSignature, pd.DataFrame, int]] = {}
+        # 缓存键 -> (依赖表签名, 转换结果)
+        self._objects: Dict[Tuple, Tuple[Tuple[TableSignature, ...], Any]] = {}
+        # 固定后索引表和向量集合不再按文件变化重新加载
+        self._pinned = False
+
+    def table_path(self, name: str) -> str:
+        return os.path.join(self.data_dir, f'{name}.parquet')
+
+    def _signature(self, name: str) -> TableSignature:
+        stat = os.stat(self.table_path(name))
+        return stat.st_mtime_ns, stat.st_size
+
+    def has_table(self, name: str) -> bool:
+        return os.path.exists(self.table_path(name))
+
+    def _arrow_path(self, name: str, signature: TableSignature) -> str:
+        return os.path.join(self.arrow_cache_dir, f'{name}-{signature[0]}-{signature[1]}.arrow')
+
+    def arrow_table(self, name: str) -> pa.Table:
+        """以内存映射方式读取表，parquet 文件未变化（或数据集已固定）时直接返回缓存"""
+        with self._lock:
+            cached = self._tables.get(name)
+            if cached is not None and self._pinned and name not in DERIVED_TABLES:
+                return cached[1]
+            signature = self._signature(name)
+            if cached is None or cached[0] != signature:
+                path = self._arrow_path(name, signature)
+                if not os.path.exists(path):
+                    self._write_arrow(name, path)
+                table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+                self._tables[name] = (signature, table)
+            return self._tables[name][1]
+
+    def _write_arrow(self, name: str, path: str) -> None:
+        """把 parquet 表转换为未压缩的 Arrow IPC 文件，先写临时文件再替换，多进程同时转换也不会读到半个文件"""
+        os.makedirs(self.arrow_cache_dir, exist_ok=True)
+        table = pq.read_table(self.table_path(name), memory_map=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        # 删除该表旧版本的 Arrow 文件
+        prefix = f'{name}-'
+        for file_name in os.listdir(self.arrow_cache_dir):
+            old_path = os.path.join(self.arrow_cache_dir, file_name)
+            if file_name.startswith(prefix) and file_name.endswith('.arrow') and old_path != path:
+                os.remove(old_path)
+
+    def num_rows(self, name: str) -> int:
+        """表的行数，不解码表数据"""
+        return self.arrow_table(name).num_rows
+
+    def table(self, name: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """读取表的指定列为 DataFrame，表文件未变化时直接返回缓存"""
+        with self._lock:
+            arrow = self.arrow_table(name)
+            if columns is not None:
+                columns = tuple(column for column in columns if column in arrow.column_names)
+            key = (name, columns)
+            signature = self._tables[name][0]
+            cached = self._frames.get(key)
+            if cached is None or cached[0] != signature:
+                projected = arrow if columns is None else arrow.select(list(columns))
+                # split_blocks 使没有空值的数值列直接引用内存映射的 Arrow 缓冲区（只读），不复制
+                frame = projected.to_pandas(split_blocks=True)
+                self._frames[key] = (signature, frame, _private_bytes(frame))
+            return self._frames[key][1]
+
+    def embedding_matrix(self, name: str, column: str) -> np.ndarray:
+        """把向量列取为 (行数, 维度) 的连续矩阵，直接使用 Arrow 的值缓冲区，不构造逐行列表"""
+        values = self.arrow_table(name).column(column).combine_chunks()
+        if len(values) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        flat = values.flatten().to_numpy(zero_copy_only=False)
+        return flat.reshape(len(values), -1)
+
+    def _memoize(
+            self, key: Tuple, tables: List[Tuple[str, Sequence[str]]], factory: Callable[..., Any]
+    ) -> Any:
+        """缓存转换结果，依赖表任一发生变化时重新转换"""
+        with self._lock:
+            frames = [self.table(name, columns) for name, columns in tables]
+            signatures = tuple(self._tables[name][0] for name, _ in tables)
+            cached = self._objects.get(key)
+            if cached is None or cached[0] != signatures:
+                # read_indexer_* 会原地修改传入的 DataFrame，传入副本以保护缓存的表
+                self._objects[key] = (signatures, factory(*(frame.copy() for frame in frames)))
+            return self._objects[key][1]
+
+    def entities(self, community_level: Optional[int]) -> list:
+        return self._memoize(
+            ('entities', community_level),
+            [(ENTITY_NODES_TABLE, NODE_COLUMNS), (ENTITY_EMBEDDING_TABLE, ENTITY_COLUMNS)],
+            lambda nodes, entities: read_indexer_entities(nodes, entities, community_level),
+        )
+
+    def relationships(self) -> list:
+        return self._memoize(
+            ('relationships',),
+            [(RELATIONSHIP_TABLE, RELATIONSHIP_COLUMNS)],
+            read_indexer_relationships,
+        )
+
+    def text_units(self) -> list:
+        return self._memoize(
+            ('text_units',), [(TEXT_UNIT_TABLE, TEXT_UNIT_COLUMNS)], read_indexer_text_units
+        )
+
+    def reports(
+            self, community_level: Optional[int], with_embeddings: bool = False, with_summaries: bool = False
+    ) -> list:
+        """社区报告
+
+        with_embeddings 为True时附加报告表对应的 full_content 向量；
+        with_summaries 为True时报告的 summary 替换为离线生成的紧凑摘要（全局搜索 use_community_summary 使用的字段）。
+        向量和摘要按报告内容与社区报告表对应：由其他索引版本的报告生成的向量和摘要不会附加到内容不同的报告上，
+        这些报告没有向量，摘要保留报告自带的 summary。
+        """
+        tables = [(COMMUNITY_REPORT_TABLE, REPORT_COLUMNS), (ENTITY_NODES_TABLE, NODE_COLUMNS)]
+        options = {}
+        if with_embeddings:
+            tables.append((COMMUNITY_REPORT_EMBEDDING_TABLE, ['full_content', 'full_content_embeddings']))
+            options['content_embedding_col'] = 'full_content_embeddings'
+        if with_summaries:
+            tables.append((COMMUNITY_REPORT_SUMMARY_TABLE, ['content_hash', 'compact_summary']))
+
+        def factory(reports: pd.DataFrame, nodes: pd.DataFrame, *derived: pd.DataFrame) -> list:
+            derived = list(derived)
+            if with_embeddings:
+                embeddings = derived.pop(0)
+                by_content = dict(zip(embeddings['full_content'], embeddings['full_content_embeddings']))
+                reports['full_content_embeddings'] = [by_content.get(content) for content in reports['full_content']]
+            if with_summaries:
+                summaries = derived.pop(0)
+                by_hash = dict(zip(summaries['content_hash'], summaries['compact_summary']))
+                reports['summary'] = [
+                    by_hash.get(content_hash(content), summary)
+                    for content, summary in zip(reports['full_content'], reports['summary'])
+                ]
+            return read_indexer_reports(reports, nodes, community_level, **options)
+
+        return self._memoize(('reports', community_level, with_embeddings, with_summaries), tables, factory)
+
+    def communities(self) -> list:
+        return self._memoize(
+            ('communities',),
+            [
+                (COMMUNITIES_TABLE, COMMUNITY_COLUMNS),
+                (ENTITY_NODES_TABLE, NODE_COLUMNS),
+                (COMMUNITY_REPORT_TABLE, ['community']),
+            ],
+            read_indexer_communities,
+        )
+
+    def vector_store(self, collection_name: str = ENTITY_DESCRIPTION_COLLECTION) -> NumpyVectorStore:
+        """读取 LanceDB 向量集合为进程内向量库，集合未变化（或数据集已固定）时所有搜索引擎共享同一个实例"""
+        with self._lock:
+            key = ('vector_store', collection_name)
+            cached = self._objects.get(key)
+            if cached is not None and self._pinned:
+                return cached[1]
+            signature = (lancedb_signature(self.lancedb_uri, collection_name),)
+            if cached is None or cached[0] != signature:
+                store = NumpyVectorStore.from_lancedb(
+                    self.lancedb_uri, collection_name, self.vector_cache_dir
+                )
+                self._objects[key] = (signature, store)
+            return self._objects[key][1]
+
+    def pin(self) -> None:
+        """把输出目录当前的索引表固定为该数据集的快照
+
+        立即加载所有索引表（不含 DERIVED_TABLES）和实体描述向量集合，之后文件变化也不再重新加载。
+        多次调用只在第一次加载。
+        """
+        with self._lock:
+            if self._pinned:
+                return
+            for entry in sorted(os.scandir(self.data_dir), key=lambda entry: entry.name):
+                name = entry.name[:-len('.parquet')]
+                if entry.name.endswith('.parquet') and name not in DERIVED_TABLES:
+                    self.arrow_table(name)
+            if lancedb_signature(self.lancedb_uri, ENTITY_DESCRIPTION_COLLECTION) is not None:
+                try:
+                    self.vector_store(ENTITY_DESCRIPTION_COLLECTION)
+                except Exception as e:
+                    # 只有本地搜索和 DRIFT 搜索使用向量集合，无法读取时不影响其他搜索模式，需要它的模式构建时会报告同样的错误
+                    logger.warning('Entity description embeddings not pinned: %s', e)
+            self._pinned = True
+
+    @property
+    def version(self) -> str:
+        """当前已加载数据的版本标识，任一表重新加载后都会变化"""
+        with self._lock:
+            signatures = sorted((name, cached[0]) for name, cached in self._tables.items())
+        return hashlib.sha1(repr(signatures).encode('utf-8')).hexdigest()[:12]
+
+    def snapshot_version(self) -> str:
+        """输出目录当前快照的版本标识，只读取文件状态，不加载数据
+
+        构建引擎时生成的报告向量表和报告摘要表不计入快照，避免写入这些表被误认为新的索引。
+        """
+        derived = {f'{name}.parquet' for name in DERIVED_TABLES}
+        signatures = []
+        for entry in sorted(os.scandir(self.data_dir), key=lambda entry: entry.name):
+            if entry.name.endswith('.parquet') and entry.name not in derived:
+                stat = entry.stat()
+                signatures.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        if os.path.isdir(self.lancedb_uri):
+            for entry in sorted(os.scandir(self.lancedb_uri), key=lambda entry: entry.name):
+                if entry.name.endswith('.lance'):
+                    collection = entry.name[:-len('.lance')]
+                    signatures.append((entry.name, lancedb_signature(self.lancedb_uri, collection)))
+        return hashlib.sha1(repr(signatures).encode('utf-8')).hexdigest()[:12]
+
+    def memory_breakdown(self) -> Dict[str, int]:
+        """已加载数据的估算内存占用（字节），内存映射和私有内存分开统计
+
+        mapped 为内存映射的 Arrow 表和向量矩阵的大小，由页缓存承载，多个 worker 共享，内存紧张时可以被操作系统回收，
+        不等于常驻内存；materialized 为 DataFrame 中复制出的列、内存中的向量矩阵，以及 read_indexer_* 转换出的对象
+        （与对应的 DataFrame 大小相当，按 DataFrame 的私有内存再计一份）。
+        """
+        with self._lock:
+            tables = sum(table.nbytes for _, table in self._tables.values())
+            frames = sum(size for _, _, size in self._frames.values())
+            stores = [obj for _, obj in self._objects.values() if isinstance(obj, NumpyVectorStore)]
+        mapped_vectors = sum(store.nbytes for store in stores if store.mapped)
+        private_vectors = sum(store.nbytes for store in stores if not store.mapped)
+        return {
+            'mapped': tables + mapped_vectors,
+            'materialized': 2 * frames + private_vectors,
+        }
+
+    def memory_usage(self) -> int:
+        """本进程私有的估算内存占用（字节），即 memory_breakdown 的 materialized，用于多语料的内存预算"""
+        return self.memory_breakdown()['materialized']
+
+    def mapped_bytes(self) -> int:
+        """内存映射的数据大小（字节），即 memory_breakdown 的 mapped"""
+        return self.memory_breakdown()['mapped']
+
+    def clear(self) -> None:
+        """清空所有缓存，已固定的数据集同时解除固定"""
+        with self._lock:
+            self._tables.clear()
+            self._frames.clear()
+            self._objects.clear()
+            self._pinned = False
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""带持久化缓存的文本向量模型
+
+按 (模型名, 文本哈希) 对向量做内容寻址缓存：内存 LRU 作为一级缓存，SQLite 作为二级持久化存储。
+重复文本（包括进程重启后）不会再次请求向量接口。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+import numpy as np
+
+from graphrag.query.llm.base import BaseTextEmbedding
+
+
+class CachedTextEmbedding(BaseTextEmbedding):
+    """文本向量模型的缓存包装，对搜索引擎保持与被包装模型相同的接口"""
+
+    def __init__(self, embedder: BaseTextEmbedding, cache_path: str, memory_entries: int = 4096):
+        self.embedder = embedder
+        self.model = getattr(embedder, 'model', embedder.__class__.__name__)
+        self.memory_entries = memory_entries
+        self._memory: 'OrderedDict[str, List[float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        # 多个 worker 进程共享同一个缓存文件，使用 WAL 模式允许并发读
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)'
+        )
+        self._conn.commit()
+
+    def __getattr__(self, name: str) -> Any:
+        # 其余属性（max_tokens、token_encoder 等）透传给被包装的模型
+        if name == 'embedder':
+            raise AttributeError(name)
+        return getattr(self.embedder, name)
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f'{self.model}\n{text}'.encode('utf-8')).hexdigest()
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """从缓存读取向量，未命中返回None"""
+        key = self.cache_key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+            row = self._conn.execute(
+                'SELECT vector FROM embeddings WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+            self._remember(key, vector)
+            self.hits += 1
+            return vector
+
+    def put(self, text: str, vector: List[float]) -> None:
+        """写入缓存，空向量或包含非有限值的向量（上游调用失败）不缓存"""
+        array = np.asarray(vector, dtype=np.float32)
+        if array.size == 0 or not np.isfinite(array).all():
+            return
+        key = self.cache_key(text)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)',
+                (key, self.model, array.tobytes()),
+            )
+            self._conn.commit()
+            self._remember(key, array.tolist())
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def embed(self, text: str, **kwargs: Any) -> List[float]:
+        vector = self.get(text)
+        if vector is None:
+            vector = self.embedder.embed(text, **kwargs)
+            self.put(text, vector)
+        return vector
+
+    async def aembed(self, text: str, **kwargs: Any) -> List[float]:
+        vector = self.get(text)
+        if vector is None:
+            vector = await self.embedder.aembed(text, **kwargs)
+            self.put(text, vector)
+        return vector
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
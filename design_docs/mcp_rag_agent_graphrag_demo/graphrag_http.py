@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""进程内共用的 HTTP 连接池
+
+graphrag 的 ChatOpenAI、OpenAIEmbedding 每个实例各自创建同步和异步两个 OpenAI 客户端，每个客户端有自己的连接池，
+多个端点、对话和向量模型加起来有十几个连接池，连接无法复用，每个连接池都要重新进行 TCP、TLS 握手。
+这里创建一个异步和一个同步的 httpx 客户端，注入所有 LLM、向量模型和 MCP 客户端：
+
+- 长连接：空闲连接保留 keepalive_expiry 秒，后续请求直接复用
+- 连接数上限：max_connections 限制异步连接池的出站连接总数，同步连接池（DRIFT 的 HyDE 查询扩展、
+  社区报告批量向量化）使用相同的上限
+- HTTP/2：需要安装 h2（pip install httpx[http2]），未安装时退回 HTTP/1.1
+- 代理：trust_env 为 True 时与 httpx 默认行为一致，使用 HTTP_PROXY、HTTPS_PROXY、ALL_PROXY 和 NO_PROXY 环境变量
+- DNS 缓存：域名解析出的所有地址缓存 dns_cache_ttl 秒，新连接轮流使用各个地址，
+  连接失败时依次尝试其余地址，全部失败时丢弃该域名的缓存；使用代理时缓存的是代理服务器的地址
+
+httpx 不支持自定义域名解析，DNS 缓存通过替换 httpx 传输层内部连接池的网络后端（_pool._network_backend）实现，
+依赖 httpx 0.28 和 httpcore 1.0 的内部结构，两者的版本在 requirements.txt 中固定（httpx==0.28.1、httpcore==1.0.9），
+升级前需要确认这些内部属性仍然存在；dns_cache_ttl 为 0 时不替换，只使用公开接口。
+
+使用示例:
+    http_clients = SharedHTTPClients(HTTPPoolConfig.from_env())
+    llm = http_clients.share_with(ChatOpenAI(...))
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+import httpcore
+import httpx
+
+T = TypeVar('T')
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HTTPPoolConfig:
+    """连接池配置"""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    http2: bool = False
+    # 域名解析结果的缓存时间（秒），0 表示不缓存
+    dns_cache_ttl: float = 300.0
+    # 是否使用代理等环境变量
+    trust_env: bool = True
+
+    @classmethod
+    def from_env(cls) -> 'HTTPPoolConfig':
+        """从环境变量读取配置：HTTP_MAX_CONNECTIONS、HTTP_MAX_KEEPALIVE、HTTP_KEEPALIVE_EXPIRY、HTTP2、
+        HTTP_DNS_CACHE_TTL、HTTP_TRUST_ENV"""
+        return cls(
+            max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', cls.max_connections)),
+            max_keepalive_connections=int(os.getenv('HTTP_MAX_KEEPALIVE', cls.max_keepalive_connections)),
+            keepalive_expiry=float(os.getenv('HTTP_KEEPALIVE_EXPIRY', cls.keepalive_expiry)),
+            http2=os.getenv('HTTP2', '').lower() in ('1', 'true', 'yes'),
+            dns_cache_ttl=float(os.getenv('HTTP_DNS_CACHE_TTL', cls.dns_cache_ttl)),
+            trust_env=os.getenv('HTTP_TRUST_ENV', 'true').lower() in ('1', 'true', 'yes'),
+        )
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class DNSCache:
+    """按 (域名, 端口) 缓存解析出的所有地址，同步和异步连接池共用
+
+    addresses 每次从下一个地址开始返回全部地址，新连接轮流使用各个地址，前面的地址连接失败时依次尝试后面的地址。
+    """
+
+    def __init__(self, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        # (域名, 端口) -> (过期时间, 地址列表, 轮转计数器)
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str], Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, host: str, port: int) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get((host, port))
+            if entry is None or entry[0] <= self._clock():
+                self.misses += 1
+                return None
+            self.hits += 1
+            _, addresses, counter = entry
+            start = next(counter) % len(addresses)
+            return addresses[start:] + addresses[:start]
+
+    def _put(self, host: str, port: int, infos: Iterable[Any]) -> List[str]:
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            # 本次使用第一个地址，下一次从第二个地址开始
+            self._entries[(host, port)] = (self._clock() + self.ttl, addresses, itertools.count(1))
+        return addresses
+
+    def addresses(self, host: str, port: int) -> List[str]:
+        """按轮转顺序返回域名的所有地址"""
+        addresses = self._get(host, port)
+        if addresses is None:
+            addresses = self._put(host, port, socket.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+        return addresses
+
+    async def aaddresses(self, host: str, port: int) -> List[str]:
+        addresses = self._get(host, port)
+        if addresses is None:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            addresses = self._put(host, port, infos)
+        return addresses
+
+    def invalidate(self, host: str, port: int) -> None:
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+_CONNECT_ERRORS = (httpcore.ConnectError, httpcore.ConnectTimeout)
+
+
+class _CachedDNSAsyncBackend(httpcore.AsyncNetworkBackend):
+    """先查 DNS 缓存再建立连接，TLS 的 SNI 和证书校验仍使用原域名"""
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, cache: DNSCache):
+        self._backend = backend
+        self._cache = cache
+
+    async def connect_tcp(
+            self, host: str, port: int, timeout: Optional[float] = None, local_address: Optional[str] = None,
+            socket_options: Optional[Iterable[Any]] = None
+    ) -> httpcore.AsyncNetworkStream:
+        error: Optional[Exception] = None
+        for address in await self._cache.aaddresses(host, port):
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except _CONNECT_ERRORS as e:
+                error = e
+        # 所有地址都连接失败，下次重新解析
+        self._cache.invalidate(host, port)
+        raise error
+
+    async def connect_unix_socket(
+            self, path: str, timeout: Optional[float] = None, socket_options: Optional[Iterable[Any]] = None
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+class _CachedDNSSyncBackend(httpcore.NetworkBackend):
+    """_CachedDNSAsyncBackend 的同步版本"""
+
+    def __init__(self, backend: httpcore.NetworkBackend, cache: DNSCache):
+        self._backend = backend
+        self._cache = cache
+
+    def connect_tcp(
+            self, host: str, port: int, timeout: Optional[float] = None, local_address: Optional[str] = None,
+            socket_options: Optional[Iterable[Any]] = None
+    ) -> httpcore.NetworkStream:
+        error: Optional[Exception] = None
+        for address in self._cache.addresses(host, port):
+            try:
+                return self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except _CONNECT_ERRORS as e:
+                error = e
+        self._cache.invalidate(host, port)
+        raise error
+
+    def connect_unix_socket(
+            self, path: str, timeout: Optional[float] = None, socket_options: Optional[Iterable[Any]] = None
+    ) -> httpcore.NetworkStream:
+        return self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+def _transports(client: Any) -> List[Any]:
+    """客户端的默认传输层和按代理环境变量挂载的传输层（httpx 内部属性）"""
+    return [client._transport, *(transport for transport in client._mounts.values() if transport is not None)]
+
+
+class SharedHTTPClients:
+    """进程内共用的异步和同步 httpx 客户端"""
+
+    def __init__(self, config: Optional[HTTPPoolConfig] = None):
+        self.config = config or HTTPPoolConfig()
+        http2 = self.config.http2 and http2_available()
+        if self.config.http2 and not http2:
+            logger.warning('HTTP/2 requires the h2 package (pip install httpx[http2]), falling back to HTTP/1.1')
+        self.dns_cache = DNSCache(self.config.dns_cache_ttl)
+        # 由 httpx 按 trust_env 创建默认传输层和代理传输层，与直接创建客户端时的代理行为一致
+        options = dict(http2=http2, limits=self.config.limits(), trust_env=self.config.trust_env)
+        self.async_client = httpx.AsyncClient(**options)
+        self.sync_client = httpx.Client(**options)
+        if self.config.dns_cache_ttl > 0:
+            for transport in _transports(self.async_client):
+                pool = transport._pool
+                pool._network_backend = _CachedDNSAsyncBackend(pool._network_backend, self.dns_cache)
+            for transport in _transports(self.sync_client):
+                pool = transport._pool
+                pool._network_backend = _CachedDNSSyncBackend(pool._network_backend, self.dns_cache)
+
+    def share_with(self, client: T) -> T:
+        """让 graphrag 的 ChatOpenAI、OpenAIEmbedding 使用共用的连接池，其余配置（API Key、超时、重试次数等）不变"""
+        client.async_client = client.async_client.with_options(http_client=self.async_client)
+        client.sync_client = client.sync_client.with_options(http_client=self.sync_client)
+        return client
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池中的连接数和 DNS 缓存命中情况"""
+        return {
+            'async_connections': sum(len(t._pool.connections) for t in _transports(self.async_client)),
+            'sync_connections': sum(len(t._pool.connections) for t in _transports(self.sync_client)),
+            'dns_cache_hits': self.dns_cache.hits,
+            'dns_cache_misses': self.dns_cache.misses,
+        }
+
+    async def aclose(self) -> None:
+        await self.async_client.aclose()
+        self.sync_client.close()
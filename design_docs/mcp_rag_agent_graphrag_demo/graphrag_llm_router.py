@@ -0,0 +1,661 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""按延迟路由的多端点 LLM / 向量模型客户端
+
+同一模型可以配置多个上游端点（不同的 API Key、网关），各端点的尾延迟差别很大。
+这里把对话和向量请求分散到多个端点：
+
+- 按端点的延迟 EWMA 和错误率 EWMA 计算权重，加权随机选择端点，进行中的请求多的端点权重降低
+- 请求超过近期延迟的 p95 仍未返回时，向另一个端点发送对冲请求，先返回的结果胜出，另一个请求被取消；
+  对冲请求数不超过总请求数的 hedge_ratio，避免上游整体变慢时成倍放大负载
+- 流式生成按首个片段的到达时间对冲
+
+上游故障时的保护：
+
+- 每个端点一个熔断器，连续失败达到阈值后打开，期间不再向该端点发送请求，到期后放行一个探测请求
+- 重试由路由器统一执行（客户端自身不重试），优先换用未尝试过的端点，重试前按指数退避加随机抖动等待；
+  重试消耗进程级的重试预算，预算按成功调用数的比例补充，上游整体故障时重试流量不会放大故障
+- 所有端点的熔断器都打开时立即抛出 UpstreamUnavailableError，不占用协程和连接等待超时
+
+RoutedChatLLM、RoutedTextEmbedding 分别实现 graphrag 的 BaseLLM、BaseTextEmbedding 接口，
+搜索引擎的构建方式不变。同步调用（DRIFT 的 HyDE 查询扩展等，包括同步流式生成）只按权重选择端点，不对冲，
+重试和熔断与异步调用相同。
+只配置一个端点时不对冲，重试和熔断仍然生效。
+"""
+
+import asyncio
+import functools
+import json
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import (
+    Any, AsyncGenerator, Awaitable, Callable, Collection, Deque, Dict, Generator, Generic, List, Optional, Sequence,
+    Tuple, TypeVar
+)
+
+import httpx
+import numpy as np
+import openai
+
+from graphrag.query.llm.base import BaseLLM, BaseTextEmbedding
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+@dataclass
+class EndpointConfig:
+    """一个上游端点"""
+    name: str
+    base_url: Optional[str]
+    api_key: Optional[str]
+    model: Optional[str]
+    embedding_model: Optional[str]
+
+
+def parse_endpoints(
+        value: Optional[str],
+        base_url: Optional[str],
+        api_key: Optional[str],
+        model: Optional[str],
+        embedding_model: Optional[str]
+) -> List[EndpointConfig]:
+    """解析 LLM_ENDPOINTS 配置
+
+    value 为 JSON 列表，每项包含 base_url、api_key，可选 name、model、embedding_model，
+    未指定的字段使用单端点配置（BASE_URL、API_KEY、MODEL）的值；未配置时只有单端点配置这一个端点。
+    各端点的向量共用一个索引和向量缓存，embedding_model 不同时抛出 ValueError。
+    """
+    items = json.loads(value) if value else [{}]
+    endpoints = [
+        EndpointConfig(
+            name=item.get('name') or f'endpoint-{i}',
+            base_url=item.get('base_url', base_url),
+            api_key=item.get('api_key', api_key),
+            model=item.get('model', model),
+            embedding_model=item.get('embedding_model', embedding_model),
+        )
+        for i, item in enumerate(items)
+    ]
+    embedding_models = {endpoint.embedding_model for endpoint in endpoints}
+    if len(embedding_models) > 1:
+        raise ValueError(f'All endpoints must use the same embedding model: {sorted(map(str, embedding_models))}')
+    return endpoints
+
+
+class EndpointStats:
+    """端点的延迟和错误率统计"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        # 成功请求延迟的指数移动平均，尚无样本时为None
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+
+    def observe(self, latency: float, ok: bool = True) -> None:
+        self.requests += 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if not ok:
+            self.errors += 1
+            return
+        self.observe_latency(latency)
+
+    def observe_latency(self, latency: float) -> None:
+        self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'inflight': self.inflight,
+            'requests': self.requests,
+            'errors': self.errors,
+        }
+
+
+class UpstreamUnavailableError(RuntimeError):
+    """所有端点的熔断器都处于打开状态，retry_after 秒后才会放行探测请求"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f'All upstream endpoints are unavailable (circuit open), retry after {retry_after:.1f}s')
+
+
+def is_retryable(error: BaseException) -> bool:
+    """限流、5xx、连接失败和超时可以重试，并计入熔断器的失败次数；请求本身的错误（400、401等）不重试"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (openai.APIError, httpx.TransportError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """端点熔断器
+
+    连续失败 failure_threshold 次后打开，recovery_time 秒内不放行请求；到期后进入半开状态，
+    放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+            self, failure_threshold: int = 5, recovery_time: float = 30.0, clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trips = 0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self._clock() - self.opened_at < self.recovery_time:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def available(self) -> bool:
+        """是否可以向该端点发送请求，半开状态下同时只放行一个探测请求"""
+        with self._lock:
+            state = self.state
+            return state == self.CLOSED or (state == self.HALF_OPEN and not self._probing)
+
+    def retry_after(self) -> float:
+        """距离放行探测请求的秒数"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.recovery_time - (self._clock() - self.opened_at))
+
+    def acquire(self) -> None:
+        """请求即将发往该端点，半开状态下该请求作为探测请求"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = True
+
+    def release(self) -> None:
+        """请求被取消，不影响熔断状态"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            # 打开期间到达的失败（打开前发出的请求）不延长打开时间
+            if self.state != self.OPEN and (self._probing or self.failures >= self.failure_threshold):
+                self.opened_at = self._clock()
+                self.trips += 1
+            self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'state': self.state, 'failures': self.failures, 'trips': self.trips, 'retry_after': self.retry_after()}
+
+
+class RetryBudget:
+    """进程级重试预算
+
+    每次成功调用存入 ratio 个重试名额，另外每秒匀速补充 min_per_second 个，名额最多累积 capacity 个；
+    每次重试取走一个名额，名额不足时不再重试。上游整体故障时成功调用很少，重试流量随之收缩。
+    """
+
+    def __init__(
+            self,
+            ratio: float = 0.1,
+            min_per_second: float = 1.0,
+            capacity: float = 10.0,
+            clock: Callable[[], float] = time.monotonic
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.balance = capacity
+        self._updated = clock()
+        self.withdrawn = 0
+        self.denied = 0
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.balance = min(self.capacity, self.balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._refill()
+            self.balance = min(self.capacity, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """取走一个重试名额，名额不足时返回False"""
+        with self._lock:
+            self._refill()
+            if self.balance < 1.0:
+                self.denied += 1
+                return False
+            self.balance -= 1.0
+            self.withdrawn += 1
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill()
+            return {'balance': self.balance, 'withdrawn': self.withdrawn, 'denied': self.denied}
+
+
+class LatencyRouter(Generic[T]):
+    """在多个端点之间按延迟和错误率加权路由，对慢请求发送对冲请求，失败时在重试预算内重试"""
+
+    def __init__(
+            self,
+            endpoints: Sequence[Tuple[str, T]],
+            hedge_quantile: float = 0.95,
+            hedge_ratio: float = 0.1,
+            min_samples: int = 20,
+            window: int = 500,
+            alpha: float = 0.2,
+            max_retries: int = 3,
+            backoff_base: float = 0.2,
+            backoff_max: float = 5.0,
+            failure_threshold: int = 5,
+            recovery_time: float = 30.0,
+            breakers: Optional[Dict[str, CircuitBreaker]] = None,
+            retry_budget: Optional[RetryBudget] = None,
+            seed: Optional[int] = None
+    ):
+        """初始化路由器
+
+        Args:
+            endpoints: (端点名称, 客户端) 列表
+            hedge_quantile: 请求耗时超过近期延迟的该分位数时发送对冲请求
+            hedge_ratio: 对冲请求数占总请求数的上限
+            min_samples: 延迟样本数达到该值后才开始对冲
+            window: 计算延迟分位数的近期样本数
+            alpha: 延迟和错误率 EWMA 的平滑系数
+            max_retries: 单次调用的最大重试次数
+            backoff_base: 第 n 次重试前在 [0, backoff_base * 2^(n-1)] 内随机等待
+            backoff_max: 重试前等待时间的上限
+            failure_threshold: 端点连续失败该次数后熔断
+            recovery_time: 熔断后经过该秒数放行探测请求
+            breakers: 端点名称到熔断器的映射，多个路由器共用同一组端点时传入同一组熔断器，未指定时按上面两个参数新建
+            retry_budget: 重试预算，多个路由器可以共用一个进程级预算
+            seed: 随机种子
+        """
+        if not endpoints:
+            raise ValueError('At least one endpoint is required')
+        self.endpoints = list(endpoints)
+        self.hedge_quantile = hedge_quantile
+        self.hedge_ratio = hedge_ratio
+        self.min_samples = min_samples
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {name: EndpointStats(alpha) for name, _ in self.endpoints}
+        breakers = breakers or {}
+        self.breakers = {
+            name: breakers.get(name) or CircuitBreaker(failure_threshold, recovery_time) for name, _ in self.endpoints
+        }
+        self.retry_budget = retry_budget or RetryBudget()
+        # 所有端点成功请求的近期延迟，用于计算对冲阈值
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def weight(self, name: str) -> float:
+        """端点权重：延迟越低、错误率越低、进行中的请求越少，权重越高"""
+        stats = self.stats[name]
+        known = [s.latency for s in self.stats.values() if s.latency is not None]
+        # 尚无延迟样本的端点按已知的最低延迟估计，保证新端点能被探测到
+        latency = stats.latency if stats.latency is not None else (min(known) if known else 1.0)
+        return (1.0 - min(stats.error_rate, 0.99)) ** 2 / (max(latency, 1e-3) * (1 + stats.inflight))
+
+    def _available(self, exclude: Collection[str] = ()) -> List[Tuple[str, T]]:
+        return [
+            endpoint for endpoint in self.endpoints
+            if endpoint[0] not in exclude and self.breakers[endpoint[0]].available()
+        ]
+
+    def _pick(self, candidates: List[Tuple[str, T]]) -> Tuple[str, T]:
+        with self._lock:
+            weights = [self.weight(name) for name, _ in candidates]
+            return self._random.choices(candidates, weights=weights)[0]
+
+    def choose(self, exclude: Collection[str] = ()) -> Tuple[str, T]:
+        """按权重选择熔断器未打开的端点，优先选择 exclude 以外的端点"""
+        candidates = self._available(exclude) or self._available()
+        if not candidates:
+            self.rejected += 1
+            raise UpstreamUnavailableError(self.retry_after())
+        return self._pick(candidates)
+
+    def retry_after(self) -> Optional[float]:
+        """所有端点的熔断器都打开时，返回距离最早放行探测请求的秒数；有可用端点时返回None"""
+        if self._available():
+            return None
+        return min(breaker.retry_after() for breaker in self.breakers.values())
+
+    def hedge_delay(self) -> Optional[float]:
+        """发送对冲请求前的等待时间，样本不足或只有一个端点时不对冲"""
+        if len(self.endpoints) < 2 or len(self._latencies) < self.min_samples:
+            return None
+        return float(np.quantile(self._latencies, self.hedge_quantile))
+
+    def _may_hedge(self) -> bool:
+        return self.hedges < self.hedge_ratio * self.requests
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次重试前的等待时间：指数退避加完全随机抖动，避免大量请求同时重试"""
+        return self._random.uniform(0.0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def _should_retry(self, error: BaseException, attempt: int) -> bool:
+        if attempt >= self.max_retries or not is_retryable(error):
+            return False
+        if not self.retry_budget.withdraw():
+            return False
+        self.retries += 1
+        return True
+
+    def _enter(self, name: str) -> EndpointStats:
+        self.breakers[name].acquire()
+        with self._lock:
+            self.stats[name].inflight += 1
+            return self.stats[name]
+
+    def _exit(self, name: str) -> None:
+        with self._lock:
+            self.stats[name].inflight -= 1
+
+    def _observe(self, name: str, latency: float, error: Optional[BaseException] = None) -> None:
+        # 请求本身的错误说明端点能正常响应，不计入熔断器的失败次数
+        if error is not None and is_retryable(error):
+            self.breakers[name].record_failure()
+        else:
+            self.breakers[name].record_success()
+        with self._lock:
+            self.stats[name].observe(latency, ok=error is None)
+            if error is None:
+                self._latencies.append(latency)
+
+    async def _attempt(self, endpoint: Tuple[str, T], func: Callable[[T], Awaitable[R]]) -> R:
+        name, client = endpoint
+        stats = self._enter(name)
+        start = time.perf_counter()
+        try:
+            result = await func(client)
+        except asyncio.CancelledError:
+            # 被对冲请求淘汰：实际延迟至少为已等待的时间，只计入该端点的延迟 EWMA
+            self.breakers[name].release()
+            with self._lock:
+                stats.observe_latency(time.perf_counter() - start)
+            raise
+        except Exception as e:
+            self._observe(name, time.perf_counter() - start, e)
+            raise
+        else:
+            self._observe(name, time.perf_counter() - start)
+            return result
+        finally:
+            self._exit(name)
+
+    async def call(self, func: Callable[[T], Awaitable[R]], discard: Optional[Callable[[R], None]] = None) -> R:
+        """在选中的端点上执行 func，失败时在重试预算内退避后重试，优先换用未尝试过的端点
+
+        discard 用于释放对冲中落败、但仍然成功返回的结果（如已经打开的上游流）。
+        """
+        self.requests += 1
+        tried: set = set()
+        attempt = 0
+        while True:
+            try:
+                result = await self._hedged(func, tried, discard)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                attempt += 1
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            self.retry_budget.deposit()
+            return result
+
+    async def _hedged(
+            self, func: Callable[[T], Awaitable[R]], tried: set, discard: Optional[Callable[[R], None]] = None
+    ) -> R:
+        """执行一次调用，超过对冲阈值时在另一个端点上同时执行，返回先成功的结果，都失败时抛出最后一个错误"""
+        primary = self.choose(exclude=tried)
+        tried.add(primary[0])
+        tasks = {asyncio.ensure_future(self._attempt(primary, func)): primary[0]}
+        delay = self.hedge_delay()
+        hedged = False
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 超过对冲阈值仍未返回，只向熔断器未打开的其他端点对冲
+                    delay = None
+                    candidates = self._available(exclude={primary[0]})
+                    if candidates and self._may_hedge():
+                        self.hedges += 1
+                        hedged = True
+                        endpoint = self._pick(candidates)
+                        tried.add(endpoint[0])
+                        tasks[asyncio.ensure_future(self._attempt(endpoint, func))] = endpoint[0]
+                    continue
+                for task in done:
+                    name = tasks.pop(task)
+                    if task.exception() is None:
+                        if hedged and name != primary[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+                if discard is not None:
+                    # 与胜出请求同时完成、或取消前已经完成的请求，其结果不会被使用
+                    task.add_done_callback(functools.partial(_discard_result, discard))
+
+    async def stream(self, func: Callable[[T], AsyncGenerator[str, None]]) -> AsyncGenerator[str, None]:
+        """流式调用：按首个片段的到达时间对冲和重试，胜出端点的流继续输出，另一个端点的流被取消"""
+
+        async def first(client: T) -> Tuple[AsyncGenerator[str, None], Optional[str]]:
+            generator = func(client)
+            try:
+                return generator, await generator.__anext__()
+            except StopAsyncIteration:
+                return generator, None
+            except BaseException:
+                # 被对冲请求淘汰或失败时关闭上游流
+                await generator.aclose()
+                raise
+
+        def discard(result: Tuple[AsyncGenerator[str, None], Optional[str]]) -> None:
+            asyncio.ensure_future(result[0].aclose())
+
+        generator, piece = await self.call(first, discard)
+        if piece is None:
+            return
+        try:
+            yield piece
+            async for piece in generator:
+                yield piece
+        finally:
+            await generator.aclose()
+
+    def stream_sync(self, func: Callable[[T], Generator[str, None, None]]) -> Generator[str, None, None]:
+        """同步流式调用：按首个片段的耗时统计延迟，首个片段之前失败时在重试预算内换用其他端点重试，不对冲"""
+
+        def first(client: T) -> Tuple[Generator[str, None, None], Optional[str]]:
+            generator = func(client)
+            try:
+                return generator, next(generator)
+            except StopIteration:
+                return generator, None
+            except BaseException:
+                generator.close()
+                raise
+
+        generator, piece = self.call_sync(first)
+        if piece is None:
+            return
+        try:
+            yield piece
+            yield from generator
+        finally:
+            generator.close()
+
+    def call_sync(self, func: Callable[[T], R]) -> R:
+        """同步调用：按权重选择端点，不对冲，失败时在重试预算内退避后重试"""
+        self.requests += 1
+        tried: set = set()
+        attempt = 0
+        while True:
+            name, client = self.choose(exclude=tried)
+            tried.add(name)
+            self._enter(name)
+            start = time.perf_counter()
+            try:
+                result = func(client)
+            except Exception as e:
+                self._observe(name, time.perf_counter() - start, e)
+                if not self._should_retry(e, attempt):
+                    raise
+                attempt += 1
+                time.sleep(self.backoff(attempt))
+                continue
+            finally:
+                self._exit(name)
+            self._observe(name, time.perf_counter() - start)
+            self.retry_budget.deposit()
+            return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各端点的延迟、错误率、当前权重和熔断状态，以及对冲、重试统计"""
+        with self._lock:
+            endpoints = {
+                name: {**self.stats[name].snapshot(), 'weight': self.weight(name)}
+                for name, _ in self.endpoints
+            }
+        for name, breaker in self.breakers.items():
+            endpoints[name]['circuit'] = breaker.snapshot()
+        return {
+            'endpoints': endpoints,
+            'hedge_delay': self.hedge_delay(),
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'retries': self.retries,
+            'rejected': self.rejected,
+            'retry_budget': self.retry_budget.snapshot(),
+        }
+
+
+def _discard_result(discard: Callable[[Any], None], task: asyncio.Future) -> None:
+    """释放已完成但未被使用的调用结果，失败或被取消的调用没有需要释放的结果"""
+    if not task.cancelled() and task.exception() is None:
+        discard(task.result())
+
+
+class RoutedChatLLM(BaseLLM):
+    """多端点对话模型
+
+    非流式和流式调用分别统计延迟（前者为完整耗时，后者为首个片段的耗时），两者共用各端点的熔断器。
+    """
+
+    def __init__(self, endpoints: Sequence[Tuple[str, BaseLLM]], **options: Any):
+        self.calls: LatencyRouter[BaseLLM] = LatencyRouter(endpoints, **options)
+        self.streams: LatencyRouter[BaseLLM] = LatencyRouter(endpoints, **{**options, 'breakers': self.calls.breakers})
+
+    def __getattr__(self, name: str) -> Any:
+        # 其余属性（model 等）使用第一个端点的值
+        if name in ('calls', 'streams'):
+            raise AttributeError(name)
+        return getattr(self.calls.endpoints[0][1], name)
+
+    def generate(self, messages: Any, streaming: bool = True, callbacks: Optional[List[Any]] = None, **kwargs: Any) -> str:
+        return self.calls.call_sync(
+            lambda llm: llm.generate(messages, streaming=streaming, callbacks=callbacks, **kwargs)
+        )
+
+    def stream_generate(self, messages: Any, callbacks: Optional[List[Any]] = None, **kwargs: Any) -> Generator[str, None, None]:
+        yield from self.streams.stream_sync(
+            lambda llm: llm.stream_generate(messages, callbacks=callbacks, **kwargs)
+        )
+
+    async def agenerate(
+            self, messages: Any, streaming: bool = True, callbacks: Optional[List[Any]] = None, **kwargs: Any
+    ) -> str:
+        # 对冲时两个请求都会回调 on_llm_new_token，回调只用于计时和进度展示，回答以胜出请求的结果为准
+        return await self.calls.call(
+            lambda llm: llm.agenerate(messages, streaming=streaming, callbacks=callbacks, **kwargs)
+        )
+
+    async def astream_generate(
+            self, messages: Any, callbacks: Optional[List[Any]] = None, **kwargs: Any
+    ) -> AsyncGenerator[str, None]:
+        async for piece in self.streams.stream(
+                lambda llm: llm.astream_generate(messages, callbacks=callbacks, **kwargs)
+        ):
+            yield piece
+
+    def retry_after(self) -> Optional[float]:
+        """所有端点的熔断器都打开时返回距离放行探测请求的秒数，否则返回None，供调用方在排队前快速失败"""
+        return self.calls.retry_after()
+
+    async def aclose(self) -> None:
+        """关闭各端点的异步客户端连接池"""
+        for _, llm in self.calls.endpoints:
+            client = getattr(llm, 'async_client', None)
+            if client is not None:
+                await client.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'calls': self.calls.snapshot(), 'streams': self.streams.snapshot()}
+
+
+class RoutedTextEmbedding(BaseTextEmbedding):
+    """多端点向量模型，各端点需使用相同的向量模型（parse_endpoints 校验），向量缓存按第一个端点的模型名区分"""
+
+    def __init__(self, endpoints: Sequence[Tuple[str, BaseTextEmbedding]], **options: Any):
+        self.router: LatencyRouter[BaseTextEmbedding] = LatencyRouter(endpoints, **options)
+
+    def __getattr__(self, name: str) -> Any:
+        # model、max_tokens、token_encoder、sync_client（社区报告批量向量化）等使用第一个端点
+        if name == 'router':
+            raise AttributeError(name)
+        return getattr(self.router.endpoints[0][1], name)
+
+    def retry_after(self) -> Optional[float]:
+        return self.router.retry_after()
+
+    def embed(self, text: str, **kwargs: Any) -> List[float]:
+        return self.router.call_sync(lambda embedder: embedder.embed(text, **kwargs))
+
+    async def aembed(self, text: str, **kwargs: Any) -> List[float]:
+        return await self.router.call(lambda embedder: embedder.aembed(text, **kwargs))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self.router.snapshot()
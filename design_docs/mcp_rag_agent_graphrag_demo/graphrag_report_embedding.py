@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""社区报告批量向量化
+
+报告按 batch_size 条一批调用向量接口（每个请求携带多条输入），最多 concurrency 批同时请求。
+每批完成后立即写入持久化向量缓存，缓存即检查点：进程中断后重新运行会跳过已完成的报告。
+已有向量文件中内容哈希未变化的报告直接复用原向量，只对新增或内容变化的报告重新计算。
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from graphrag.query.llm.text_utils import chunk_text
+
+from graphrag_dataset import COMMUNITY_REPORT_TABLE, content_hash
+from graphrag_embedding_cache import CachedTextEmbedding
+
+
+def embed_texts(
+        embedder: CachedTextEmbedding,
+        texts: Sequence[str],
+        batch_size: int = 16,
+        concurrency: int = 4,
+        max_retries: int = 3
+) -> List[List[float]]:
+    '''批量计算文本向量，已缓存的文本不再请求向量接口
+
+    查询路径上的客户端不自行重试（由路由器在重试预算内重试），批量向量化是离线任务，由客户端按 max_retries 重试。
+    '''
+    vectors: List[Optional[List[float]]] = [embedder.get(text) for text in texts]
+    pending = [i for i, vector in enumerate(vectors) if vector is None]
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    client = embedder.sync_client.with_options(max_retries=max_retries)
+
+    def embed_batch(batch: List[int]) -> Dict[int, List[float]]:
+        # 超过 max_tokens 的文本先切块，再按块长度加权平均，与 OpenAIEmbedding.embed 的结果一致
+        chunks, owners = [], []
+        for i in batch:
+            for chunk in chunk_text(texts[i], embedder.max_tokens, embedder.token_encoder):
+                chunks.append(chunk)
+                owners.append(i)
+        response = client.embeddings.create(input=chunks, model=embedder.model)
+        chunk_vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+        results = {}
+        for i in batch:
+            indices = [j for j, owner in enumerate(owners) if owner == i]
+            vector = np.average(
+                [chunk_vectors[j] for j in indices], axis=0, weights=[len(chunks[j]) for j in indices]
+            )
+            results[i] = (vector / np.linalg.norm(vector)).tolist()
+            embedder.put(texts[i], results[i])
+        return results
+
+    # 引擎构建在工作线程中执行，这里用线程池并发请求，避免与应用事件循环共享异步客户端
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='report-embedding') as pool:
+        for done, results in enumerate(pool.map(embed_batch, batches), start=1):
+            for i, vector in results.items():
+                vectors[i] = vector
+            print(f'Embedded batch {done}/{len(batches)}')
+    return vectors
+
+
+def embed_community_reports(
+        input_dir: str,
+        embedder: CachedTextEmbedding,
+        community_report_table: str = COMMUNITY_REPORT_TABLE,
+        batch_size: int = 16,
+        concurrency: int = 4,
+        max_retries: int = 3
+) -> pd.DataFrame:
+    '''Embeds the full content of the community reports and saves the DataFrame with embeddings to the output path.
+
+    只对新增或 full_content 发生变化的报告重新计算向量。
+    '''
+    input_path = Path(input_dir) / f'{community_report_table}.parquet'
+    output_path = Path(input_dir) / f'{community_report_table}_with_embeddings.parquet'
+
+    report_df = pd.read_parquet(input_path)
+    if 'full_content' not in report_df.columns:
+        error_msg = f"'full_content' column not found in {input_path}"
+        raise ValueError(error_msg)
+
+    hashes = report_df['full_content'].map(content_hash).tolist()
+    previous = {}
+    if output_path.exists():
+        previous_df = pd.read_parquet(output_path, columns=['full_content', 'full_content_embeddings'])
+        previous = dict(zip(
+            previous_df['full_content'].map(content_hash), previous_df['full_content_embeddings']
+        ))
+
+    missing = [i for i, digest in enumerate(hashes) if digest not in previous]
+    print(f'Community reports to embed: {len(missing)}/{len(report_df)}')
+    embeddings = [previous.get(digest) for digest in hashes]
+    if missing:
+        vectors = embed_texts(
+            embedder,
+            report_df['full_content'].iloc[missing].tolist(),
+            batch_size=batch_size,
+            concurrency=concurrency,
+            max_retries=max_retries,
+        )
+        for i, vector in zip(missing, vectors):
+            embeddings[i] = vector
+    report_df['full_content_embeddings'] = embeddings
+
+    # 先写临时文件再替换，避免中断时留下不完整的向量文件
+    tmp_path = output_path.with_suffix('.parquet.tmp')
+    report_df.to_parquet(tmp_path)
+    os.replace(tmp_path, output_path)
+    print(f'Embeddings saved to {output_path}')
+    return report_df
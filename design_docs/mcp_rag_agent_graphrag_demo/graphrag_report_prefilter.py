@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""全局搜索 map 阶段的社区报告预筛选
+
+全局搜索默认把该社区层级的所有报告分批交给 map 阶段，报告越多 LLM 调用次数越多，其中大部分报告与查询无关。
+这里在构建上下文之前先做一次廉价的预筛选：用查询向量和社区报告全文向量（DRIFT 搜索使用的 full_content_embeddings）
+计算余弦相似度，只把最相关的 top_n 个报告交给 map 阶段。预筛选只需要一次查询向量化，不调用 LLM。
+
+预筛选通过 GlobalCommunityContext 的 dynamic_community_selection 接入：
+    context_builder.dynamic_community_selection = EmbeddingCommunitySelection(reports, text_embedder, top_n=20)
+
+以下情况不筛选，使用全部报告：top_n 不大于 0、报告数不超过 top_n、查询向量化失败。
+没有向量的报告（向量文件落后于报告表）排在所有有向量的报告之后。
+"""
+
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from graphrag.model.community_report import CommunityReport
+
+logger = logging.getLogger(__name__)
+
+_NO_LLM_USAGE = {'llm_calls': 0, 'prompt_tokens': 0, 'output_tokens': 0}
+
+
+class EmbeddingCommunitySelection:
+    """按查询与社区报告全文向量的相似度选出最相关的 top_n 个报告"""
+
+    def __init__(self, community_reports: List[CommunityReport], text_embedder: Any, top_n: int = 20):
+        """初始化预筛选
+
+        Args:
+            community_reports: 该社区层级的社区报告，需要带 full_content_embedding
+            text_embedder: 查询向量化使用的向量模型
+            top_n: 交给 map 阶段的报告数，不大于 0 时不筛选
+        """
+        self.community_reports = community_reports
+        self.text_embedder = text_embedder
+        self.top_n = top_n
+
+        embedded = [
+            index for index, report in enumerate(community_reports) if report.full_content_embedding is not None
+        ]
+        self._embedded_index = np.asarray(embedded, dtype=np.int64)
+        self._missing_index = np.asarray(
+            sorted(set(range(len(community_reports))) - set(embedded)), dtype=np.int64
+        )
+        if embedded:
+            matrix = np.asarray(
+                [community_reports[index].full_content_embedding for index in embedded], dtype=np.float32
+            )
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.where(norms == 0, 1, norms)
+        else:
+            self._matrix = np.empty((0, 0), dtype=np.float32)
+
+    def enabled(self) -> bool:
+        return 0 < self.top_n < len(self.community_reports) and len(self._embedded_index) > 0
+
+    def rank(self, query_embedding: Any) -> np.ndarray:
+        """按相似度从高到低排列的报告下标，没有向量的报告排在最后"""
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        scores = self._matrix @ (vector / norm if norm else vector)
+        order = self._embedded_index[np.argsort(-scores, kind='stable')]
+        return np.concatenate([order, self._missing_index])
+
+    async def select(self, query: str) -> Tuple[List[CommunityReport], Dict[str, Any]]:
+        if not self.enabled():
+            return self.community_reports, dict(_NO_LLM_USAGE)
+        try:
+            query_embedding = await self.text_embedder.aembed(query)
+        except Exception as e:
+            logger.warning('Report prefilter skipped, failed to embed query: %s', e)
+            return self.community_reports, dict(_NO_LLM_USAGE)
+        # 保持报告原有的顺序，build_community_context 会按排名和权重重新排序
+        selected = np.sort(self.rank(query_embedding)[:self.top_n])
+        return [self.community_reports[index] for index in selected], dict(_NO_LLM_USAGE)
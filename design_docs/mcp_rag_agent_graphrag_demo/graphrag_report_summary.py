@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""社区报告摘要
+
+全局搜索的 map 阶段默认把社区报告全文（full_content）交给 LLM，每个报告上千 token。
+这里离线为每个报告生成紧凑摘要：标题、报告自带的 summary 和各条发现（findings）的标题，去掉发现的详细说明，
+连同摘要和全文的 token 数一起写入 create_final_community_reports_summaries.parquet。
+内容哈希未变化的报告直接复用已有的摘要，只处理新增或内容变化的报告。
+
+全局搜索按请求的档位选择报告全文或摘要：
+- quality：报告全文，回答质量最好
+- fast：紧凑摘要，map 阶段的 prompt token 数和 LLM 调用次数大幅减少
+- auto：该社区层级所有报告全文的 token 数不超过 full_content_max_tokens 时用全文，否则用摘要
+
+使用示例:
+    python graphrag_report_summary.py ./doupocangqiong/output
+"""
+
+import argparse
+import os
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+import tiktoken
+
+from graphrag.query.structured_search.global_search.search import GlobalSearch
+
+from graphrag_dataset import COMMUNITY_REPORT_SUMMARY_TABLE, COMMUNITY_REPORT_TABLE, content_hash
+
+# 全局搜索的报告档位
+REPORT_PROFILES = ('quality', 'fast', 'auto')
+
+SUMMARY_COLUMNS = ['id', 'content_hash', 'compact_summary', 'summary_tokens', 'full_content_tokens']
+
+
+def compact_summary(title: str, summary: str, findings: Any) -> str:
+    """标题、报告摘要和各条发现的标题"""
+    parts = [f'# {title}', summary]
+    headlines = [finding.get('summary') for finding in (findings if findings is not None else [])]
+    headlines = [headline for headline in headlines if headline]
+    if headlines:
+        parts.append('\n'.join(f'- {headline}' for headline in headlines))
+    return '\n\n'.join(part for part in parts if part)
+
+
+def summarize_community_reports(
+        input_dir: str,
+        token_encoder: Any,
+        community_report_table: str = COMMUNITY_REPORT_TABLE
+) -> pd.DataFrame:
+    """为社区报告生成紧凑摘要和 token 数，保存到 {community_report_table}_summaries.parquet
+
+    只处理新增或 full_content 发生变化的报告。
+    """
+    input_path = Path(input_dir) / f'{community_report_table}.parquet'
+    output_path = Path(input_dir) / f'{community_report_table}_summaries.parquet'
+
+    report_df = pd.read_parquet(input_path, columns=['id', 'title', 'summary', 'findings', 'full_content'])
+    hashes = report_df['full_content'].map(content_hash)
+    previous: Dict[str, Tuple[str, int, int]] = {}
+    if output_path.exists():
+        previous_df = pd.read_parquet(output_path, columns=SUMMARY_COLUMNS)
+        previous = {
+            row.content_hash: (row.compact_summary, row.summary_tokens, row.full_content_tokens)
+            for row in previous_df.itertuples(index=False)
+        }
+
+    rows = []
+    for report, digest in zip(report_df.itertuples(index=False), hashes):
+        if digest not in previous:
+            summary = compact_summary(report.title, report.summary, report.findings)
+            previous[digest] = (
+                summary, len(token_encoder.encode(summary)), len(token_encoder.encode(report.full_content))
+            )
+        rows.append((report.id, digest, *previous[digest]))
+    summary_df = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+    # 先写临时文件再替换，避免中断时留下不完整的摘要文件
+    tmp_path = output_path.with_suffix('.parquet.tmp')
+    summary_df.to_parquet(tmp_path)
+    os.replace(tmp_path, output_path)
+    print(
+        f'Community report summaries saved to {output_path}: '
+        f'{summary_df["summary_tokens"].sum()} tokens (full content {summary_df["full_content_tokens"].sum()})'
+    )
+    return summary_df
+
+
+# 当前请求使用的 (搜索引擎, 上下文参数)
+_request_params: ContextVar[Optional[Tuple[Any, Dict[str, Any]]]] = ContextVar(
+    'global_search_request_params', default=None
+)
+
+
+class ProfiledGlobalSearch(GlobalSearch):
+    """按请求的档位选择社区报告全文或摘要的全局搜索"""
+
+    def __init__(
+            self,
+            *args: Any,
+            default_profile: str = 'auto',
+            full_content_tokens: int = 0,
+            full_content_max_tokens: int = 12_000,
+            **kwargs: Any
+    ):
+        """初始化全局搜索
+
+        Args:
+            default_profile: 请求未指定档位时使用的档位
+            full_content_tokens: 该社区层级所有报告全文的 token 数
+            full_content_max_tokens: auto 档位下使用报告全文的 token 数上限
+            其余参数同 GlobalSearch
+        """
+        if default_profile not in REPORT_PROFILES:
+            raise ValueError(f'Unknown report profile: {default_profile}')
+        self.default_profile = default_profile
+        self.full_content_tokens = full_content_tokens
+        self.full_content_max_tokens = full_content_max_tokens
+        super().__init__(*args, **kwargs)
+
+    @property
+    def context_builder_params(self) -> Dict[str, Any]:
+        active = _request_params.get()
+        if active is not None and active[0] is self:
+            return active[1]
+        return self.context_params_for(None)
+
+    @context_builder_params.setter
+    def context_builder_params(self, value: Dict[str, Any]) -> None:
+        self._base_params = value
+
+    def resolve_profile(self, profile: Optional[str] = None) -> str:
+        """把档位解析为 quality 或 fast"""
+        profile = profile or self.default_profile
+        if profile not in REPORT_PROFILES:
+            raise ValueError(f'Unknown report profile: {profile}')
+        if profile == 'auto':
+            return 'quality' if self.full_content_tokens <= self.full_content_max_tokens else 'fast'
+        return profile
+
+    def context_params_for(self, profile: Optional[str] = None) -> Dict[str, Any]:
+        """指定档位下的上下文参数，也用于区分不同档位的缓存"""
+        return {**self._base_params, 'use_community_summary': self.resolve_profile(profile) == 'fast'}
+
+    async def asearch(self, query: str, conversation_history: Any = None, profile: Optional[str] = None, **kwargs: Any):
+        token = _request_params.set((self, self.context_params_for(profile)))
+        try:
+            return await super().asearch(query, conversation_history, **kwargs)
+        finally:
+            _request_params.reset(token)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='为社区报告生成紧凑摘要和 token 数')
+    parser.add_argument('input_dir', help='GraphRAG 索引的 output 目录')
+    args = parser.parse_args()
+    summarize_community_reports(args.input_dir, tiktoken.get_encoding('cl100k_base'))
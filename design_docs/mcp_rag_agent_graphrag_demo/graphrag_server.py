@@ -2,22 +2,15 @@
 # coding=utf-8
 
 import asyncio
+import logging
 import os
 from collections.abc import AsyncGenerator
-from pathlib import Path
 
 import pandas as pd
 import tiktoken
 
+from graphrag.query.context_builder.community_context import build_community_context
 from graphrag.query.context_builder.entity_extraction import EntityVectorStoreKey
-from graphrag.query.indexer_adapters import (
-    read_indexer_entities,
-    read_indexer_communities,
-    read_indexer_reports,
-    read_indexer_text_units,
-    read_indexer_relationships,
-    # read_indexer_covariates,
-)
 from graphrag.query.llm.oai.chat_openai import ChatOpenAI
 from graphrag.query.llm.oai.embedding import OpenAIEmbedding
 from graphrag.query.llm.oai.typing import OpenaiApiType
@@ -26,27 +19,39 @@ from graphrag.query.structured_search.base import SearchResult
 from graphrag.query.structured_search.drift_search.drift_context import DRIFTSearchContextBuilder
 from graphrag.query.structured_search.drift_search.search import DRIFTSearch
 from graphrag.query.structured_search.global_search.community_context import GlobalCommunityContext
-from graphrag.query.structured_search.global_search.search import GlobalSearch, GlobalSearchResult
+from graphrag.query.structured_search.global_search.search import GlobalSearchResult
 from graphrag.query.structured_search.local_search.mixed_context import LocalSearchMixedContext
 from graphrag.query.structured_search.local_search.search import LocalSearch
-from graphrag.vector_stores.lancedb import LanceDBVectorStore
+from graphrag_dataset import (
+    ENTITY_NODES_TABLE,
+    ENTITY_EMBEDDING_TABLE,
+    COMMUNITIES_TABLE,
+    COMMUNITY_REPORT_TABLE,
+    COMMUNITY_REPORT_EMBEDDING_TABLE,
+    COMMUNITY_REPORT_SUMMARY_TABLE,
+    ENTITY_DESCRIPTION_COLLECTION,
+    TEXT_UNIT_TABLE,
+    RELATIONSHIP_TABLE,
+    GraphRAGDataset,
+)
+from graphrag_embedding_cache import CachedTextEmbedding
+from graphrag_http import HTTPPoolConfig, SharedHTTPClients
+from graphrag_llm_router import RetryBudget, RoutedChatLLM, RoutedTextEmbedding, parse_endpoints
+from graphrag_report_embedding import embed_community_reports
+from graphrag_report_prefilter import EmbeddingCommunitySelection
+from graphrag_report_summary import ProfiledGlobalSearch, summarize_community_reports
+from graphrag_token_cache import CachedTokenEncoder
 from dotenv import load_dotenv
 import os
 # 加载 .env 文件中的环境变量，使用绝对路径确保正确加载
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
 
-ENTITY_NODES_TABLE = 'create_final_nodes'
-ENTITY_EMBEDDING_TABLE = 'create_final_entities'
-COMMUNITIES_TABLE = 'create_final_communities'
-COMMUNITY_REPORT_TABLE = 'create_final_community_reports'
-TEXT_UNIT_TABLE = 'create_final_text_units'
-RELATIONSHIP_TABLE = 'create_final_relationships'
-# COVARIATE_TABLE = 'create_final_covariates'
-
 # community level in the Leiden community hierarchy from which we will load the community reports
 # higher value means we use reports from more fine-grained communities (at the cost of higher computation cost)
 COMMUNITY_LEVEL = 2
 
+logger = logging.getLogger(__name__)
+
 api_type = OpenaiApiType.OpenAI
 
 
@@ -56,9 +61,8 @@ api_key  = os.getenv('API_KEY')
 api_base = os.getenv('BASE_URL')
 llm_model = os.getenv("MODEL")
 
-print("api_key----------:",api_key)
-print("api_base---------:",api_base)
-print("llm_model:-------:",llm_model)
+# 不输出 API Key
+logger.debug('LLM api_base: %s, model: %s', api_base, llm_model)
 embedding_model = 'text-embedding-v2'
 llm_temperature = 0.0
 json_mode = False
@@ -68,6 +72,45 @@ import os
 DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'doupocangqiong', 'output')
 LANCEDB_URI = f'{DATA_DIR}/lancedb'
 
+# 默认语料的索引数据集，所有搜索引擎共享，每张表只加载一次；
+# 各 build_* 函数也可以传入其他语料的数据集，同一进程服务多个语料
+dataset = GraphRAGDataset(DATA_DIR)
+
+# 查询向量缓存文件，与索引阶段的 cache/text_embedding 目录放在一起
+EMBEDDING_CACHE_PATH = os.getenv(
+    'EMBEDDING_CACHE_PATH',
+    os.path.join(os.path.dirname(DATA_DIR), 'cache', 'query_embedding', 'embeddings.sqlite')
+)
+
+# 社区报告向量化：每个请求携带的报告数和同时进行的请求数
+REPORT_EMBEDDING_BATCH_SIZE = int(os.getenv('REPORT_EMBEDDING_BATCH_SIZE', '16'))
+REPORT_EMBEDDING_CONCURRENCY = int(os.getenv('REPORT_EMBEDDING_CONCURRENCY', '4'))
+
+# 全局搜索默认的社区报告档位：quality 使用报告全文，fast 使用离线生成的紧凑摘要，
+# auto 在该社区层级报告全文的总 token 数不超过 GLOBAL_FULL_CONTENT_MAX_TOKENS 时使用全文，否则使用摘要
+GLOBAL_REPORT_PROFILE = os.getenv('GLOBAL_REPORT_PROFILE', 'auto')
+GLOBAL_FULL_CONTENT_MAX_TOKENS = int(os.getenv('GLOBAL_FULL_CONTENT_MAX_TOKENS', '12000'))
+# 全局搜索 map 阶段的报告预筛选：按查询与报告全文向量的相似度只保留最相关的 GLOBAL_MAP_TOP_N 个报告，0 表示不筛选
+GLOBAL_MAP_TOP_N = int(os.getenv('GLOBAL_MAP_TOP_N', '0'))
+
+# 上游调用失败时的最大重试次数，由路由器统一重试（客户端自身不重试），重试前指数退避加随机抖动；
+# 重试次数过大会在上游变慢时成倍放大负载
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+# 进程级重试预算：每次成功调用补充 LLM_RETRY_BUDGET_RATIO 个重试名额，另外每秒补充 LLM_RETRY_BUDGET_MIN 个
+LLM_RETRY_BUDGET_RATIO = float(os.getenv('LLM_RETRY_BUDGET_RATIO', '0.1'))
+LLM_RETRY_BUDGET_MIN = float(os.getenv('LLM_RETRY_BUDGET_MIN', '1'))
+# 端点连续失败 LLM_BREAKER_FAILURES 次后熔断，LLM_BREAKER_RECOVERY 秒后放行一个探测请求
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_RECOVERY = float(os.getenv('LLM_BREAKER_RECOVERY', '30'))
+
+# 多个上游端点（不同的 API Key、网关），JSON 列表，如
+# [{"name": "a", "base_url": "https://...", "api_key": "sk-a"}, {"name": "b", "base_url": "https://...", "api_key": "sk-b"}]
+# 未指定的 model、embedding_model 等字段使用上面的单端点配置；未配置时只使用 BASE_URL、API_KEY 一个端点
+LLM_ENDPOINTS = parse_endpoints(os.getenv('LLM_ENDPOINTS'), api_base, api_key, llm_model, embedding_model)
+# 请求耗时超过近期延迟的该分位数时向另一个端点发送对冲请求，对冲请求数不超过总请求数的 LLM_HEDGE_RATIO
+LLM_HEDGE_QUANTILE = float(os.getenv('LLM_HEDGE_QUANTILE', '0.95'))
+LLM_HEDGE_RATIO = float(os.getenv('LLM_HEDGE_RATIO', '0.1'))
+
 # Ollama
 # api_key = ''
 # api_base = 'http://localhost:11434/v1'
@@ -77,26 +120,59 @@ LANCEDB_URI = f'{DATA_DIR}/lancedb'
 # json_mode = True
 
 
-llm = ChatOpenAI(
-    api_key=api_key,
-    api_type=api_type,  # OpenaiApiType.OpenAI or OpenaiApiType.AzureOpenAI
-    api_base=api_base,
-    api_version='2024-02-15-preview',  # just for AzureOpenAI
-    model=llm_model,
-    max_retries=20
+# 所有端点的对话和向量模型客户端共用一个连接池：长连接复用、出站连接数上限、DNS 缓存，
+# 配置见 HTTPPoolConfig.from_env（HTTP_MAX_CONNECTIONS、HTTP_MAX_KEEPALIVE、HTTP_KEEPALIVE_EXPIRY、HTTP2、HTTP_DNS_CACHE_TTL）
+http_clients = SharedHTTPClients(HTTPPoolConfig.from_env())
+
+# 对话和向量请求共用一个重试预算
+retry_budget = RetryBudget(ratio=LLM_RETRY_BUDGET_RATIO, min_per_second=LLM_RETRY_BUDGET_MIN)
+router_options = {
+    'hedge_quantile': LLM_HEDGE_QUANTILE,
+    'hedge_ratio': LLM_HEDGE_RATIO,
+    'max_retries': LLM_MAX_RETRIES,
+    'failure_threshold': LLM_BREAKER_FAILURES,
+    'recovery_time': LLM_BREAKER_RECOVERY,
+    'retry_budget': retry_budget,
+}
+
+# 按各端点的延迟和错误率加权路由，慢请求向另一个端点发送对冲请求
+llm = RoutedChatLLM(
+    [
+        (endpoint.name, http_clients.share_with(ChatOpenAI(
+            api_key=endpoint.api_key,
+            api_type=api_type,  # OpenaiApiType.OpenAI or OpenaiApiType.AzureOpenAI
+            api_base=endpoint.base_url,
+            api_version='2024-02-15-preview',  # just for AzureOpenAI
+            model=endpoint.model,
+            max_retries=0
+        )))
+        for endpoint in LLM_ENDPOINTS
+    ],
+    **router_options
 )
 
-text_embedder = OpenAIEmbedding(
-    api_key=api_key,
-    api_type=api_type,  # OpenaiApiType.OpenAI or OpenaiApiType.AzureOpenAI
-    api_base=api_base,  # http://localhost:11434/api for Ollama
-    api_version='2024-02-15-preview',  # just for AzureOpenAI
-    model=embedding_model,
-    deployment_name=embedding_model,  # just for AzureOpenAI
-    max_retries=20
+# 按 (模型名, 文本哈希) 缓存向量，重复文本不再请求向量接口
+text_embedder = CachedTextEmbedding(
+    RoutedTextEmbedding(
+        [
+            (endpoint.name, http_clients.share_with(OpenAIEmbedding(
+                api_key=endpoint.api_key,
+                api_type=api_type,  # OpenaiApiType.OpenAI or OpenaiApiType.AzureOpenAI
+                api_base=endpoint.base_url,  # http://localhost:11434/api for Ollama
+                api_version='2024-02-15-preview',  # just for AzureOpenAI
+                model=endpoint.embedding_model,
+                deployment_name=endpoint.embedding_model,  # just for AzureOpenAI
+                max_retries=0
+            )))
+            for endpoint in LLM_ENDPOINTS
+        ],
+        **router_options
+    ),
+    cache_path=EMBEDDING_CACHE_PATH
 )
 
-token_encoder = tiktoken.get_encoding('cl100k_base')
+# 按文本缓存编码结果，上下文构建时的 token 计数不再重复做 BPE 编码
+token_encoder = CachedTokenEncoder(tiktoken.get_encoding('cl100k_base'))
 
 local_context_params = {
     'text_unit_prop': 0.5,
@@ -120,6 +196,7 @@ local_context_params = {
 
 global_context_params = {
     # False means using full community reports. True means using community short summaries.
+    # 全局搜索按请求的档位（GLOBAL_REPORT_PROFILE）覆盖该参数
     'use_community_summary': False,
     'shuffle_data': True,
     'include_community_rank': True,
@@ -159,26 +236,16 @@ reduce_llm_params = {
 }
 
 
-def build_local_context_builder() -> LocalSearchMixedContext:
-    entity_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_NODES_TABLE}.parquet')
-    entity_embedding_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_EMBEDDING_TABLE}.parquet')
+def build_local_context_builder(dataset: GraphRAGDataset = dataset) -> LocalSearchMixedContext:
+    entities = dataset.entities(COMMUNITY_LEVEL)
 
-    entities = read_indexer_entities(entity_df, entity_embedding_df, COMMUNITY_LEVEL)
+    # 实体描述向量加载到进程内向量库，所有搜索引擎共享，不再每次构建都打开 LanceDB
+    description_embedding_store = dataset.vector_store(ENTITY_DESCRIPTION_COLLECTION)
 
-    # load description embeddings to an in-memory lancedb vectorstore
-    # to connect to a remote db, specify url and port values.
-    description_embedding_store = LanceDBVectorStore(
-        collection_name='default-entity-description',
-    )
-    description_embedding_store.connect(db_uri=LANCEDB_URI)
-
-    print(f'Entity count: {len(entity_df)}')
-    entity_df.head()
+    print(f'Entity count: {dataset.num_rows(ENTITY_NODES_TABLE)}')
 
-    relationship_df = pd.read_parquet(f'{DATA_DIR}/{RELATIONSHIP_TABLE}.parquet')
-    relationships = read_indexer_relationships(relationship_df)
-    print(f'Relationship count: {len(relationship_df)}')
-    relationship_df.head()
+    relationships = dataset.relationships()
+    print(f'Relationship count: {len(relationships)}')
 
     # NOTE: covariates are turned off by default, because they generally need prompt tuning to be valuable
     # Please see the GRAPHRAG_CLAIM_* settings
@@ -187,15 +254,11 @@ def build_local_context_builder() -> LocalSearchMixedContext:
     # logger.info(f'Claim records: {len(claims)}')
     # covariates = {'claims': claims}
 
-    report_df = pd.read_parquet(f'{DATA_DIR}/{COMMUNITY_REPORT_TABLE}.parquet')
-    reports = read_indexer_reports(report_df, entity_df, COMMUNITY_LEVEL)
-    print(f'Report records: {len(report_df)}')
-    report_df.head()
+    reports = dataset.reports(COMMUNITY_LEVEL)
+    print(f'Report records: {dataset.num_rows(COMMUNITY_REPORT_TABLE)}')
 
-    text_unit_df = pd.read_parquet(f'{DATA_DIR}/{TEXT_UNIT_TABLE}.parquet')
-    text_units = read_indexer_text_units(text_unit_df)
-    print(f'Text unit records: {len(text_unit_df)}')
-    text_unit_df.head()
+    text_units = dataset.text_units()
+    print(f'Text unit records: {len(text_units)}')
 
     context_builder = LocalSearchMixedContext(
         community_reports=reports,
@@ -218,10 +281,10 @@ def build_local_context_builder() -> LocalSearchMixedContext:
     return context_builder
 
 
-def build_local_search_engine() -> LocalSearch:
+def build_local_search_engine(dataset: GraphRAGDataset = dataset) -> LocalSearch:
     return LocalSearch(
         llm=llm,
-        context_builder=build_local_context_builder(),
+        context_builder=build_local_context_builder(dataset),
         token_encoder=token_encoder,
         llm_params=llm_params,
         context_builder_params=local_context_params,
@@ -232,28 +295,51 @@ def build_local_search_engine() -> LocalSearch:
     )
 
 
-def build_local_question_gen() -> LocalQuestionGen:
+def build_local_question_gen(dataset: GraphRAGDataset = dataset) -> LocalQuestionGen:
     return LocalQuestionGen(
         llm=llm,
-        context_builder=build_local_context_builder(),
+        context_builder=build_local_context_builder(dataset),
         token_encoder=token_encoder,
         llm_params=llm_params,
         context_builder_params=local_context_params
     )
 
 
-def build_global_search_engine() -> GlobalSearch:
-    community_df = pd.read_parquet(f'{DATA_DIR}/{COMMUNITIES_TABLE}.parquet')
-    entity_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_NODES_TABLE}.parquet')
-    report_df = pd.read_parquet(f'{DATA_DIR}/{COMMUNITY_REPORT_TABLE}.parquet')
-    entity_embedding_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_EMBEDDING_TABLE}.parquet')
+def ensure_report_embeddings(dataset: GraphRAGDataset = dataset) -> None:
+    """向量文件不存在或社区报告表更新后，只对内容变化的报告重新计算向量"""
+    if not dataset.has_table(COMMUNITY_REPORT_EMBEDDING_TABLE) or (
+            os.path.getmtime(dataset.table_path(COMMUNITY_REPORT_TABLE))
+            > os.path.getmtime(dataset.table_path(COMMUNITY_REPORT_EMBEDDING_TABLE))
+    ):
+        embed_community_reports(
+            dataset.data_dir,
+            text_embedder,
+            batch_size=REPORT_EMBEDDING_BATCH_SIZE,
+            concurrency=REPORT_EMBEDDING_CONCURRENCY,
+            max_retries=LLM_MAX_RETRIES
+        )
+
 
-    communities = read_indexer_communities(community_df, entity_df, report_df)
-    reports = read_indexer_reports(report_df, entity_df, COMMUNITY_LEVEL)
-    entities = read_indexer_entities(entity_df, entity_embedding_df, COMMUNITY_LEVEL)
-    print(f'Total report count: {len(report_df)}')
+def build_global_search_engine(
+        concurrent_coroutines: int = 32, dataset: GraphRAGDataset = dataset, map_top_n: int = GLOBAL_MAP_TOP_N
+) -> ProfiledGlobalSearch:
+    communities = dataset.communities()
+    # 摘要文件不存在或社区报告表更新后，只对内容变化的报告重新生成摘要
+    if not dataset.has_table(COMMUNITY_REPORT_SUMMARY_TABLE) or (
+            os.path.getmtime(dataset.table_path(COMMUNITY_REPORT_TABLE))
+            > os.path.getmtime(dataset.table_path(COMMUNITY_REPORT_SUMMARY_TABLE))
+    ):
+        summarize_community_reports(dataset.data_dir, token_encoder)
+    if map_top_n > 0:
+        ensure_report_embeddings(dataset)
+    reports = dataset.reports(COMMUNITY_LEVEL, with_embeddings=map_top_n > 0, with_summaries=True)
+    entities = dataset.entities(COMMUNITY_LEVEL)
+    print(f'Total report count: {dataset.num_rows(COMMUNITY_REPORT_TABLE)}')
     print(f'Report count after filtering by community level {COMMUNITY_LEVEL}: {len(reports)}')
-    report_df.head()
+    report_tokens = dataset.table(COMMUNITY_REPORT_SUMMARY_TABLE, ['id', 'full_content_tokens'])
+    level_tokens = report_tokens.loc[report_tokens['id'].isin({report.id for report in reports}), 'full_content_tokens']
+    # 预筛选时 map 阶段最多收到 map_top_n 个报告，auto 档位按其中全文最长的 map_top_n 个报告估算
+    full_content_tokens = int((level_tokens.nlargest(map_top_n) if map_top_n > 0 else level_tokens).sum())
 
     context_builder = GlobalCommunityContext(
         community_reports=reports,
@@ -264,8 +350,25 @@ def build_global_search_engine() -> GlobalSearch:
 
         token_encoder=token_encoder
     )
+    if map_top_n > 0:
+        # map 阶段之前按查询与报告全文向量的相似度预筛选报告，只需一次查询向量化
+        context_builder.dynamic_community_selection = EmbeddingCommunitySelection(
+            reports, text_embedder, top_n=map_top_n
+        )
 
-    return GlobalSearch(
+    # 按查询时的参数把所有社区报告的上下文行（全文和摘要）编码一次，查询时的 token 计数直接命中缓存；
+    # 编码结果归属该数据集，数据集释放时由 release_dataset 丢弃
+    with token_encoder.pinned(dataset):
+        for use_community_summary in (False, True):
+            build_community_context(
+                community_reports=reports,
+                entities=entities,
+                token_encoder=token_encoder,
+                single_batch=False,
+                **{**global_context_params, 'use_community_summary': use_community_summary}
+            )
+
+    return ProfiledGlobalSearch(
         llm=llm,
         context_builder=context_builder,
         token_encoder=token_encoder,
@@ -286,7 +389,13 @@ def build_global_search_engine() -> GlobalSearch:
         json_mode=json_mode,
 
         context_builder_params=global_context_params,
-        concurrent_coroutines=32,
+        # 单个查询 map 阶段同时请求 LLM 的最大协程数
+        concurrent_coroutines=concurrent_coroutines,
+
+        # 请求未指定档位时，按该层级报告全文的总 token 数选择全文或摘要
+        default_profile=GLOBAL_REPORT_PROFILE,
+        full_content_tokens=full_content_tokens,
+        full_content_max_tokens=GLOBAL_FULL_CONTENT_MAX_TOKENS,
 
         # free form text describing the response type and format, can be anything,
         # e.g. prioritized list, single paragraph, multiple paragraphs, multiple-page report
@@ -294,72 +403,28 @@ def build_global_search_engine() -> GlobalSearch:
     )
 
 
-def embed_community_reports(
-        input_dir: str,
-        embedder: OpenAIEmbedding,
-        community_report_table: str = COMMUNITY_REPORT_TABLE
-):
-    '''Embeds the full content of the community reports and saves the DataFrame with embeddings to the output path.'''
-    input_path = Path(input_dir) / f'{community_report_table}.parquet'
-    output_path = Path(input_dir) / f'{community_report_table}_with_embeddings.parquet'
-
-    if not Path(output_path).exists():
-        print('Embedding file not found. Computing community report embeddings...')
-
-        report_df = pd.read_parquet(input_path)
-
-        if 'full_content' not in report_df.columns:
-            error_msg = f"'full_content' column not found in {input_path}"
-            raise ValueError(error_msg)
-
-        report_df['full_content_embeddings'] = report_df.loc[:, 'full_content'].apply(
-            lambda x: embedder.embed(x)
-        )
-
-        # Save the DataFrame with embeddings to the output path
-        report_df.to_parquet(output_path)
-        print(f'Embeddings saved to {output_path}')
-        return report_df
-    print(f'Embeddings file already exists at {output_path}')
-    return pd.read_parquet(output_path)
+def release_dataset(dataset: GraphRAGDataset) -> None:
+    """释放数据集已加载的数据，以及构建搜索引擎时按该数据集常驻的 token 编码缓存"""
+    token_encoder.release(dataset)
+    dataset.clear()
 
 
-def build_drift_search_engine() -> DRIFTSearch:
-    # read nodes table to get community and degree data
-    entity_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_NODES_TABLE}.parquet')
-    entity_embedding_df = pd.read_parquet(f'{DATA_DIR}/{ENTITY_EMBEDDING_TABLE}.parquet')
+def build_drift_search_engine(dataset: GraphRAGDataset = dataset) -> DRIFTSearch:
+    entities = dataset.entities(COMMUNITY_LEVEL)
 
-    entities = read_indexer_entities(entity_df, entity_embedding_df, COMMUNITY_LEVEL)
-
-    # load description embeddings to an in-memory lancedb vectorstore
-    # to connect to a remote db, specify url and port values.
-    description_embedding_store = LanceDBVectorStore(
-        collection_name='default-entity-description',
-    )
-    description_embedding_store.connect(db_uri=LANCEDB_URI)
+    # 实体描述向量加载到进程内向量库，所有搜索引擎共享，不再每次构建都打开 LanceDB
+    description_embedding_store = dataset.vector_store(ENTITY_DESCRIPTION_COLLECTION)
 
-    print(f'Entity count: {len(entity_df)}')
-    entity_df.head()
+    print(f'Entity count: {dataset.num_rows(ENTITY_NODES_TABLE)}')
 
-    relationship_df = pd.read_parquet(f'{DATA_DIR}/{RELATIONSHIP_TABLE}.parquet')
-    relationships = read_indexer_relationships(relationship_df)
+    relationships = dataset.relationships()
+    print(f'Relationship count: {len(relationships)}')
 
-    print(f'Relationship count: {len(relationship_df)}')
-    relationship_df.head()
+    text_units = dataset.text_units()
+    print(f'Text unit records: {len(text_units)}')
 
-    text_unit_df = pd.read_parquet(f'{DATA_DIR}/{TEXT_UNIT_TABLE}.parquet')
-    text_units = read_indexer_text_units(text_unit_df)
-
-    print(f'Text unit records: {len(text_unit_df)}')
-    text_unit_df.head()
-
-    report_df = embed_community_reports(DATA_DIR, text_embedder)
-    reports = read_indexer_reports(
-        report_df,
-        entity_df,
-        COMMUNITY_LEVEL,
-        content_embedding_col='full_content_embeddings'
-    )
+    ensure_report_embeddings(dataset)
+    reports = dataset.reports(COMMUNITY_LEVEL, with_embeddings=True)
 
     context_builder = DRIFTSearchContextBuilder(
         chat_llm=llm,
@@ -402,8 +467,7 @@ try:
         print("search_result:", type(result.response),result.response)
         return result.response
 except ImportError as e:
-    print(f"MCP module not available: {e}")
-    print("Continuing without MCP support")
+    logger.info('MCP module not available, continuing without MCP support: %s', e)
 
 
 async def local_astream_search(query) -> AsyncGenerator:
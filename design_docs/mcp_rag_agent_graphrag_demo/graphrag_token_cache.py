@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""带缓存的 tiktoken 编码器
+
+上下文构建器为了控制 max_tokens，每次查询都会对社区报告、文本块、实体等记录拼出的行文本重新做 BPE 编码。
+这里按文本缓存编码结果：构建搜索引擎时在 pinned(scope) 中预先编码的静态记录常驻内存，
+查询相关的文本进入有界的 LRU 缓存，查询时的 token 计数只剩查表。
+
+静态记录按 scope（如索引版本的数据集）分组：同一 scope 再次预编码时替换该 scope 原有的记录，
+索引版本释放或语料淘汰时用 release(scope) 丢弃，静态记录不会随热更新和多语料加载无限增长。
+目前只有全局搜索的社区报告上下文行（全文和摘要）预先编码，本地搜索的实体、文本块等上下文行走 LRU 缓存。
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+import numpy as np
+import tiktoken
+
+
+class CachedTokenEncoder:
+    """tiktoken 编码器的缓存包装，对上下文构建器保持与 tiktoken.Encoding 相同的接口"""
+
+    def __init__(self, encoding: tiktoken.Encoding, max_entries: int = 65536, max_text_tokens: int = 4096):
+        """初始化缓存编码器
+
+        Args:
+            encoding: 被包装的 tiktoken 编码器
+            max_entries: LRU 缓存的最大条目数
+            max_text_tokens: 超过该 token 数的文本（如整批上下文）通常只出现一次，不缓存
+        """
+        self.encoding = encoding
+        self.max_entries = max_entries
+        self.max_text_tokens = max_text_tokens
+        # 静态记录：scope -> (文本 -> token 数组)，不按LRU淘汰，由 release 整组丢弃
+        self._static: Dict[Hashable, Dict[str, np.ndarray]] = {}
+        # 查询相关文本：文本 -> token 数组，按 LRU 淘汰
+        self._lru: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name: str) -> Any:
+        # decode、name 等其余属性透传给被包装的编码器
+        if name == 'encoding':
+            raise AttributeError(name)
+        return getattr(self.encoding, name)
+
+    @contextmanager
+    def pinned(self, scope: Hashable) -> Iterator[None]:
+        """当前线程在上下文中编码的文本作为 scope 的静态记录常驻缓存，正常退出时替换该 scope 原有的记录"""
+        entries: Dict[str, np.ndarray] = {}
+        self._local.pinned = entries
+        try:
+            yield
+        finally:
+            self._local.pinned = None
+        with self._lock:
+            self._static[scope] = entries
+            for text in entries:
+                self._lru.pop(text, None)
+
+    def release(self, scope: Hashable) -> None:
+        """丢弃 scope 的静态记录"""
+        with self._lock:
+            self._static.pop(scope, None)
+
+    def _lookup(self, text: str) -> Optional[np.ndarray]:
+        pending = getattr(self._local, 'pinned', None)
+        with self._lock:
+            tokens = pending.get(text) if pending is not None else None
+            if tokens is None:
+                tokens = next(
+                    (entries[text] for entries in self._static.values() if text in entries), None
+                )
+            if tokens is None:
+                tokens = self._lru.get(text)
+                if tokens is not None:
+                    self._lru.move_to_end(text)
+            if tokens is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        if pending is not None:
+            # 其他 scope 或 LRU 中已有的文本同样计入当前 scope，其他 scope 释放后仍然常驻
+            pending[text] = tokens
+        return tokens
+
+    def _store(self, text: str, tokens: np.ndarray) -> None:
+        if len(tokens) > self.max_text_tokens:
+            return
+        pending = getattr(self._local, 'pinned', None)
+        if pending is not None:
+            pending[text] = tokens
+            return
+        with self._lock:
+            self._lru[text] = tokens
+            self._lru.move_to_end(text)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _tokens(self, text: str) -> np.ndarray:
+        tokens = self._lookup(text)
+        if tokens is None:
+            tokens = np.asarray(self.encoding.encode(text), dtype=np.uint32)
+            self._store(text, tokens)
+        return tokens
+
+    def encode(self, text: str, **kwargs: Any) -> List[int]:
+        if kwargs:
+            # 带特殊 token 参数的调用不走缓存
+            return self.encoding.encode(text, **kwargs)
+        return self._tokens(text).tolist()
+
+    def count(self, text: str) -> int:
+        """文本的 token 数"""
+        return len(self._tokens(text))
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'static_scopes': len(self._static),
+                'static_entries': sum(len(entries) for entries in self._static.values()),
+                'entries': len(self._lru),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""进程内 NumPy 向量库
+
+实现 graphrag 的 BaseVectorStore 接口，可直接替换 LanceDBVectorStore 传给 LocalSearchMixedContext 等上下文构建器。
+向量归一化后保存在一个连续的 float32 矩阵中，用矩阵乘法计算余弦相似度，用 argpartition 取 top-k。
+矩阵可保存为 .npy 文件并以内存映射方式打开，多个进程共享同一份页缓存。
+
+同一个向量库由所有搜索引擎和并发的请求共享，因此不保存按请求变化的过滤条件：
+按 id 过滤时在每次搜索中传入 include_ids，或用 filtered 得到带固定过滤条件、共享向量矩阵的独立视图。
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from graphrag.model.types import TextEmbedder
+from graphrag.vector_stores.base import (
+    BaseVectorStore,
+    VectorStoreDocument,
+    VectorStoreSearchResult,
+)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyVectorStore(BaseVectorStore):
+    """进程内向量库，适用于可以完整放入内存的向量集合"""
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._ids: List[Any] = []
+        self._texts: List[Optional[str]] = []
+        self._attributes: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def nbytes(self) -> int:
+        """向量矩阵占用的字节数"""
+        return self._matrix.nbytes
+
+    @property
+    def mapped(self) -> bool:
+        """向量矩阵是否以内存映射方式打开"""
+        return isinstance(self._matrix, np.memmap)
+
+    def connect(self, **kwargs: Any) -> None:
+        """从 db_uri 目录加载已保存的向量集合，mmap=False 时完整读入内存"""
+        db_uri = kwargs.get('db_uri')
+        if db_uri and os.path.exists(self._matrix_path(db_uri)):
+            self.load(db_uri, mmap=kwargs.get('mmap', True))
+
+    def _matrix_path(self, path: str) -> str:
+        return os.path.join(path, f'{self.collection_name}.npy')
+
+    def _meta_path(self, path: str) -> str:
+        return os.path.join(path, f'{self.collection_name}.json')
+
+    def _set(
+        self,
+        ids: List[Any],
+        texts: List[Optional[str]],
+        attributes: List[Dict[str, Any]],
+        matrix: np.ndarray,
+    ) -> None:
+        self._ids = ids
+        self._texts = texts
+        self._attributes = attributes
+        self._rows = {str(id): row for row, id in enumerate(ids)}
+        self._matrix = matrix
+
+    def load_documents(
+        self, documents: List[VectorStoreDocument], overwrite: bool = True
+    ) -> None:
+        """加载文档，没有向量的文档会被忽略"""
+        documents = [document for document in documents if document.vector is not None]
+        ids = [document.id for document in documents]
+        texts = [document.text for document in documents]
+        attributes = [document.attributes for document in documents]
+        matrix = _normalize_rows(
+            np.asarray([document.vector for document in documents], dtype=np.float32)
+        ) if documents else np.zeros((0, self._matrix.shape[1]), dtype=np.float32)
+        if not overwrite and len(self):
+            ids = self._ids + ids
+            texts = self._texts + texts
+            attributes = self._attributes + attributes
+            matrix = np.concatenate([np.asarray(self._matrix), matrix])
+        self._set(ids, texts, attributes, np.ascontiguousarray(matrix))
+
+    def save(self, path: str, **meta: Any) -> None:
+        """保存为 .npy 矩阵和 .json 元数据，meta 中的额外字段一并写入元数据
+
+        两个文件先写临时文件再依次替换，元数据最后替换；元数据记录矩阵文件的修改时间和大小，
+        多个进程同时保存到同一目录或保存中途中断时，load 能发现矩阵和元数据不是同一次保存的。
+        """
+        os.makedirs(path, exist_ok=True)
+        suffix = f'.{os.getpid()}.{threading.get_ident()}.tmp'
+        matrix_path, meta_path = self._matrix_path(path), self._meta_path(path)
+        with open(matrix_path + suffix, 'wb') as f:
+            np.save(f, np.asarray(self._matrix))
+        stat = os.stat(matrix_path + suffix)
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump(
+                {
+                    'ids': self._ids,
+                    'texts': self._texts,
+                    'attributes': self._attributes,
+                    'matrix_file': [stat.st_mtime_ns, stat.st_size],
+                    **meta,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(matrix_path + suffix, matrix_path)
+        os.replace(meta_path + suffix, meta_path)
+
+    def load(self, path: str, mmap: bool = True) -> Dict[str, Any]:
+        """加载 save 保存的向量集合，返回元数据；矩阵和元数据不匹配时抛出 ValueError"""
+        matrix_path = self._matrix_path(path)
+        before = os.stat(matrix_path)
+        matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+        after = os.stat(matrix_path)
+        with open(self._meta_path(path), encoding='utf-8') as f:
+            meta = json.load(f)
+        signature = [before.st_mtime_ns, before.st_size]
+        if (
+            (after.st_mtime_ns, after.st_size) != tuple(signature)
+            or meta.pop('matrix_file', signature) != signature
+            or matrix.shape[0] != len(meta['ids'])
+        ):
+            raise ValueError(f'Vector store files in {path} do not match: {self.collection_name}')
+        self._set(meta.pop('ids'), meta.pop('texts'), meta.pop('attributes'), matrix)
+        return meta
+
+    def _filter_rows(self, include_ids: Sequence[Any]) -> np.ndarray:
+        return np.fromiter(
+            (self._rows[str(id)] for id in include_ids if str(id) in self._rows),
+            dtype=np.int64,
+        )
+
+    def filter_by_id(self, include_ids: Sequence[Any]) -> Any:
+        """返回只包含指定id的文档的过滤条件（矩阵行号），传入空列表时返回None
+
+        不修改向量库本身，过滤条件通过搜索的 query_filter 参数传入，或用 filtered 得到独立的视图。
+        """
+        if len(include_ids) == 0:
+            return None
+        return self._filter_rows(include_ids)
+
+    def filtered(self, include_ids: Sequence[Any]) -> 'NumpyVectorStore':
+        """只在指定id的文档中搜索的视图，与原向量库共享向量矩阵和文档"""
+        view = NumpyVectorStore(collection_name=self.collection_name)
+        view._ids, view._texts, view._attributes = self._ids, self._texts, self._attributes
+        view._rows, view._matrix = self._rows, self._matrix
+        view.query_filter = self.filter_by_id(include_ids)
+        return view
+
+    def similarity_search_by_vectors(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        k: int = 10,
+        include_ids: Optional[Sequence[Any]] = None,
+        query_filter: Optional[np.ndarray] = None,
+    ) -> List[List[VectorStoreSearchResult]]:
+        """批量向量搜索，一次矩阵乘法计算全部查询与全部文档的余弦相似度
+
+        Args:
+            query_embeddings: 查询向量
+            k: 每个查询返回的文档数
+            include_ids: 只在这些id的文档中搜索，仅对本次搜索生效
+            query_filter: filter_by_id 返回的过滤条件，未指定时使用视图的过滤条件
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        if include_ids:
+            rows = self._filter_rows(include_ids)
+        else:
+            rows = query_filter if query_filter is not None else self.query_filter
+        candidates = self._matrix if rows is None else self._matrix[rows]
+        if len(candidates) == 0 or k <= 0:
+            return [[] for _ in range(len(queries))]
+        scores = queries @ candidates.T
+        k = min(k, candidates.shape[0])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_scores, query_top in zip(scores, top):
+            query_top = query_top[np.argsort(-query_scores[query_top])]
+            results.append([
+                self._result(
+                    int(query_top_row if rows is None else rows[query_top_row]),
+                    float(query_scores[query_top_row]),
+                )
+                for query_top_row in query_top
+            ])
+        return results
+
+    def _result(self, row: int, score: float) -> VectorStoreSearchResult:
+        return VectorStoreSearchResult(document=self._document(row), score=score)
+
+    def _document(self, row: int) -> VectorStoreDocument:
+        return VectorStoreDocument(
+            id=self._ids[row],
+            text=self._texts[row],
+            # 返回矩阵行的视图，不复制向量
+            vector=self._matrix[row],
+            attributes=self._attributes[row],
+        )
+
+    def similarity_search_by_vector(
+        self,
+        query_embedding: List[float],
+        k: int = 10,
+        include_ids: Optional[Sequence[Any]] = None,
+        query_filter: Optional[np.ndarray] = None,
+        **kwargs: Any,
+    ) -> List[VectorStoreSearchResult]:
+        return self.similarity_search_by_vectors([query_embedding], k, include_ids, query_filter)[0]
+
+    def similarity_search_by_text(
+        self,
+        text: str,
+        text_embedder: TextEmbedder,
+        k: int = 10,
+        include_ids: Optional[Sequence[Any]] = None,
+        query_filter: Optional[np.ndarray] = None,
+        **kwargs: Any,
+    ) -> List[VectorStoreSearchResult]:
+        query_embedding = text_embedder(text)
+        if query_embedding is not None and len(query_embedding):
+            return self.similarity_search_by_vector(query_embedding, k, include_ids, query_filter)
+        return []
+
+    def search_by_id(self, id: str) -> VectorStoreDocument:
+        row = self._rows.get(str(id))
+        if row is None:
+            return VectorStoreDocument(id=id, text=None, vector=None)
+        return self._document(row)
+
+    @classmethod
+    def from_lancedb(
+        cls, db_uri: str, collection_name: str, cache_dir: str, mmap: bool = True
+    ) -> 'NumpyVectorStore':
+        """读取 LanceDB 中的向量集合
+
+        首次读取后保存到 cache_dir，之后直接以内存映射方式打开，不再打开 LanceDB；
+        LanceDB 集合发生变化（版本目录修改时间变化）时重新转换。
+        """
+        store = cls(collection_name=collection_name)
+        source = lancedb_signature(db_uri, collection_name)
+        if os.path.exists(store._matrix_path(cache_dir)):
+            try:
+                if store.load(cache_dir, mmap=mmap).get('source') == source:
+                    return store
+            except (OSError, ValueError):
+                # 缓存文件不完整或不匹配（其他进程正在写入），重新转换
+                pass
+
+        import lancedb
+
+        table = lancedb.connect(db_uri).open_table(collection_name).to_arrow()
+        store.load_documents([
+            VectorStoreDocument(
+                id=row['id'],
+                text=row['text'],
+                vector=row['vector'],
+                attributes=json.loads(row['attributes']) if row['attributes'] else {},
+            )
+            for row in table.to_pylist()
+        ])
+        store.save(cache_dir, source=source)
+        if mmap:
+            try:
+                store.load(cache_dir, mmap=True)
+            except (OSError, ValueError):
+                # 保存后缓存文件已被其他进程替换，使用内存中的矩阵
+                pass
+        return store
+
+
+def lancedb_signature(db_uri: str, collection_name: str) -> Optional[int]:
+    """LanceDB 集合的签名，每次写入都会新增版本文件并更新 _versions 目录的修改时间"""
+    path = os.path.join(db_uri, f'{collection_name}.lance')
+    versions = os.path.join(path, '_versions')
+    if os.path.exists(versions):
+        return os.stat(versions).st_mtime_ns
+    if os.path.exists(path):
+        return os.stat(path).st_mtime_ns
+    return None
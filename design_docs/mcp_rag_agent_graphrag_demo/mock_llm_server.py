@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+"""OpenAI 兼容的本地 LLM / 向量模型替身服务
+
+实现 ChatOpenAI / OpenAIEmbedding 用到的 /v1/chat/completions（含流式）和 /v1/embeddings 接口，
+不依赖网络即可在单机上对 /graphrag/chat 全链路做压测，测出服务自身的开销。
+
+- 延迟：首 token 延迟和向量接口延迟按指定分布采样，生成速度按 token/s 控制
+- 错误注入：按比例返回 429/500/503 等错误，或挂起请求模拟上游超时
+- 回答内容：请求要求 JSON 输出（response_format 为 json_object 或提示词要求 JSON）时返回同时满足
+  全局搜索 map 阶段和 DRIFT 搜索解析要求的 JSON，否则返回普通文本
+- 向量：按字符二元组做特征哈希，结果确定，相似文本的向量相似
+
+使用示例:
+    python mock_llm_server.py --port 8001 --ttft lognormal:0.4,0.5 --token-rate 50 --error-rate 0.01
+    # 然后把 .env 中的 BASE_URL 设为 http://127.0.0.1:8001/v1
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 生成回答时使用的词表
+VOCABULARY = [
+    '萧炎', '药老', '萧薰儿', '纳兰嫣然', '云岚宗', '迦南学院', '斗气', '异火', '炼药师', '魂殿',
+    '的', '与', '在', '之后', '修炼', '突破', '关系', '势力', '大陆', '传承',
+]
+
+
+class LatencyDistribution:
+    """延迟分布，格式为 "分布:参数"
+
+    - fixed:0.5            固定0.5秒
+    - uniform:0.2,1.0      0.2~1.0秒均匀分布
+    - lognormal:0.5,0.6    中位数0.5秒、对数标准差0.6的对数正态分布（长尾）
+    - exponential:0.5      均值0.5秒的指数分布
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',') if value]
+        expected = {'fixed': 1, 'uniform': 2, 'lognormal': 2, 'exponential': 1}
+        if expected.get(kind) != len(self.params):
+            raise ValueError(f'Invalid latency distribution: {spec}')
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'fixed':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return rng.uniform(*self.params)
+        if self.kind == 'lognormal':
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+
+
+@dataclass
+class MockLLMConfig:
+    ttft: LatencyDistribution = field(default_factory=lambda: LatencyDistribution('fixed:0.2'))
+    token_rate: float = 50.0  # 生成速度(token/s)，0表示不限速
+    output_tokens: int = 200  # 普通文本回答的token数（受请求的 max_tokens 限制）
+    embedding_latency: LatencyDistribution = field(
+        default_factory=lambda: LatencyDistribution('fixed:0.02')
+    )
+    embedding_dim: int = 1536
+    error_rate: float = 0.0  # 返回错误的请求比例
+    error_statuses: Sequence[int] = (429, 500, 503)
+    hang_rate: float = 0.0  # 挂起不响应的请求比例，模拟上游超时
+    hang_seconds: float = 600.0
+    seed: Optional[int] = None
+
+
+def approx_tokens(text: str) -> int:
+    """近似 token 数：中文按字、其他按4个字符计"""
+    cjk = sum(1 for char in text if '一' <= char <= '鿿')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def hashed_embedding(text: str, dim: int) -> List[float]:
+    """字符二元组特征哈希向量，确定且相似文本的向量相似"""
+    vector = np.zeros(dim, dtype=np.float32)
+    padded = f'^{text}$'
+    for gram, count in Counter(padded[i:i + 2] for i in range(len(padded) - 1)).items():
+        digest = hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        vector[value % dim] += count if value >> 63 else -count
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+
+def wants_json(body: Dict[str, Any]) -> bool:
+    if (body.get('response_format') or {}).get('type') == 'json_object':
+        return True
+    return any('json' in str(message.get('content', '')).lower() for message in body.get('messages', []))
+
+
+def json_answer(rng: random.Random, query: str) -> str:
+    """同时满足全局搜索 map 阶段（points）、DRIFT primer（intermediate_answer、follow_up_queries）
+    和 DRIFT 局部搜索（response、score）解析要求的 JSON 回答"""
+    answer = ''.join(rng.choice(VOCABULARY) for _ in range(30))
+    return json.dumps({
+        'points': [
+            {'description': f'{answer} [Data: Reports (1, 2)]', 'score': rng.randint(40, 90)}
+            for _ in range(2)
+        ],
+        'intermediate_answer': answer,
+        'response': answer,
+        'score': rng.randint(40, 90),
+        'follow_up_queries': [f'{query[:20]} 的相关{word}' for word in ('人物', '势力')],
+    }, ensure_ascii=False)
+
+
+def create_app(config: MockLLMConfig) -> FastAPI:
+    app = FastAPI(title='Mock OpenAI-compatible LLM')
+    rng = random.Random(config.seed)
+    stats = Counter()
+
+    async def inject_failure(endpoint: str) -> Optional[JSONResponse]:
+        """按配置的比例注入错误或挂起请求"""
+        stats[f'{endpoint}.requests'] += 1
+        if config.hang_rate and rng.random() < config.hang_rate:
+            stats[f'{endpoint}.hangs'] += 1
+            await asyncio.sleep(config.hang_seconds)
+        if config.error_rate and rng.random() < config.error_rate:
+            status = rng.choice(list(config.error_statuses))
+            stats[f'{endpoint}.errors.{status}'] += 1
+            headers = {'Retry-After': '1'} if status == 429 else None
+            return JSONResponse(
+                status_code=status,
+                headers=headers,
+                content={'error': {'message': f'Injected error {status}', 'type': 'mock_error', 'code': status}},
+            )
+        return None
+
+    @app.get('/v1/models')
+    async def models():
+        return {'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]}
+
+    @app.get('/stats')
+    async def get_stats():
+        return dict(stats)
+
+    @app.post('/v1/chat/completions')
+    async def chat_completions(request: Request):
+        body = await request.json()
+        failure = await inject_failure('chat')
+        if failure is not None:
+            return failure
+
+        messages = body.get('messages', [])
+        prompt = '\n'.join(str(message.get('content', '')) for message in messages)
+        query = str(messages[-1].get('content', '')) if messages else ''
+        max_tokens = body.get('max_tokens') or config.output_tokens
+        if wants_json(body):
+            content = json_answer(rng, query)
+            pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+        else:
+            pieces = [rng.choice(VOCABULARY) for _ in range(min(config.output_tokens, max_tokens))]
+            content = ''.join(pieces)
+        usage = {
+            'prompt_tokens': approx_tokens(prompt),
+            'completion_tokens': len(pieces),
+            'total_tokens': approx_tokens(prompt) + len(pieces),
+        }
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        model = body.get('model', 'mock')
+        created = int(time.time())
+        interval = 1 / config.token_rate if config.token_rate > 0 else 0.0
+
+        await asyncio.sleep(config.ttft.sample(rng))
+        if not body.get('stream'):
+            await asyncio.sleep(interval * len(pieces))
+            return {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop',
+                }],
+                'usage': usage,
+            }
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            return f'data: {json.dumps(payload, ensure_ascii=False)}\n\n'
+
+        async def stream() -> AsyncIterator[str]:
+            yield chunk({'role': 'assistant', 'content': ''})
+            for piece in pieces:
+                yield chunk({'content': piece})
+                if interval:
+                    await asyncio.sleep(interval)
+            yield chunk({}, 'stop')
+            yield 'data: [DONE]\n\n'
+
+        return StreamingResponse(stream(), media_type='text/event-stream')
+
+    @app.post('/v1/embeddings')
+    async def embeddings(request: Request):
+        body = await request.json()
+        failure = await inject_failure('embeddings')
+        if failure is not None:
+            return failure
+
+        inputs: Union[str, List[Any]] = body.get('input', [])
+        # 单条文本、文本列表、token 数组或 token 数组列表
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        texts = [text if isinstance(text, str) else ' '.join(map(str, text)) for text in inputs]
+        await asyncio.sleep(config.embedding_latency.sample(rng))
+        prompt_tokens = sum(approx_tokens(text) for text in texts)
+        return {
+            'object': 'list',
+            'data': [
+                {'object': 'embedding', 'index': i, 'embedding': hashed_embedding(text, config.embedding_dim)}
+                for i, text in enumerate(texts)
+            ],
+            'model': body.get('model', 'mock'),
+            'usage': {'prompt_tokens': prompt_tokens, 'total_tokens': prompt_tokens},
+        }
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='OpenAI 兼容的本地 LLM / 向量模型替身服务，用于离线压测')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--ttft', default='fixed:0.2', help='首 token 延迟分布，如 lognormal:0.4,0.5')
+    parser.add_argument('--token-rate', type=float, default=50.0, help='生成速度(token/s)，0表示不限速')
+    parser.add_argument('--output-tokens', type=int, default=200, help='普通文本回答的token数')
+    parser.add_argument('--embedding-latency', default='fixed:0.02', help='向量接口延迟分布')
+    parser.add_argument('--embedding-dim', type=int, default=1536)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误的请求比例')
+    parser.add_argument('--error-statuses', default='429,500,503', help='注入的错误状态码')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='挂起不响应的请求比例')
+    parser.add_argument('--hang-seconds', type=float, default=600.0)
+    parser.add_argument('--seed', type=int, default=None, help='随机种子，固定后延迟和回答可复现')
+    args = parser.parse_args()
+
+    mock_config = MockLLMConfig(
+        ttft=LatencyDistribution(args.ttft),
+        token_rate=args.token_rate,
+        output_tokens=args.output_tokens,
+        embedding_latency=LatencyDistribution(args.embedding_latency),
+        embedding_dim=args.embedding_dim,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_statuses.split(',')],
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(mock_config), host=args.host, port=args.port, log_level='warning')
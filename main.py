@@ -1,6 +1,8 @@
 from fastapi import FastAPI, Depends, Request
 import argparse
+import asyncio
 import os
+from typing import Optional
 from app.dependencies.config import (
     app_settings,
     config_deps,
@@ -18,6 +20,8 @@ from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from app.config.logger import logger
 from app.events.base import event_bus, EventType, UserLoggedInEvent, UserRegisteredEvent
+from app.config.graphrag_config import graphrag_config
+from app.services.graphrag_service import graphrag_corpus_registry
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -64,6 +68,19 @@ def handle_user_logged_in(event: UserLoggedInEvent):
     )
 
 
+# GraphRAG后台预热任务，保留引用避免被回收，应用关闭时取消
+graphrag_warm_up_task: Optional[asyncio.Task] = None
+
+
+def log_warm_up_result(task: asyncio.Task) -> None:
+    """记录GraphRAG后台预热任务的失败"""
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        logger.error(f"GraphRAG后台预热失败: {error}", exc_info=error)
+
+
 # 应用启动事件
 @app.on_event("startup")
 async def startup_event():
@@ -87,6 +104,21 @@ async def startup_event():
     event_bus.subscribe(EventType.USER_LOGGED_IN, handle_user_logged_in)
     logger.info("已订阅用户登录事件")
 
+    # 5. 在后台导入GraphRAG查询栈并预热搜索引擎，不阻塞应用启动
+    global graphrag_warm_up_task
+    if graphrag_config.WARMUP_ON_STARTUP:
+        graphrag_warm_up_task = asyncio.ensure_future(
+            graphrag_corpus_registry.warm_up(graphrag_config.WARMUP_MODES)
+        )
+        graphrag_warm_up_task.add_done_callback(log_warm_up_result)
+        logger.info(
+            f"已开始后台预热GraphRAG默认语料 {graphrag_corpus_registry.default} 的搜索引擎: "
+            f"{graphrag_config.WARMUP_MODES}"
+        )
+
+    # 6. 定期检查已加载语料的输出目录，发现新的索引快照时在后台构建并切换
+    graphrag_corpus_registry.start_watching(graphrag_config.INDEX_WATCH_INTERVAL)
+
 
 # 应用关闭事件
 @app.on_event("shutdown")
@@ -95,6 +127,11 @@ async def shutdown_event():
     logger.info("应用关闭，正在断开数据库连接...")
     database_manager.disconnect_all()
     logger.info("所有数据库连接已断开")
+    global graphrag_warm_up_task
+    if graphrag_warm_up_task is not None:
+        graphrag_warm_up_task.cancel()
+        graphrag_warm_up_task = None
+    graphrag_corpus_registry.shutdown()
 
 
 # 设置CORS中间件
@@ -1,11 +1,231 @@
+import asyncio
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import pandas as pd
 import pytest
+from app.api.v1.graphrag import get_graphrag_service
+from app.config.graphrag_config import graphrag_config
+from app.exception import ServiceUnavailableException, TooManyRequestsException
+from app.exception import NotFoundException
+from app.services.graphrag_cache import AnswerCache, SemanticAnswerCache
+from app.services.graphrag_corpus import GraphRAGCorpus, GraphRAGCorpusRegistry
+from app.services.graphrag_index import GraphRAGIndexManager
+from app.services.graphrag_pool import GraphRAGConcurrencyPools, ModeConcurrencyPool
+from app.services.graphrag_registry import GraphRAGEngineRegistry
 from app.services.graphrag_service import GraphRAGService
+from app.services.graphrag_trace import GraphRAGTrace, GraphRAGTraceHistograms, instrument_engine
 from app.services.tool_service import ToolService
+from main import app
+
+
+class FakeStreamingEngine:
+    """模拟流式搜索引擎：先产出上下文数据，再逐段产出回答"""
+
+    async def astream_search(self, query):
+        yield {"entities": pd.DataFrame([{"id": "1", "entity": "萧炎"}])}
+        yield "萧炎的父亲"
+        yield "是萧战。"
+
+
+class FakeSearchResult:
+    def __init__(self, response):
+        self.response = response
+
+
+class FakeBatchEngine:
+    """模拟搜索引擎：查询耗时不同，包含"失败"的查询抛出异常"""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def asearch(self, query):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(0.05 if "慢" in query else 0.01)
+            if "失败" in query:
+                raise RuntimeError("upstream error")
+            return FakeSearchResult(f"answer to {query}")
+        finally:
+            self.running -= 1
+
+
+class FakeEmbedder:
+    """模拟向量模型，记录请求过向量的文本"""
+
+    def __init__(self):
+        self.texts = []
+
+    async def aembed(self, text):
+        self.texts.append(text)
+        return [1.0, 0.0]
+
+
+class FakeContextResult:
+    def __init__(self, context_chunks, context_records):
+        self.context_chunks = context_chunks
+        self.context_records = context_records
+
+
+class FakeLocalContextBuilder:
+    """模拟本地搜索的同步上下文构建器，记录构建次数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def build_context(self, query, **kwargs):
+        self.calls += 1
+        entities = pd.DataFrame([{"id": "1", "entity": "萧炎"}, {"id": "2", "entity": "萧战"}])
+        return FakeContextResult(
+            f"-----Entities-----\n{query}", {"entities": entities}
+        )
+
+
+class FakeGlobalContextBuilder:
+    """模拟全局搜索的异步上下文构建器，返回多批上下文"""
+
+    async def build_context(self, query, **kwargs):
+        reports = pd.DataFrame([{"id": "1", "title": "迦南学院"}])
+        return FakeContextResult(["批次一", "批次二 批次二"], {"reports": reports})
+
+
+class FakeTokenEncoder:
+    def encode(self, text):
+        return text.split()
+
+
+class FakeContextEngine(FakeBatchEngine):
+    """带上下文构建器的模拟搜索引擎，asearch 被调用时说明调用了LLM"""
+
+    def __init__(self, context_builder):
+        super().__init__()
+        self.context_builder = context_builder
+        self.token_encoder = FakeTokenEncoder()
+        self.context_builder_params = {"max_tokens": 100}
+        self.searched = 0
+
+    async def asearch(self, query):
+        self.searched += 1
+        return await super().asearch(query)
+
+
+def make_batch_service(engine, embedder=None):
+    registry = GraphRAGEngineRegistry(
+        {"local": lambda: engine, "global": lambda: engine}
+    )
+    service = GraphRAGService(
+        registry=registry,
+        answer_cache=AnswerCache(),
+        embedder=embedder or FakeEmbedder(),
+        pools=GraphRAGConcurrencyPools({}, {}),
+    )
+    return registry, service
+
+
+def parse_sse(text):
+    """解析SSE响应为 (事件类型, 数据) 列表"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class FakeProfiledEngine(FakeBatchEngine):
+    """模拟按档位选择报告全文或摘要的全局搜索引擎"""
+
+    def __init__(self):
+        super().__init__()
+        self.profiles = []
+
+    def context_params_for(self, profile=None):
+        return {"use_community_summary": profile == "fast"}
+
+    async def asearch(self, query, profile=None):
+        self.profiles.append(profile)
+        return FakeSearchResult(f"{profile} answer to {query}")
 
 
 class TestGraphRAGService:
     """测试GraphRAG服务"""
 
+    def test_stream_search_context_last(self):
+        """测试流式搜索先输出回答片段，最后输出上下文数据"""
+        registry = GraphRAGEngineRegistry({"local": FakeStreamingEngine})
+        service = GraphRAGService(registry=registry)
+
+        async def collect():
+            return [chunk async for chunk in service.stream_search("萧炎的父亲是谁?")]
+
+        chunks = asyncio.run(collect())
+        assert chunks[:2] == ["萧炎的父亲", "是萧战。"]
+        assert chunks[-1] == {"entities": [{"id": "1", "entity": "萧炎"}]}
+        registry.shutdown()
+
+    def test_batch_search(self):
+        """测试批量搜索：限制并发、隔离失败、去重预取查询向量"""
+        engine = FakeBatchEngine()
+        embedder = FakeEmbedder()
+        registry, service = make_batch_service(engine, embedder)
+        queries = [
+            ("慢查询", "local"),
+            ("萧炎的父亲是谁?", "local"),
+            ("失败查询", "local"),
+            ("萧炎的父亲是谁?", "local"),
+            ("斗气大陆的势力", "global"),
+        ]
+
+        async def collect():
+            return [item async for item in service.batch_search(queries, concurrency=2)]
+
+        results = asyncio.run(collect())
+        registry.shutdown()
+
+        assert sorted(index for index, _, _ in results) == [0, 1, 2, 3, 4]
+        # 先完成的结果先产出
+        assert results[-1][0] == 0
+        by_index = {index: (result, error) for index, result, error in results}
+        assert by_index[1] == by_index[3] == ("answer to 萧炎的父亲是谁?", None)
+        assert by_index[2] == (None, "upstream error")
+        assert engine.max_running <= 2
+        # 只对需要向量化的模式预取，相同查询只请求一次
+        assert sorted(embedder.texts) == sorted(["慢查询", "萧炎的父亲是谁?", "失败查询"])
+
+    def test_search_report_profile(self):
+        """测试全局搜索按请求的档位搜索，不同档位的回答分别缓存，不支持档位的搜索引擎不传入档位"""
+        engine = FakeProfiledEngine()
+        registry = GraphRAGEngineRegistry({"global": lambda: engine, "local": FakeBatchEngine})
+        service = GraphRAGService(registry=registry, answer_cache=AnswerCache())
+
+        async def run():
+            return [
+                await service.search("斗气大陆", "global", profile="fast"),
+                await service.search("斗气大陆", "global", profile="fast"),
+                await service.search("斗气大陆", "global", profile="quality"),
+                await service.search("斗气大陆", "global"),
+                await service.search("斗气大陆", "local", profile="fast"),
+            ]
+
+        answers = asyncio.run(run())
+        registry.shutdown()
+
+        assert answers[:4] == [
+            "fast answer to 斗气大陆",
+            "fast answer to 斗气大陆",
+            "quality answer to 斗气大陆",
+            "quality answer to 斗气大陆",
+        ]
+        # 未指定档位时使用默认档位，与 quality 的上下文参数相同，命中缓存
+        assert engine.profiles == ["fast", "quality"]
+        assert answers[4] == "answer to 斗气大陆"
+
     def test_initialization(self):
         """测试服务初始化"""
         service = GraphRAGService()
@@ -15,6 +235,665 @@ class TestGraphRAGService:
         assert service.drift_search_engine is None
 
 
+class TestGraphRAGEngineRegistry:
+    """测试GraphRAG搜索引擎注册表"""
+
+    def test_engine_built_once(self):
+        """测试并发请求共享同一次构建"""
+        build_count = {"local": 0}
+        release = threading.Event()
+
+        def build_local():
+            release.wait(timeout=5)
+            build_count["local"] += 1
+            return object()
+
+        registry = GraphRAGEngineRegistry({"local": build_local})
+
+        async def fetch_all():
+            tasks = [registry.get_engine("local") for _ in range(5)]
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        engines = asyncio.run(fetch_all())
+        assert build_count["local"] == 1
+        assert all(engine is engines[0] for engine in engines)
+        assert registry.is_ready()
+        registry.shutdown()
+
+    def test_warm_up_and_status(self):
+        """测试后台预热与状态报告"""
+        release = threading.Event()
+
+        def build_local():
+            release.wait(timeout=5)
+            return "engine"
+
+        registry = GraphRAGEngineRegistry({"local": build_local})
+        assert registry.status()["local"]["state"] == "pending"
+        assert registry.peek("local") is None
+
+        registry.warm_up()
+        assert registry.status()["local"]["state"] == "building"
+        assert not registry.is_ready()
+
+        release.set()
+        assert asyncio.run(registry.get_engine("local")) == "engine"
+        status = registry.status()["local"]
+        assert status["state"] == "ready"
+        assert status["build_time"] is not None
+        registry.shutdown()
+
+    def test_failed_build_is_retried(self):
+        """测试构建失败后下次请求重新构建"""
+        attempts = []
+
+        def build_local():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("index not found")
+            return "engine"
+
+        registry = GraphRAGEngineRegistry({"local": build_local})
+        with pytest.raises(RuntimeError):
+            asyncio.run(registry.get_engine("local"))
+        assert registry.status()["local"]["state"] == "failed"
+        assert registry.status()["local"]["error"] == "index not found"
+
+        assert asyncio.run(registry.get_engine("local")) == "engine"
+        assert len(attempts) == 2
+        registry.shutdown()
+
+    def test_unsupported_mode(self):
+        """测试不支持的搜索模式"""
+        registry = GraphRAGEngineRegistry({"local": lambda: "engine"})
+        with pytest.raises(ValueError):
+            registry.warm_up(["unknown"])
+
+
+class VersionedEngine:
+    """模拟某个索引版本的搜索引擎，查询在 gate 打开前保持进行中"""
+
+    def __init__(self, version, gate=None):
+        self.version = version
+        self.gate = gate
+
+    async def asearch(self, query):
+        if self.gate is not None:
+            await self.gate.wait()
+        return FakeSearchResult(f"{self.version}: {query}")
+
+
+class FakeLLM:
+    """模拟流式生成的LLM：等待首个token后逐个回调生成的token"""
+
+    async def agenerate(self, messages, streaming=True, callbacks=None, **kwargs):
+        await asyncio.sleep(0.03)
+        for token in ("萧炎", "的父亲", "是萧战"):
+            for callback in callbacks or []:
+                callback.on_llm_new_token(token)
+            await asyncio.sleep(0.01)
+        return "萧炎 的父亲 是萧战"
+
+
+class FakeSyncEmbedder:
+    def embed(self, text):
+        time.sleep(0.02)
+        return [1.0, 0.0]
+
+
+class FakeVectorStore:
+    def similarity_search_by_text(self, text, text_embedder, k=10):
+        vector = text_embedder(text)
+        time.sleep(0.01)
+        return [vector]
+
+
+class FakeMixedContextBuilder:
+    """模拟本地搜索的上下文构建器：向量检索实体后拼接上下文"""
+
+    def __init__(self):
+        self.text_embedder = FakeSyncEmbedder()
+        self.entity_text_embeddings = FakeVectorStore()
+
+    def build_context(self, query, **kwargs):
+        self.entity_text_embeddings.similarity_search_by_text(
+            query, lambda text: self.text_embedder.embed(text)
+        )
+        time.sleep(0.01)
+        return FakeContextResult("实体 关系", {})
+
+
+class FakeTracedEngine:
+    """模拟本地搜索引擎：构建上下文后调用LLM"""
+
+    def __init__(self):
+        self.llm = FakeLLM()
+        self.context_builder = FakeMixedContextBuilder()
+        self.token_encoder = FakeTokenEncoder()
+        self.context_builder_params = {}
+
+    async def asearch(self, query):
+        context = self.context_builder.build_context(query)
+        messages = [{"role": "system", "content": context.context_chunks}, {"role": "user", "content": query}]
+        return FakeSearchResult(await self.llm.agenerate(messages))
+
+
+class UpstreamUnavailable(Exception):
+    """模拟上游LLM所有端点熔断时的异常"""
+
+    retry_after = 12.0
+
+
+class FakeOpenCircuitLLM(FakeLLM):
+    """模拟上游熔断的LLM：调用失败后所有端点熔断"""
+
+    def __init__(self, open=False):
+        self.open = open
+        self.calls = 0
+
+    def retry_after(self):
+        return UpstreamUnavailable.retry_after if self.open else None
+
+    async def agenerate(self, messages, streaming=True, callbacks=None, **kwargs):
+        self.calls += 1
+        self.open = True
+        raise UpstreamUnavailable()
+
+
+class FakeSwallowingEngine(FakeTracedEngine):
+    """与 graphrag 的搜索引擎一样，LLM调用失败时返回空回答"""
+
+    def __init__(self, llm):
+        super().__init__()
+        self.llm = llm
+
+    async def asearch(self, query):
+        try:
+            return await super().asearch(query)
+        except Exception:
+            return FakeSearchResult("")
+
+
+class FakeCommunitySelection:
+    """模拟全局搜索的报告预筛选：查询向量化后选出报告"""
+
+    def __init__(self):
+        self.text_embedder = FakeEmbedder()
+
+    async def select(self, query):
+        await self.text_embedder.aembed(query)
+        return ["报告一"], {"llm_calls": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+
+class FakePrefilterContextBuilder:
+    """模拟带报告预筛选的全局搜索上下文构建器"""
+
+    def __init__(self):
+        self.dynamic_community_selection = FakeCommunitySelection()
+
+    async def build_context(self, query, **kwargs):
+        reports, _ = await self.dynamic_community_selection.select(query)
+        return FakeContextResult(reports, {})
+
+
+class TestGraphRAGTrace:
+    """测试请求耗时分解"""
+
+    def test_instrumented_engine_stages(self):
+        """测试各阶段只记录自身耗时，LLM首token和生成耗时分开记录"""
+        engine = instrument_engine(FakeTracedEngine())
+        histograms = GraphRAGTraceHistograms()
+        registry = GraphRAGEngineRegistry({"local": lambda: engine})
+        service = GraphRAGService(
+            registry=registry, pools=GraphRAGConcurrencyPools({}, {}), histograms=histograms
+        )
+        trace = GraphRAGTrace("local", request_id="req-1")
+        answer = asyncio.run(service.search("萧炎 的父亲", "local", trace=trace))
+        registry.shutdown()
+
+        assert answer == "萧炎 的父亲 是萧战"
+        stages = trace.to_dict()["stages"]
+        assert set(stages) == {
+            "engine", "queue", "embed", "retrieve", "build_context", "llm_ttft", "llm_completion"
+        }
+        assert stages["embed"] >= 0.02
+        # 检索和上下文构建不包含嵌套在其中的向量化和检索耗时
+        assert 0.01 <= stages["retrieve"] < 0.03
+        assert 0.01 <= stages["build_context"] < 0.03
+        assert stages["llm_ttft"] >= 0.03
+        assert stages["llm_completion"] >= 0.03
+        assert trace.llm_calls == 1
+        assert (trace.prompt_tokens, trace.completion_tokens) == (4, 3)
+        assert trace.total >= sum(stages.values())
+
+        snapshot = histograms.snapshot()["local"]
+        assert snapshot["total"]["count"] == 1
+        assert snapshot["embed"]["buckets"]["0.05"] == 1
+        assert snapshot["prompt_tokens"]["sum"] == 4
+
+    def test_uninstrumented_calls_not_recorded(self):
+        """测试请求之外的调用（如预热）不计时"""
+        engine = instrument_engine(FakeTracedEngine())
+        trace = GraphRAGTrace("local")
+        asyncio.run(engine.asearch("萧炎"))
+        assert trace.stages == {} and trace.llm_calls == 0
+        # 重复包装不会嵌套代理
+        assert instrument_engine(engine).llm is engine.llm
+
+    def test_prefilter_embedding_recorded(self):
+        """测试全局搜索报告预筛选的查询向量化计入 embed 阶段"""
+        context_builder = FakePrefilterContextBuilder()
+        engine = FakeTracedEngine()
+        engine.context_builder = context_builder
+        instrument_engine(engine)
+        trace = GraphRAGTrace("global")
+        with trace.activate():
+            asyncio.run(engine.context_builder.build_context("萧炎"))
+        assert context_builder.dynamic_community_selection.text_embedder.texts == ["萧炎"]
+        assert set(trace.stages) == {"embed", "build_context"}
+
+    def test_upstream_unavailable_fails_fast(self):
+        """测试上游熔断导致的空回答不返回也不缓存，熔断期间的请求不再调用搜索引擎"""
+        llm = FakeOpenCircuitLLM()
+        engine = instrument_engine(FakeSwallowingEngine(llm))
+        registry = GraphRAGEngineRegistry({"local": lambda: engine})
+        service = GraphRAGService(
+            registry=registry, answer_cache=AnswerCache(), pools=GraphRAGConcurrencyPools({}, {})
+        )
+        trace = GraphRAGTrace("local")
+        try:
+            with pytest.raises(ServiceUnavailableException) as first:
+                asyncio.run(service.search("萧炎", "local", trace=trace))
+            with pytest.raises(ServiceUnavailableException) as second:
+                asyncio.run(service.search("萧炎", "local"))
+        finally:
+            registry.shutdown()
+
+        assert trace.llm_errors == 1
+        assert first.value.headers["Retry-After"] == "12"
+        assert second.value.error_details["reason"] == "circuit_open"
+        assert llm.calls == 1
+
+
+class TestGraphRAGIndexManager:
+    """测试索引版本热切换"""
+
+    def make_manager(self, snapshot, fail=(), released=None):
+        def factory():
+            version = snapshot["version"]
+
+            def build():
+                if version in fail:
+                    raise RuntimeError("broken index")
+                return VersionedEngine(version, snapshot.get("gate"))
+
+            release = None if released is None else functools.partial(released.append, version)
+            return GraphRAGEngineRegistry({"local": build}, release=release)
+
+        return GraphRAGIndexManager(factory, lambda: snapshot["version"])
+
+    def test_reload_skips_unchanged_snapshot(self):
+        """测试快照未变化时不重新构建"""
+        manager = self.make_manager({"version": "v1"})
+        assert manager.current.version == "v1"
+        assert not asyncio.run(manager.reload())
+        assert manager.current.version == "v1"
+        manager.shutdown()
+
+    def test_inflight_query_finishes_on_old_version(self):
+        """测试切换前开始的查询继续使用旧版本，结束后旧版本被释放"""
+        snapshot = {"version": "v1"}
+        released = []
+        manager = self.make_manager(snapshot, released=released)
+        service = GraphRAGService(
+            index_manager=manager,
+            answer_cache=AnswerCache(),
+            pools=GraphRAGConcurrencyPools({}, {}),
+        )
+
+        async def run():
+            snapshot["gate"] = gate = asyncio.Event()
+            old_query = asyncio.ensure_future(service.search("萧炎", "local"))
+            await asyncio.sleep(0.05)
+            assert manager.current.inflight == 1
+
+            snapshot.update(version="v2", gate=None)
+            assert await manager.reload()
+            assert manager.current.version == "v2"
+            assert [index["version"] for index in manager.status()["retired"]] == ["v1"]
+            assert [index.version for index in manager.indexes()] == ["v2", "v1"]
+            # 旧版本的数据在进行中的查询结束前不释放
+            assert released == []
+            # 新查询使用新版本，不等待旧版本的查询
+            assert await service.search("萧炎", "local") == "v2: 萧炎"
+
+            gate.set()
+            assert await old_query == "v1: 萧炎"
+            assert manager.status()["retired"] == []
+            assert released == ["v1"]
+            # 回答缓存按索引版本区分，旧版本的回答不会返回给新版本的查询
+            assert await service.search("萧炎", "local") == "v2: 萧炎"
+
+        asyncio.run(run())
+        manager.shutdown()
+
+    def test_failed_build_keeps_current_version(self):
+        """测试新版本构建失败时继续使用旧版本"""
+        snapshot = {"version": "v1"}
+        manager = self.make_manager(snapshot, fail=("v2",))
+        service = GraphRAGService(
+            index_manager=manager, pools=GraphRAGConcurrencyPools({}, {})
+        )
+
+        async def run():
+            assert await service.search("萧炎", "local") == "v1: 萧炎"
+            snapshot["version"] = "v2"
+            assert not await manager.reload()
+            assert manager.current.version == "v1"
+            assert "broken index" in manager.status()["last_error"]
+            assert await service.search("萧炎", "local") == "v1: 萧炎"
+
+        asyncio.run(run())
+        manager.shutdown()
+
+
+class TestGraphRAGCorpusRegistry:
+    """测试多语料按需加载与内存预算淘汰"""
+
+    def make_registry(self, sizes, memory_budget=0):
+        released = []
+
+        def load(name, data_dir):
+            registry = GraphRAGEngineRegistry({"local": lambda: VersionedEngine(name)})
+            manager = GraphRAGIndexManager.for_registry(registry, version="v1")
+            return GraphRAGCorpus(
+                name,
+                manager,
+                size_provider=lambda: sizes[name],
+                release=lambda: released.append(name),
+            )
+
+        corpora = GraphRAGCorpusRegistry(
+            {name: f"/data/{name}/output" for name in sizes},
+            loader=load,
+            default="a",
+            memory_budget=memory_budget,
+        )
+        return corpora, released
+
+    def test_search_routes_by_corpus(self):
+        """测试查询按语料路由，回答缓存按语料区分"""
+        corpora, _ = self.make_registry({"a": 1, "b": 1})
+        service = GraphRAGService(
+            corpora=corpora,
+            answer_cache=AnswerCache(),
+            pools=GraphRAGConcurrencyPools({}, {}),
+        )
+
+        async def run():
+            assert await service.search("萧炎", "local") == "a: 萧炎"
+            assert await service.search("萧炎", "local", "b") == "b: 萧炎"
+            with pytest.raises(NotFoundException):
+                await service.search("萧炎", "local", "unknown")
+
+        asyncio.run(run())
+        status = {item["name"]: item for item in corpora.status()}
+        assert status["a"]["resident"] and status["b"]["resident"]
+        assert status["b"]["load_time"] > 0
+        corpora.shutdown()
+
+    def test_engine_properties_do_not_load_corpus(self):
+        """测试服务的搜索引擎属性只查看已加载的语料，不触发加载"""
+        corpora, _ = self.make_registry({"a": 1})
+        service = GraphRAGService(corpora=corpora, pools=GraphRAGConcurrencyPools({}, {}))
+        assert service.index_manager is None
+        assert service.local_search_engine is None
+        assert corpora.status() == [{"name": "a", "resident": False}]
+
+        asyncio.run(service.search("萧炎", "local"))
+        assert service.local_search_engine is not None
+        corpora.shutdown()
+
+    def test_aget_starts_watching_on_loop(self):
+        """测试在线程中加载语料后，回到事件循环线程启动索引快照检查"""
+        corpora, _ = self.make_registry({"a": 1, "b": 1})
+        corpora.start_watching(60)
+
+        async def run():
+            corpus = await corpora.aget("b")
+            await corpora.warm_up(name="a")
+            return corpus
+
+        corpus = asyncio.run(run())
+        assert corpus.manager._watch_task is not None
+        assert corpora.peek("a").manager._watch_task is not None
+        corpora.shutdown()
+
+    def test_lru_eviction_under_budget(self):
+        """测试超过内存预算时淘汰最久未使用的语料，淘汰后可重新加载"""
+        corpora, released = self.make_registry({"a": 60, "b": 30, "c": 30}, memory_budget=100)
+        corpora.get("a")
+        corpora.get("b")
+        assert corpora.enforce_budget() == []
+
+        corpora.get("c")
+        assert corpora.enforce_budget() == ["a"]
+        assert released == ["a"]
+        assert [item["resident"] for item in corpora.status()] == [False, True, True]
+        assert corpora.stats()["resident_bytes"] == 60
+
+        corpora.get("a")
+        assert corpora.enforce_budget() == ["b"]
+        corpora.shutdown()
+
+    def test_inflight_corpus_not_evicted(self):
+        """测试有进行中查询的语料不会被淘汰"""
+        corpora, released = self.make_registry({"a": 80, "b": 80}, memory_budget=100)
+
+        async def run():
+            async with corpora.acquire("a"):
+                async with corpora.acquire("b"):
+                    pass
+                # b 结束时 a 仍在使用，不淘汰
+                assert released == []
+            # a 结束后成为最近使用的语料，b 为空闲的冷语料
+            assert released == ["b"]
+
+        asyncio.run(run())
+        corpora.shutdown()
+
+
+    def test_version_changes_on_swap_not_eviction(self):
+        """测试语料组合版本在热更新后变化，语料被淘汰时不变，语义缓存随之清空"""
+        snapshots = {"a": "v1", "b": "v1"}
+
+        def load(name, data_dir):
+            manager = GraphRAGIndexManager(
+                lambda: GraphRAGEngineRegistry({"local": lambda: VersionedEngine(name)}),
+                lambda: snapshots[name],
+            )
+            return GraphRAGCorpus(name, manager, size_provider=lambda: 60)
+
+        corpora = GraphRAGCorpusRegistry(
+            {"a": "/data/a/output", "b": "/data/b/output"}, loader=load, memory_budget=100
+        )
+        cache = SemanticAnswerCache(None, version_provider=corpora.version)
+        assert corpora.version() == ""
+        corpora.get("a")
+        corpora.get("b")
+        assert corpora.enforce_budget() == ["a"]
+        assert corpora.version() == "a@v1,b@v1"
+
+        cache.store(np.array([1.0, 0.0], dtype=np.float32), "local", "萧战")
+        assert cache.lookup(np.array([1.0, 0.0], dtype=np.float32), "local") == "萧战"
+        snapshots["b"] = "v2"
+        assert asyncio.run(corpora.manager("b").reload())
+        assert corpora.version() == "a@v1,b@v2"
+        assert cache.lookup(np.array([1.0, 0.0], dtype=np.float32), "local") is None
+        assert cache.stats()["entries"] == 0
+        corpora.shutdown()
+
+
+class TestGraphRAGConcurrencyPools:
+    """测试按搜索模式隔离的并发池"""
+
+    def test_limit_and_queue(self):
+        """测试并发上限、排队顺序和排队已满时拒绝"""
+        pool = ModeConcurrencyPool("global", limit=1, queue_size=1)
+        order = []
+
+        async def job(name):
+            async with pool.slot():
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        async def run():
+            first = asyncio.ensure_future(job("first"))
+            second = asyncio.ensure_future(job("second"))
+            await asyncio.sleep(0)
+            assert pool.stats()["active"] == 1
+            assert pool.stats()["queued"] == 1
+            with pytest.raises(TooManyRequestsException):
+                await job("third")
+            await asyncio.gather(first, second)
+
+        asyncio.run(run())
+        assert order == ["first", "second"]
+        stats = pool.stats()
+        assert stats["active"] == 0
+        assert stats["completed"] == 2
+        assert stats["rejected"] == 1
+
+    def test_cancelled_waiter(self):
+        """测试排队中的请求被取消后不占用名额"""
+        pool = ModeConcurrencyPool("local", limit=1, queue_size=2)
+
+        async def run():
+            await pool.acquire()
+            waiter = asyncio.ensure_future(pool.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            pool.release()
+
+        asyncio.run(run())
+        assert pool.stats()["active"] == 0
+        assert pool.stats()["queued"] == 0
+
+    def test_queue_timeout(self):
+        """测试排队超时返回503并带重试等待时间"""
+        pool = ModeConcurrencyPool("drift", limit=1, queue_size=1, queue_timeout=0.01)
+
+        async def run():
+            await pool.acquire()
+            with pytest.raises(ServiceUnavailableException) as exc_info:
+                await pool.acquire()
+            return exc_info.value
+
+        exc = asyncio.run(run())
+        assert exc.code == 503
+        assert int(exc.headers["Retry-After"]) >= 1
+        assert pool.stats()["timeouts"] == 1
+        assert pool.stats()["queued"] == 0
+
+    def test_aimd_limit(self):
+        """测试并发上限在上游变慢或报错时乘性缩减，恢复后加性增长"""
+        pool = ModeConcurrencyPool("local", limit=8, queue_size=0, min_limit=2, backoff=0.5)
+
+        def complete(latency, ok=True):
+            pool.active += 1
+            pool.release(latency, ok)
+
+        complete(0.1)
+        assert pool.stats()["limit"] == 8
+        complete(1.0)
+        assert pool.stats()["limit"] == 4
+        # 同一基线延迟周期内不重复缩减
+        complete(1.0)
+        assert pool.stats()["limit"] == 4
+        pool._last_decrease = 0.0
+        complete(0.1, ok=False)
+        assert pool.stats()["limit"] == 2
+        pool._last_decrease = 0.0
+        complete(1.0)
+        assert pool.stats()["limit"] == 2
+        for _ in range(20):
+            complete(0.1)
+        assert pool.stats()["limit"] > 2
+
+    def test_fast_failures_do_not_lower_baseline(self):
+        """测试快速失败不拉低基线延迟，之后正常延迟的成功调用使并发上限恢复增长"""
+        pool = ModeConcurrencyPool("local", limit=8, queue_size=0, min_limit=2, backoff=0.5)
+
+        def complete(latency, ok=True):
+            pool.active += 1
+            pool.release(latency, ok)
+
+        complete(0.5)
+        for _ in range(5):
+            pool._last_decrease = 0.0
+            complete(0.001, ok=False)
+        assert pool.stats()["limit"] == 2
+        assert pool.stats()["baseline_latency"] == 0.5
+        assert pool.stats()["latency"] == 0.5
+        for _ in range(20):
+            complete(0.5)
+        assert pool.stats()["limit"] > 2
+
+    def test_empty_result_counts_as_failure(self):
+        """测试没有抛出异常但被标记为失败的调用按失败缩减并发上限"""
+        pool = ModeConcurrencyPool("global", limit=4, queue_size=0, backoff=0.5)
+
+        async def run():
+            async with pool.slot():
+                pass
+            async with pool.slot() as outcome:
+                outcome.fail()
+
+        asyncio.run(run())
+        assert pool.stats()["limit"] == 2
+
+    def test_stream_releases_slot_after_upstream(self):
+        """测试流式搜索在上游生成结束后释放名额，客户端读取慢不占用名额"""
+        pools = GraphRAGConcurrencyPools({"local": 1}, {})
+        registry = GraphRAGEngineRegistry({"local": FakeStreamingEngine})
+        service = GraphRAGService(registry=registry, pools=pools)
+
+        async def run():
+            stream = service.stream_search("萧炎的父亲是谁?")
+            first = await stream.__anext__()
+            # 客户端还没有读完，上游已生成完毕
+            await asyncio.sleep(0.01)
+            active = pools.stats()["local"]["active"]
+            rest = [chunk async for chunk in stream]
+            return first, active, rest
+
+        first, active, rest = asyncio.run(run())
+        registry.shutdown()
+        assert first == "萧炎的父亲"
+        assert active == 0
+        assert rest[0] == "是萧战。"
+
+    def test_modes_isolated(self):
+        """测试全局搜索占满名额时不影响本地搜索"""
+        pools = GraphRAGConcurrencyPools({"local": 1, "global": 1}, {})
+
+        async def run():
+            async with pools.slot("global"):
+                with pytest.raises(TooManyRequestsException):
+                    async with pools.slot("global"):
+                        pass
+                async with pools.slot("local"):
+                    pass
+                # 未配置并发池的模式不限制
+                async with pools.slot("drift"):
+                    pass
+
+        asyncio.run(run())
+        assert pools.stats()["local"]["completed"] == 1
+
+
 class TestToolService:
     """测试工具服务"""
 
@@ -87,6 +966,295 @@ class TestGraphRAGAPI:
             assert isinstance(data["result"], str)
             assert len(data["result"]) > 0
 
+    def test_chat_api_mode(self, client):
+        """测试聊天API按指定搜索模式查询"""
+        registry, service = make_batch_service(FakeBatchEngine())
+        app.dependency_overrides[get_graphrag_service] = lambda: service
+        try:
+            response = client.post(
+                "/api/v1/graphrag/chat",
+                json={"query": "斗气大陆的势力", "mode": "global"},
+            )
+            invalid = client.post(
+                "/api/v1/graphrag/chat", json={"query": "q", "mode": "unknown"}
+            )
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        assert response.status_code == 200
+        assert response.json()["tool_info"]["name"] == "global_asearch"
+        assert invalid.status_code == 400
+
+    def test_context_api(self, client):
+        """测试上下文检索API只构建上下文，不调用LLM，相同查询从缓存返回"""
+        local = FakeContextEngine(FakeLocalContextBuilder())
+        global_ = FakeContextEngine(FakeGlobalContextBuilder())
+        embedder = FakeEmbedder()
+        registry = GraphRAGEngineRegistry({"local": lambda: local, "global": lambda: global_})
+        service = GraphRAGService(
+            registry=registry,
+            answer_cache=AnswerCache(),
+            embedder=embedder,
+            pools=GraphRAGConcurrencyPools({}, {}),
+        )
+        app.dependency_overrides[get_graphrag_service] = lambda: service
+        try:
+            first = client.post("/api/v1/graphrag/context", json={"query": "萧炎 的父亲"})
+            second = client.post("/api/v1/graphrag/context", json={"query": "萧炎 的父亲"})
+            global_response = client.post(
+                "/api/v1/graphrag/context", json={"query": "主要势力", "mode": "global"}
+            )
+            drift = client.post(
+                "/api/v1/graphrag/context", json={"query": "q", "mode": "drift"}
+            )
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        assert first.status_code == 200
+        data = first.json()
+        assert data["context_text"] == "-----Entities-----\n萧炎 的父亲"
+        assert data["context_tokens"] == 3
+        assert data["record_counts"] == {"entities": 2}
+        assert data["context_data"]["entities"][0]["entity"] == "萧炎"
+        assert second.json() == data
+        assert local.context_builder.calls == 1
+        assert embedder.texts == ["萧炎 的父亲"]
+
+        assert global_response.status_code == 200
+        assert global_response.json()["chunk_tokens"] == [1, 2]
+        assert drift.status_code == 400
+        assert local.searched == 0 and global_.searched == 0
+
+    def test_chat_api_timings(self, client):
+        """测试聊天API按需返回耗时分解，并汇总到直方图"""
+        registry, service = make_batch_service(FakeBatchEngine())
+        service.histograms = GraphRAGTraceHistograms()
+        app.dependency_overrides[get_graphrag_service] = lambda: service
+        try:
+            response = client.post(
+                "/api/v1/graphrag/chat",
+                json={"query": "萧炎", "include_timings": True},
+                headers={"X-Request-ID": "req-42"},
+            )
+            cached = client.post(
+                "/api/v1/graphrag/chat", json={"query": "萧炎", "include_timings": True}
+            )
+            plain = client.post("/api/v1/graphrag/chat", json={"query": "萧炎"})
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        timings = response.json()["timings"]
+        assert timings["request_id"] == "req-42"
+        assert timings["mode"] == "local"
+        assert timings["total"] >= 0.01
+        assert {"engine", "queue"} <= set(timings["stages"])
+        assert timings["cache"] is None
+        assert cached.json()["timings"]["cache"] == "answer"
+        assert plain.json()["timings"] is None
+        assert service.histograms.snapshot()["local"]["total"]["count"] == 3
+
+    def test_timings_api(self, client):
+        """测试耗时直方图API"""
+        response = client.get("/api/v1/graphrag/timings")
+        assert response.status_code == 200
+        for metrics in response.json().values():
+            assert all("+Inf" in histogram["buckets"] for histogram in metrics.values())
+
+    def test_chat_api_pool_full(self, client):
+        """测试搜索模式并发池排队已满时返回429"""
+        registry, service = make_batch_service(FakeBatchEngine())
+        service.pools = GraphRAGConcurrencyPools({"local": 0}, {"local": 0})
+        app.dependency_overrides[get_graphrag_service] = lambda: service
+        try:
+            response = client.post("/api/v1/graphrag/chat", json={"query": "q"})
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        assert response.status_code == 429
+        assert response.json()["error_details"]["mode"] == "local"
+        assert int(response.headers["Retry-After"]) >= 1
+
+    def test_chat_api_upstream_unavailable(self, client):
+        """测试上游LLM所有端点熔断时直接返回503，不占用并发池名额"""
+        engine = FakeSwallowingEngine(FakeOpenCircuitLLM(open=True))
+        registry, service = make_batch_service(engine)
+        service.pools = GraphRAGConcurrencyPools({"local": 1}, {"local": 1})
+        app.dependency_overrides[get_graphrag_service] = lambda: service
+        try:
+            response = client.post("/api/v1/graphrag/chat", json={"query": "q"})
+            stream = client.post("/api/v1/graphrag/chat/stream", json={"query": "q"})
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "12"
+        assert stream.status_code == 503
+        assert engine.llm.calls == 0
+        assert service.pools.stats()["local"]["completed"] == 0
+
+    def test_pool_stats_api(self, client):
+        """测试并发池统计API"""
+        response = client.get("/api/v1/graphrag/pools")
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data) == {"local", "global", "drift"}
+        assert "queued" in data["global"]
+
+    def test_chat_stream_api(self, client):
+        """测试SSE流式聊天API"""
+        registry = GraphRAGEngineRegistry({"local": FakeStreamingEngine})
+        app.dependency_overrides[get_graphrag_service] = lambda: GraphRAGService(
+            registry=registry
+        )
+        try:
+            response = client.post(
+                "/api/v1/graphrag/chat/stream", json={"query": "萧炎的父亲是谁?"}
+            )
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(response.text)
+        assert [event for event, _ in events] == ["token", "token", "context", "done"]
+        assert events[0][1] == {"content": "萧炎的父亲"}
+        assert events[2][1]["entities"][0]["entity"] == "萧炎"
+
+    def test_chat_stream_api_unsupported_mode(self, client):
+        """测试流式聊天API不支持的搜索模式在请求校验时拒绝，不开始事件流"""
+        response = client.post(
+            "/api/v1/graphrag/chat/stream", json={"query": "萧炎的父亲是谁?", "mode": "drift"}
+        )
+        assert response.status_code == 400  # 项目使用自定义异常处理器，请求校验失败返回400
+        assert not response.headers["content-type"].startswith("text/event-stream")
+
+    def test_chat_stream_api_timings(self, client):
+        """测试SSE流式聊天API在结束前返回耗时分解"""
+        registry = GraphRAGEngineRegistry({"local": FakeStreamingEngine})
+        app.dependency_overrides[get_graphrag_service] = lambda: GraphRAGService(
+            registry=registry
+        )
+        try:
+            response = client.post(
+                "/api/v1/graphrag/chat/stream",
+                json={"query": "萧炎的父亲是谁?", "include_timings": True},
+            )
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        events = parse_sse(response.text)
+        assert [event for event, _ in events] == ["token", "token", "context", "timings", "done"]
+        timings = events[3][1]
+        assert 0 <= timings["first_token"] <= timings["total"]
+
+    def test_chat_batch_api(self, client):
+        """测试批量聊天API按请求顺序返回结果"""
+        registry, service = make_batch_service(FakeBatchEngine())
+        app.dependency_overrides[get_graphrag_service] = lambda: service
+        try:
+            response = client.post(
+                "/api/v1/graphrag/chat/batch",
+                json={
+                    "queries": [
+                        {"query": "慢查询"},
+                        {"query": "失败查询"},
+                        {"query": "斗气大陆的势力", "mode": "global"},
+                    ]
+                },
+            )
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [item["index"] for item in results] == [0, 1, 2]
+        assert results[0]["result"] == "answer to 慢查询"
+        assert results[1]["error"] == "upstream error"
+        assert results[2]["mode"] == "global"
+
+    def test_chat_batch_stream_api(self, client):
+        """测试批量聊天API以NDJSON逐条返回先完成的结果"""
+        registry, service = make_batch_service(FakeBatchEngine())
+        app.dependency_overrides[get_graphrag_service] = lambda: service
+        try:
+            response = client.post(
+                "/api/v1/graphrag/chat/batch",
+                json={
+                    "queries": [{"query": "慢查询"}, {"query": "萧炎的父亲是谁?"}],
+                    "stream": True,
+                },
+            )
+        finally:
+            del app.dependency_overrides[get_graphrag_service]
+            registry.shutdown()
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.strip().split("\n")]
+        assert [line["index"] for line in lines] == [1, 0]
+
+    def test_chat_batch_api_too_many_queries(self, client):
+        """测试批量聊天API超过最大查询数"""
+        queries = [{"query": "q"}] * (graphrag_config.BATCH_MAX_QUERIES + 1)
+        response = client.post("/api/v1/graphrag/chat/batch", json={"queries": queries})
+        assert response.status_code == 400
+
+    def test_cache_stats_api(self, client):
+        """测试回答缓存统计API"""
+        response = client.get("/api/v1/graphrag/cache/stats")
+        assert response.status_code == 200
+        data = response.json()
+        for field in ("entries", "hits", "misses", "coalesced", "hit_rate"):
+            assert field in data
+        assert "hit_rate" in data["semantic"]
+
+    def test_graphrag_stack_imported_lazily(self):
+        """测试导入应用不会导入GraphRAG查询栈"""
+        code = (
+            "import sys, main; "
+            "assert not {'graphrag_server', 'graphrag', 'pandas', 'tiktoken'} & set(sys.modules)"
+        )
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+
+    def test_graphrag_server_import_does_not_print_secrets(self):
+        """测试导入GraphRAG查询栈不输出API Key"""
+        code = (
+            "import logging, sys; logging.basicConfig(level=logging.DEBUG); "
+            "sys.path.insert(0, 'design_docs/mcp_rag_agent_graphrag_demo'); import graphrag_server"
+        )
+        env = {**os.environ, "API_KEY": "sk-test-secret-key"}
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+        assert result.returncode == 0, result.stderr
+        assert "sk-test-secret-key" not in result.stdout + result.stderr
+
+    def test_startup_report_api(self, client):
+        """测试GraphRAG查询栈导入耗时报告API"""
+        response = client.get("/api/v1/graphrag/startup")
+        assert response.status_code == 200
+        data = response.json()
+        if data["loaded"]:
+            assert data["total"] > 0
+            assert "graphrag_server" in {item["module"] for item in data["modules"]} | set(
+                data["packages"]
+            )
+
+    def test_readiness_api(self, client):
+        """测试就绪检查API"""
+        response = client.get("/api/v1/graphrag/ready")
+        assert response.status_code in (200, 503)
+        data = response.json()
+        assert data["ready"] is (response.status_code == 200)
+        assert set(data["engines"]) == {"local", "global", "drift"}
+
     def test_chat_api_invalid_request(self, client):
         """测试聊天API无效请求"""
         # 测试缺少query参数
@@ -0,0 +1,264 @@
+import asyncio
+import pytest
+from app.services.graphrag_cache import (
+    AnswerCache,
+    SemanticAnswerCache,
+    make_cache_key,
+    normalize_query,
+)
+from app.services.graphrag_registry import GraphRAGEngineRegistry
+from app.services.graphrag_service import GraphRAGService
+
+
+class FakeSearchResult:
+    def __init__(self, response):
+        self.response = response
+
+
+class FakeSearchEngine:
+    """模拟搜索引擎，记录上游调用次数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.context_builder_params = {"max_tokens": 12_000}
+
+    async def asearch(self, query):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return FakeSearchResult(f"answer to {query}")
+
+
+class FakeEmbedder:
+    """模拟向量模型：同义问题映射到相近的向量"""
+
+    vectors = {
+        "萧炎的父亲是谁?": [1.0, 0.0, 0.0],
+        "萧炎父亲是谁?": [0.99, 0.1, 0.0],
+        "萧炎的老师是谁?": [0.0, 1.0, 0.0],
+        "?": [0.0, 0.0, 0.0],
+    }
+
+    def __init__(self):
+        self.calls = 0
+
+    async def aembed(self, text):
+        self.calls += 1
+        return self.vectors[text]
+
+
+class TestCacheKey:
+    """测试缓存键生成"""
+
+    def test_normalize_query(self):
+        """测试查询规范化"""
+        assert normalize_query("  萧炎的父亲是谁？ ") == "萧炎的父亲是谁?"
+        assert normalize_query("Who  is\tXiao Yan") == "who is xiao yan"
+
+    def test_make_cache_key(self):
+        """测试相同查询、模式和参数生成相同的键"""
+        params = {"max_tokens": 12_000}
+        key = make_cache_key("萧炎的父亲是谁?", "local", params)
+        assert key == make_cache_key(" 萧炎的父亲是谁？", "local", params)
+        assert key != make_cache_key("萧炎的父亲是谁?", "global", params)
+        assert key != make_cache_key("萧炎的父亲是谁?", "local", {"max_tokens": 5_000})
+
+
+class TestAnswerCache:
+    """测试回答缓存"""
+
+    def test_lru_eviction(self):
+        """测试超过最大条目数时淘汰最久未使用的条目"""
+        cache = AnswerCache(max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        assert cache.get("a") == "1"
+        cache.set("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        """测试条目过期"""
+        cache = AnswerCache(ttl=0)
+        cache.set("a", "1")
+        assert cache.get("a") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_memory_cap(self):
+        """测试总内存占用上限"""
+        cache = AnswerCache(max_bytes=1024)
+        cache.set("a", "x" * 400)
+        cache.set("b", "y" * 400)
+        cache.set("c", "z" * 400)
+        stats = cache.stats()
+        assert stats["bytes"] <= 1024
+        assert cache.get("a") is None
+        # 单个值超过上限时不缓存
+        cache.set("d", "w" * 2048)
+        assert cache.get("d") is None
+
+    def test_single_flight(self):
+        """测试并发的相同请求只触发一次计算"""
+        cache = AnswerCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        async def run():
+            return await asyncio.gather(
+                *[cache.get_or_compute("key", compute) for _ in range(5)]
+            )
+
+        assert asyncio.run(run()) == ["answer"] * 5
+        assert len(calls) == 1
+        assert asyncio.run(cache.get_or_compute("key", compute)) == "answer"
+        stats = cache.stats()
+        assert stats["misses"] == 1
+        assert stats["coalesced"] == 4
+        assert stats["hits"] == 1
+
+    def test_owner_cancelled(self):
+        """测试发起计算的请求被取消后，等待同一结果的请求重新计算并拿到回答"""
+        cache = AnswerCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def run():
+            owner = asyncio.ensure_future(cache.get_or_compute("key", compute))
+            await asyncio.sleep(0.01)
+            waiters = [asyncio.ensure_future(cache.get_or_compute("key", compute)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            owner.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await owner
+            return await asyncio.gather(*waiters)
+
+        assert asyncio.run(run()) == ["answer", "answer"]
+        # 等待者中只有一个重新计算
+        assert len(calls) == 2
+        assert cache.get("key") == "answer"
+
+    def test_failure_not_cached(self):
+        """测试计算失败和空回答不会被缓存"""
+        cache = AnswerCache()
+
+        async def fail():
+            raise RuntimeError("upstream error")
+
+        async def empty():
+            return ""
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(cache.get_or_compute("key", fail))
+        assert asyncio.run(cache.get_or_compute("key", empty)) == ""
+        assert cache.get("key") is None
+
+
+class TestSemanticAnswerCache:
+    """测试语义回答缓存"""
+
+    def embed(self, cache, query):
+        return asyncio.run(cache.embed(query))
+
+    def test_paraphrase_hit(self):
+        """测试相似问题命中、不相关问题未命中"""
+        cache = SemanticAnswerCache(FakeEmbedder(), threshold=0.95)
+        cache.store(self.embed(cache, "萧炎的父亲是谁?"), "local", "萧战")
+        assert cache.lookup(self.embed(cache, "萧炎父亲是谁?"), "local") == "萧战"
+        assert cache.lookup(self.embed(cache, "萧炎的老师是谁?"), "local") is None
+        # 不同命名空间之间不共享
+        assert cache.lookup(self.embed(cache, "萧炎父亲是谁?"), "global") is None
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 2
+
+    def test_lru_eviction(self):
+        """测试超过最大条目数时淘汰最久未使用的条目"""
+        cache = SemanticAnswerCache(FakeEmbedder(), max_entries=1)
+        cache.store(self.embed(cache, "萧炎的父亲是谁?"), "local", "萧战")
+        cache.store(self.embed(cache, "萧炎的老师是谁?"), "local", "药老")
+        assert cache.lookup(self.embed(cache, "萧炎的父亲是谁?"), "local") is None
+        assert cache.lookup(self.embed(cache, "萧炎的老师是谁?"), "local") == "药老"
+        assert cache.stats()["evictions"] == 1
+
+    def test_version_invalidation(self):
+        """测试索引数据版本变化时清空缓存"""
+        version = {"value": "v1"}
+        cache = SemanticAnswerCache(
+            FakeEmbedder(), version_provider=lambda: version["value"]
+        )
+        cache.store(self.embed(cache, "萧炎的父亲是谁?"), "local", "萧战")
+        version["value"] = "v2"
+        assert cache.lookup(self.embed(cache, "萧炎的父亲是谁?"), "local") is None
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["version"] == "v2"
+
+    def test_zero_vector_skipped(self):
+        """测试模长为0的查询向量不参与语义缓存"""
+        cache = SemanticAnswerCache(FakeEmbedder())
+        assert self.embed(cache, "?") is None
+        assert self.embed(cache, "萧炎的老师是谁?") is not None
+
+
+class TestServiceAnswerCache:
+    """测试GraphRAG服务使用回答缓存"""
+
+    def test_search_uses_cache(self):
+        """测试相同查询只调用一次搜索引擎"""
+        engine = FakeSearchEngine()
+        registry = GraphRAGEngineRegistry({"local": lambda: engine})
+        service = GraphRAGService(registry=registry, answer_cache=AnswerCache())
+
+        async def run():
+            first = await service.local_search("萧炎的父亲是谁?")
+            second = await service.local_search("萧炎的父亲是谁？ ")
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first == second == "answer to 萧炎的父亲是谁?"
+        assert engine.calls == 1
+        registry.shutdown()
+
+    def test_search_uses_semantic_cache(self):
+        """测试同义问题只调用一次搜索引擎"""
+        engine = FakeSearchEngine()
+        registry = GraphRAGEngineRegistry({"local": lambda: engine})
+        service = GraphRAGService(
+            registry=registry,
+            answer_cache=AnswerCache(),
+            semantic_cache=SemanticAnswerCache(FakeEmbedder()),
+        )
+
+        async def run():
+            first = await service.local_search("萧炎的父亲是谁?")
+            second = await service.local_search("萧炎父亲是谁?")
+            third = await service.local_search("萧炎的老师是谁?")
+            return first, second, third
+
+        first, second, third = asyncio.run(run())
+        assert first == second == "answer to 萧炎的父亲是谁?"
+        assert third == "answer to 萧炎的老师是谁?"
+        assert engine.calls == 2
+        registry.shutdown()
+
+    def test_semantic_cache_skips_zero_vector(self):
+        """测试查询向量模长为0时正常搜索，不写入语义缓存"""
+        engine = FakeSearchEngine()
+        registry = GraphRAGEngineRegistry({"local": lambda: engine})
+        semantic_cache = SemanticAnswerCache(FakeEmbedder())
+        service = GraphRAGService(registry=registry, semantic_cache=semantic_cache)
+
+        async def run():
+            return await service.local_search("?")
+
+        assert asyncio.run(run()) == "answer to ?"
+        assert semantic_cache.stats()["entries"] == 0
+        assert semantic_cache.stats()["misses"] == 0
+        registry.shutdown()
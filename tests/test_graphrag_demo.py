@@ -0,0 +1,1029 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+
+import httpcore
+import httpx
+import numpy as np
+import pandas as pd
+import pytest
+import tiktoken
+from graphrag.model.community_report import CommunityReport
+from fastapi.testclient import TestClient
+
+# GraphRAG示例的模块位于 design_docs 目录下，与服务层加载 graphrag_server 的方式相同
+DEMO_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "design_docs",
+    "mcp_rag_agent_graphrag_demo",
+)
+sys.path.insert(0, DEMO_DIR)
+
+from graphrag.vector_stores.base import VectorStoreDocument  # noqa: E402
+
+import graphrag_http  # noqa: E402
+from graphrag_dataset import GraphRAGDataset  # noqa: E402
+from graphrag_embedding_cache import CachedTextEmbedding  # noqa: E402
+from graphrag_report_embedding import content_hash, embed_community_reports  # noqa: E402
+from graphrag_report_prefilter import EmbeddingCommunitySelection  # noqa: E402
+from graphrag_report_summary import ProfiledGlobalSearch, compact_summary, summarize_community_reports  # noqa: E402
+from graphrag_token_cache import CachedTokenEncoder  # noqa: E402
+from mock_llm_server import LatencyDistribution, MockLLMConfig, create_app, hashed_embedding  # noqa: E402
+from graphrag_http import DNSCache, HTTPPoolConfig, SharedHTTPClients  # noqa: E402
+from graphrag_llm_router import (  # noqa: E402
+    CircuitBreaker,
+    LatencyRouter,
+    RetryBudget,
+    RoutedChatLLM,
+    RoutedTextEmbedding,
+    UpstreamUnavailableError,
+    parse_endpoints,
+)
+from graphrag_vector_store import NumpyVectorStore  # noqa: E402
+
+
+def make_vector_store(count=8):
+    """每个文档的向量指向不同的方向，查询向量 [1, 1, ...] 与所有文档都相似"""
+    store = NumpyVectorStore(collection_name="entities")
+    store.load_documents([
+        VectorStoreDocument(id=str(i), text=f"实体{i}", vector=list(np.eye(count)[i] + 0.1 * i))
+        for i in range(count)
+    ])
+    return store
+
+
+class TestNumpyVectorStore:
+    """测试进程内向量库"""
+
+    def test_filter_per_call(self):
+        """测试按id过滤只对本次搜索生效，不影响共享的向量库"""
+        store = make_vector_store()
+        query = [1.0] * 8
+        filtered = store.similarity_search_by_vector(query, k=8, include_ids=["1", "3"])
+        assert sorted(result.document.id for result in filtered) == ["1", "3"]
+        assert len(store.similarity_search_by_vector(query, k=8)) == 8
+
+        rows = store.filter_by_id(["2"])
+        assert [r.document.id for r in store.similarity_search_by_vector(query, query_filter=rows)] == ["2"]
+        assert len(store.similarity_search_by_vector(query, k=8)) == 8
+
+    def test_filtered_view(self):
+        """测试过滤视图与原向量库共享向量矩阵，原向量库不受影响"""
+        store = make_vector_store()
+        view = store.filtered(["4", "5"])
+        query = [1.0] * 8
+        assert sorted(r.document.id for r in view.similarity_search_by_vector(query, k=8)) == ["4", "5"]
+        assert view._matrix is store._matrix
+        assert store.query_filter is None
+        assert len(store.similarity_search_by_vector(query, k=8)) == 8
+
+    def test_concurrent_filters_isolated(self):
+        """测试并发请求的过滤条件互不影响"""
+        store = make_vector_store()
+        query = [1.0] * 8
+        groups = [["0", "1"], ["2", "3"], ["4", "5"], ["6", "7"]]
+        leaks = []
+        barrier = threading.Barrier(len(groups))
+
+        def search(include_ids):
+            barrier.wait()
+            for _ in range(200):
+                results = store.similarity_search_by_vector(query, k=8, include_ids=include_ids)
+                found = {result.document.id for result in results}
+                if found != set(include_ids):
+                    leaks.append((include_ids, found))
+
+        threads = [threading.Thread(target=search, args=(group,)) for group in groups]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert leaks == []
+
+    def test_save_and_load(self, tmp_path):
+        """测试保存后以内存映射方式加载，不留下临时文件"""
+        store = make_vector_store()
+        store.save(str(tmp_path), source=7)
+        assert sorted(os.listdir(tmp_path)) == ["entities.json", "entities.npy"]
+
+        loaded = NumpyVectorStore(collection_name="entities")
+        assert loaded.load(str(tmp_path)) == {"source": 7}
+        assert loaded.mapped
+        assert loaded.search_by_id("3").text == "实体3"
+        assert np.array_equal(loaded._matrix, store._matrix)
+
+    def test_load_rejects_mismatched_files(self, tmp_path):
+        """测试矩阵和元数据来自不同的保存（并发写入或保存中途中断）时加载失败，不返回错误的近邻"""
+        make_vector_store(8).save(str(tmp_path / "old"))
+        make_vector_store(6).save(str(tmp_path / "new"))
+        os.replace(tmp_path / "new" / "entities.npy", tmp_path / "old" / "entities.npy")
+
+        store = NumpyVectorStore(collection_name="entities")
+        with pytest.raises(ValueError):
+            store.load(str(tmp_path / "old"))
+        assert len(store) == 0
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def addrinfo(*addresses):
+    return [(None, None, None, "", (address, 443)) for address in addresses]
+
+
+class FakeNetworkBackend(httpcore.NetworkBackend):
+    """模拟网络后端，记录连接的地址，down 中的地址连接失败"""
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.connected = []
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.connected.append(host)
+        if host in self.down:
+            raise httpcore.ConnectError(f"{host} unreachable")
+        return host
+
+
+class OKHandler(BaseHTTPRequestHandler):
+    # 使用长连接
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSharedHTTPClients:
+    """测试共用的HTTP连接池和DNS缓存"""
+
+    def test_dns_cache_rotates_addresses(self, monkeypatch):
+        """测试缓存域名的所有地址，新连接轮流使用，过期后重新解析"""
+        resolved = []
+        monkeypatch.setattr(
+            graphrag_http.socket,
+            "getaddrinfo",
+            lambda host, port, **kwargs: resolved.append(host) or addrinfo("10.0.0.1", "10.0.0.2"),
+        )
+        clock = FakeClock()
+        cache = DNSCache(ttl=60, clock=clock)
+        assert cache.addresses("llm.example.com", 443) == ["10.0.0.1", "10.0.0.2"]
+        assert cache.addresses("llm.example.com", 443) == ["10.0.0.2", "10.0.0.1"]
+        assert cache.addresses("llm.example.com", 443) == ["10.0.0.1", "10.0.0.2"]
+        assert (cache.misses, cache.hits) == (1, 2)
+        clock.now = 61
+        cache.addresses("llm.example.com", 443)
+        assert resolved == ["llm.example.com", "llm.example.com"]
+
+    def test_connect_fails_over_to_next_address(self, monkeypatch):
+        """测试地址连接失败时尝试其余地址，全部失败时丢弃缓存"""
+        monkeypatch.setattr(
+            graphrag_http.socket, "getaddrinfo", lambda host, port, **kwargs: addrinfo("10.0.0.1", "10.0.0.2")
+        )
+        cache = DNSCache(ttl=60)
+        backend = FakeNetworkBackend(down={"10.0.0.1"})
+        cached = graphrag_http._CachedDNSSyncBackend(backend, cache)
+        assert cached.connect_tcp("llm.example.com", 443) == "10.0.0.2"
+        assert backend.connected == ["10.0.0.1", "10.0.0.2"]
+
+        backend.down.add("10.0.0.2")
+        with pytest.raises(httpcore.ConnectError):
+            cached.connect_tcp("llm.example.com", 443)
+        assert cache._get("llm.example.com", 443) is None
+
+    def test_proxy_environment_respected(self, monkeypatch):
+        """测试使用代理环境变量，代理传输层同样使用DNS缓存；trust_env 为 False 时不使用代理"""
+        monkeypatch.setenv("HTTPS_PROXY", "http://127.0.0.1:3128")
+        monkeypatch.setenv("NO_PROXY", "localhost")
+        clients = SharedHTTPClients(HTTPPoolConfig())
+        pools = [transport._pool for transport in graphrag_http._transports(clients.sync_client)]
+        assert any(isinstance(pool, httpcore.HTTPProxy) for pool in pools)
+        assert all(isinstance(pool._network_backend, graphrag_http._CachedDNSSyncBackend) for pool in pools)
+        clients.sync_client.close()
+
+        clients = SharedHTTPClients(HTTPPoolConfig(trust_env=False))
+        assert len(graphrag_http._transports(clients.sync_client)) == 1
+        clients.sync_client.close()
+
+    def test_connections_reused(self):
+        """测试多次请求复用同一个连接，域名只解析一次"""
+        server = HTTPServer(("127.0.0.1", 0), OKHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        clients = SharedHTTPClients(HTTPPoolConfig(trust_env=False))
+        try:
+            for _ in range(3):
+                response = clients.sync_client.get(f"http://localhost:{server.server_port}/")
+                assert response.text == "ok"
+            stats = clients.stats()
+            assert stats["sync_connections"] == 1
+            assert (stats["dns_cache_misses"], stats["dns_cache_hits"]) == (1, 0)
+        finally:
+            clients.sync_client.close()
+            server.shutdown()
+
+
+class FakeChatEndpoint:
+    """模拟一个LLM端点：等待 delay 秒后返回，记录调用次数和被取消的请求"""
+
+    def __init__(self, name, delay=0.0, errors=()):
+        self.name = name
+        self.model = f"model-{name}"
+        self.delay = delay
+        self.errors = list(errors)
+        self.calls = 0
+        self.cancelled = 0
+
+    async def agenerate(self, messages, streaming=True, callbacks=None, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.errors:
+            raise self.errors.pop(0)
+        return f"{self.name}: answer"
+
+
+class FakeStreamEndpoint:
+    """模拟流式生成的LLM端点：首个片段之前按 errors 依次失败，记录已关闭的流"""
+
+    def __init__(self, name, delay=0.0, errors=()):
+        self.name = name
+        self.delay = delay
+        self.errors = list(errors)
+        self.closed = 0
+
+    def stream_generate(self, messages, callbacks=None, **kwargs):
+        try:
+            if self.errors:
+                raise self.errors.pop(0)
+            for piece in (self.name, "-1", "-2"):
+                yield piece
+        finally:
+            self.closed += 1
+
+    async def astream_generate(self, messages, callbacks=None, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+            for piece in (self.name, "-1", "-2"):
+                yield piece
+        finally:
+            self.closed += 1
+
+
+class FakeEmbeddingEndpoint:
+    def __init__(self, model):
+        self.model = model
+        self.max_tokens = 2048
+
+    async def aembed(self, text, **kwargs):
+        return [1.0, 0.0]
+
+
+class TestLatencyRouter:
+    """测试按延迟路由和对冲请求"""
+
+    def test_prefers_low_latency_endpoint(self):
+        """测试按延迟加权选择端点，慢端点仍有少量请求用于探测"""
+        router = LatencyRouter([("fast", "fast"), ("slow", "slow")], seed=0)
+        router.stats["fast"].latency = 0.1
+        router.stats["slow"].latency = 1.0
+        picks = [router.choose()[0] for _ in range(1000)]
+        assert 850 < picks.count("fast") < 950
+        assert picks.count("slow") > 0
+
+        # 进行中的请求多的端点权重降低
+        router.stats["fast"].inflight = 20
+        assert router.weight("fast") < router.weight("slow")
+
+    def test_hedge_cancels_slow_request(self):
+        """测试请求超过对冲阈值时向另一个端点对冲，先返回的结果胜出，慢请求被取消"""
+        slow, fast = FakeChatEndpoint("slow", delay=1.0), FakeChatEndpoint("fast", delay=0.0)
+        llm = RoutedChatLLM([("slow", slow), ("fast", fast)], hedge_ratio=1.0, min_samples=5, seed=0)
+        # 慢端点的历史延迟更低，作为首选端点
+        llm.calls.stats["slow"].latency = 0.001
+        llm.calls.stats["fast"].latency = 10.0
+        llm.calls._latencies.extend([0.02] * 5)
+        assert llm.calls.hedge_delay() == pytest.approx(0.02)
+
+        assert asyncio.run(llm.agenerate([{"role": "user", "content": "萧炎"}])) == "fast: answer"
+        assert (slow.calls, fast.calls) == (1, 1)
+        assert slow.cancelled == 1
+        snapshot = llm.snapshot()["calls"]
+        assert (snapshot["hedges"], snapshot["hedge_wins"]) == (1, 1)
+        assert snapshot["endpoints"]["slow"]["inflight"] == 0
+
+    def test_no_hedge_without_samples(self):
+        """测试延迟样本不足或只有一个端点时不对冲"""
+        router = LatencyRouter([("a", "a"), ("b", "b")], min_samples=5)
+        assert router.hedge_delay() is None
+        single = LatencyRouter([("a", "a")], min_samples=0)
+        single._latencies.append(0.1)
+        assert single.hedge_delay() is None
+
+    def test_attributes_forwarded_to_first_endpoint(self):
+        """测试其余属性使用第一个端点的值"""
+        llm = RoutedChatLLM([("a", FakeChatEndpoint("a")), ("b", FakeChatEndpoint("b"))])
+        assert llm.model == "model-a"
+        embedder = RoutedTextEmbedding(
+            [("a", FakeEmbeddingEndpoint("text-embedding-v2")), ("b", FakeEmbeddingEndpoint("text-embedding-v2"))]
+        )
+        assert (embedder.model, embedder.max_tokens) == ("text-embedding-v2", 2048)
+        with pytest.raises(AttributeError):
+            llm.missing_attribute
+        assert asyncio.run(embedder.aembed("萧炎")) == [1.0, 0.0]
+
+
+    def test_sync_stream_retries_and_trips_breaker(self):
+        """测试同步流式生成在首个片段之前失败时计入熔断器并换用其他端点重试"""
+        error = httpx.ConnectError("connection refused")
+        broken, healthy = FakeStreamEndpoint("broken", errors=[error]), FakeStreamEndpoint("healthy")
+        llm = RoutedChatLLM(
+            [("broken", broken), ("healthy", healthy)], failure_threshold=1, backoff_base=0.0, seed=0
+        )
+        llm.streams.stats["broken"].latency = 0.001
+        llm.streams.stats["healthy"].latency = 10.0
+
+        assert "".join(llm.stream_generate([{"role": "user", "content": "萧炎"}])) == "healthy-1-2"
+        snapshot = llm.snapshot()["streams"]
+        assert snapshot["retries"] == 1
+        assert snapshot["endpoints"]["broken"]["circuit"]["state"] == "open"
+        assert snapshot["endpoints"]["broken"]["errors"] == 1
+        assert snapshot["endpoints"]["healthy"]["inflight"] == 0
+        assert (broken.closed, healthy.closed) == (1, 1)
+
+    def test_hedged_stream_closes_losing_stream(self):
+        """测试流式生成对冲时落败端点的上游流被关闭"""
+        slow, fast = FakeStreamEndpoint("slow", delay=1.0), FakeStreamEndpoint("fast")
+        llm = RoutedChatLLM([("slow", slow), ("fast", fast)], hedge_ratio=1.0, min_samples=5, seed=0)
+        llm.streams.stats["slow"].latency = 0.001
+        llm.streams.stats["fast"].latency = 10.0
+        llm.streams._latencies.extend([0.02] * 5)
+
+        async def run():
+            pieces = [piece async for piece in llm.astream_generate([{"role": "user", "content": "萧炎"}])]
+            await asyncio.sleep(0)
+            return "".join(pieces)
+
+        assert asyncio.run(run()) == "fast-1-2"
+        assert (slow.closed, fast.closed) == (1, 1)
+
+    def test_discard_results_completed_together(self):
+        """测试与胜出请求同时完成的对冲请求的结果被释放"""
+        router = LatencyRouter([("a", "a"), ("b", "b")], hedge_ratio=1.0, min_samples=1)
+        router._latencies.append(0.01)
+        discarded = []
+
+        async def run():
+            both_sent = asyncio.Event()
+
+            async def func(client):
+                # 首选请求等到对冲请求发出后与其在同一轮事件循环中完成
+                if both_sent.is_set() or router.hedges:
+                    both_sent.set()
+                    await asyncio.sleep(0)
+                else:
+                    await both_sent.wait()
+                return client
+
+            result = await router.call(func, discarded.append)
+            await asyncio.sleep(0)
+            return result
+
+        result = asyncio.run(run())
+        assert router.hedges == 1
+        assert sorted([result] + discarded) == ["a", "b"]
+
+    def test_parse_endpoints_rejects_mixed_embedding_models(self):
+        """测试各端点的向量模型不同时拒绝配置，未指定的字段使用单端点配置"""
+        endpoints = parse_endpoints(
+            '[{"name": "a", "api_key": "sk-a"}, {"base_url": "https://b", "embedding_model": "text-embedding-v2"}]',
+            "https://a", "sk", "qwen", "text-embedding-v2",
+        )
+        assert [(e.name, e.base_url, e.api_key) for e in endpoints] == [
+            ("a", "https://a", "sk-a"), ("endpoint-1", "https://b", "sk")
+        ]
+        with pytest.raises(ValueError, match="embedding model"):
+            parse_endpoints('[{}, {"embedding_model": "bge-large"}]', None, None, "qwen", "text-embedding-v2")
+
+
+class TestCircuitBreaker:
+    """测试熔断器状态转换、Retry-After 和重试预算"""
+
+    def test_state_transitions(self):
+        """测试连续失败后打开，到期后半开只放行一个探测请求，探测成功关闭、失败重新打开"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, recovery_time=10, clock=clock)
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED and breaker.available()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN and not breaker.available()
+        assert breaker.retry_after() == 10
+
+        clock.now = 4
+        assert breaker.retry_after() == 6
+        # 打开前发出的请求在打开期间失败，不延长打开时间
+        breaker.record_failure()
+        assert breaker.retry_after() == 6
+
+        clock.now = 10
+        assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.available()
+        breaker.acquire()
+        assert not breaker.available()
+        # 探测请求被取消后重新放行探测请求
+        breaker.release()
+        assert breaker.available()
+        breaker.acquire()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 2
+
+        clock.now = 20
+        breaker.acquire()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert (breaker.failures, breaker.retry_after()) == (0, 0.0)
+
+    def test_retry_after_propagated(self):
+        """测试所有端点熔断后立即抛出带 retry_after 的异常，对话和流式调用共用熔断器"""
+        clock = FakeClock()
+        endpoint = FakeChatEndpoint("a", errors=[httpx.ConnectError("down")])
+        llm = RoutedChatLLM(
+            [("a", endpoint)],
+            max_retries=0,
+            breakers={"a": CircuitBreaker(failure_threshold=1, recovery_time=30, clock=clock)},
+        )
+        assert llm.retry_after() is None
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(llm.agenerate([]))
+        assert llm.retry_after() == 30
+
+        clock.now = 5
+        with pytest.raises(UpstreamUnavailableError) as exc_info:
+            asyncio.run(llm.agenerate([]))
+        assert exc_info.value.retry_after == 25
+        assert llm.streams.retry_after() == 25
+        assert endpoint.calls == 1
+        assert llm.calls.rejected == 1
+
+    def test_request_errors_do_not_trip(self):
+        """测试请求本身的错误不重试，也不计入熔断器的失败次数"""
+        endpoint = FakeChatEndpoint("a", errors=[ValueError("bad request")])
+        llm = RoutedChatLLM([("a", endpoint)], failure_threshold=1)
+        with pytest.raises(ValueError):
+            asyncio.run(llm.agenerate([]))
+        assert llm.calls.breakers["a"].state == CircuitBreaker.CLOSED
+        assert llm.calls.retries == 0
+
+    def test_retry_budget(self):
+        """测试重试名额用完后拒绝重试，成功调用和时间流逝补充名额"""
+        clock = FakeClock()
+        budget = RetryBudget(ratio=0.5, min_per_second=1.0, capacity=2, clock=clock)
+        assert budget.withdraw() and budget.withdraw()
+        assert not budget.withdraw()
+        budget.deposit()
+        budget.deposit()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+        clock.now = 1.5
+        assert budget.withdraw()
+        assert budget.snapshot()["denied"] == 2
+
+    def test_retries_stop_when_budget_exhausted(self):
+        """测试重试预算耗尽时不再重试，即使没有达到最大重试次数"""
+        clock = FakeClock()
+        errors = [httpx.ConnectError("down") for _ in range(5)]
+        endpoint = FakeChatEndpoint("a", errors=errors)
+        llm = RoutedChatLLM(
+            [("a", endpoint)],
+            max_retries=5,
+            backoff_base=0.0,
+            failure_threshold=10,
+            retry_budget=RetryBudget(ratio=0.1, min_per_second=0.0, capacity=1, clock=clock),
+        )
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(llm.agenerate([]))
+        assert endpoint.calls == 2
+        assert llm.calls.retries == 1
+        assert llm.calls.retry_budget.snapshot()["denied"] == 1
+
+
+class TestGraphRAGDataset:
+    """测试内存映射数据集的列投影和内存统计"""
+
+    def test_zero_copy_projection_and_memory_breakdown(self, tmp_path):
+        """测试数值列零拷贝引用内存映射的 Arrow 缓冲区，内存映射和私有内存分开统计"""
+        output = tmp_path / "output"
+        output.mkdir()
+        pd.DataFrame({
+            "id": [str(i) for i in range(1000)],
+            "weight": np.arange(1000, dtype=np.float64),
+        }).to_parquet(output / "create_final_relationships.parquet")
+        dataset = GraphRAGDataset(str(output), cache_dir=str(tmp_path / "cache"))
+
+        numbers = dataset.table("create_final_relationships", ["weight"])
+        assert not numbers["weight"].values.flags.writeable
+        breakdown = dataset.memory_breakdown()
+        assert breakdown["mapped"] >= 8000
+        # 零拷贝的数值列不计入私有内存
+        assert breakdown["materialized"] < 8000
+
+        dataset.table("create_final_relationships", ["id", "weight"])
+        assert dataset.memory_usage() > breakdown["materialized"]
+        assert dataset.mapped_bytes() == breakdown["mapped"]
+
+    def test_changed_table_reloads_only_its_dependents(self, tmp_path):
+        """测试只有一个 parquet 文件变化时只重新加载该表，其他表和转换结果（按社区层级分别缓存）继续复用"""
+        output = tmp_path / "output"
+        output.mkdir()
+        for name in (
+                "create_final_nodes", "create_final_entities",
+                "create_final_relationships", "create_final_text_units",
+        ):
+            shutil.copy(os.path.join(DEMO_DIR, "doupocangqiong", "output", f"{name}.parquet"), output)
+        dataset = GraphRAGDataset(str(output), cache_dir=str(tmp_path / "cache"))
+
+        entities = {level: dataset.entities(level) for level in (0, 1)}
+        relationships = dataset.relationships()
+        text_units = dataset.text_units()
+        tables = {name: dataset.arrow_table(name) for name in (
+            "create_final_nodes", "create_final_entities", "create_final_text_units",
+        )}
+        relationship_table = dataset.arrow_table("create_final_relationships")
+        assert entities[0] is not entities[1]
+        assert dataset.entities(0) is entities[0]
+        assert dataset.relationships() is relationships
+
+        path = output / "create_final_relationships.parquet"
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        reloaded = dataset.relationships()
+        assert reloaded is not relationships
+        assert len(reloaded) == len(relationships)
+        assert dataset.arrow_table("create_final_relationships") is not relationship_table
+        assert dataset.relationships() is reloaded
+        # 其他表和依赖它们的转换结果不受影响
+        for level in (0, 1):
+            assert dataset.entities(level) is entities[level]
+        assert dataset.text_units() is text_units
+        for name, table in tables.items():
+            assert dataset.arrow_table(name) is table
+
+    def test_pinned_snapshot(self, tmp_path):
+        """测试固定后的数据集在输出目录被新索引覆盖后仍读取固定时的表，未固定的数据集读取新表"""
+        output = tmp_path / "output"
+        output.mkdir()
+        path = output / "create_final_relationships.parquet"
+        pd.DataFrame({"id": ["v1"]}).to_parquet(path)
+        pinned = GraphRAGDataset(str(output), cache_dir=str(tmp_path / "cache"))
+        pinned.pin()
+        latest = GraphRAGDataset(str(output), cache_dir=str(tmp_path / "cache"))
+
+        pd.DataFrame({"id": ["v2", "v2"]}).to_parquet(path)
+        os.utime(path, ns=(1, 1))
+        assert pinned.table("create_final_relationships")["id"].tolist() == ["v1"]
+        assert latest.table("create_final_relationships")["id"].tolist() == ["v2", "v2"]
+        pinned.clear()
+        assert pinned.table("create_final_relationships")["id"].tolist() == ["v2", "v2"]
+
+    def test_derived_tables_matched_by_content(self, tmp_path):
+        """测试报告向量和摘要按报告内容对应，其他版本的报告生成的向量和摘要不会附加到内容不同的报告上"""
+        output = tmp_path / "output"
+        output.mkdir()
+        pd.DataFrame({
+            "id": ["n0", "n1"], "title": ["萧炎", "药老"], "community": [0, 1], "level": [0, 0], "degree": [1, 1],
+        }).to_parquet(output / "create_final_nodes.parquet")
+        pd.DataFrame({
+            "id": ["r0", "r1"], "community": [0, 1], "level": [0, 0], "title": ["萧家", "药族"],
+            "summary": ["萧家摘要", "药族摘要"], "full_content": ["萧家全文", "药族全文（旧）"], "rank": [1.0, 2.0],
+        }).to_parquet(output / "create_final_community_reports.parquet")
+        # 向量和摘要由新版本的报告生成，r1 的内容已经变化
+        pd.DataFrame({
+            "id": ["r0", "r1"], "full_content": ["萧家全文", "药族全文（新）"],
+            "full_content_embeddings": [[1.0, 0.0], [0.0, 1.0]],
+        }).to_parquet(output / "create_final_community_reports_with_embeddings.parquet")
+        pd.DataFrame({
+            "id": ["r0", "r1"],
+            "content_hash": [content_hash("萧家全文"), content_hash("药族全文（新）")],
+            "compact_summary": ["# 萧家", "# 药族"],
+        }).to_parquet(output / "create_final_community_reports_summaries.parquet")
+
+        dataset = GraphRAGDataset(str(output), cache_dir=str(tmp_path / "cache"))
+        reports = {report.id: report for report in dataset.reports(None, with_embeddings=True, with_summaries=True)}
+        assert reports["r0"].full_content_embedding == [1.0, 0.0]
+        assert reports["r0"].summary == "# 萧家"
+        assert reports["r1"].full_content_embedding is None
+        assert reports["r1"].summary == "药族摘要"
+        assert reports["r1"].full_content == "药族全文（旧）"
+
+
+class FakeTextEmbedder:
+    """模拟向量模型，记录请求过向量的文本，bad 中的文本返回包含非有限值的向量"""
+
+    model = "text-embedding-v2"
+    max_tokens = 2048
+
+    def __init__(self, bad=()):
+        self.bad = set(bad)
+        self.texts = []
+
+    def _vector(self, text):
+        self.texts.append(text)
+        if text in self.bad:
+            return [float("nan"), 0.0]
+        return [float(len(text)), 1.0]
+
+    def embed(self, text, **kwargs):
+        return self._vector(text)
+
+    async def aembed(self, text, **kwargs):
+        return self._vector(text)
+
+
+class TestCachedTextEmbedding:
+    """测试查询向量的持久化缓存"""
+
+    def test_hit_miss_and_persistence(self, tmp_path):
+        """测试重复文本命中缓存，进程重启（新实例）后从SQLite读取"""
+        path = str(tmp_path / "embeddings.sqlite")
+        embedder = FakeTextEmbedder()
+        cache = CachedTextEmbedding(embedder, path)
+        assert cache.embed("萧炎") == [2.0, 1.0]
+        assert asyncio.run(cache.aembed("萧炎")) == [2.0, 1.0]
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.max_tokens == 2048
+        cache.close()
+
+        reopened = CachedTextEmbedding(embedder, path)
+        assert reopened.embed("萧炎") == [2.0, 1.0]
+        assert embedder.texts == ["萧炎"]
+        reopened.close()
+
+    def test_non_finite_vectors_not_cached(self, tmp_path):
+        """测试包含非有限值的向量和空向量不写入缓存"""
+        embedder = FakeTextEmbedder(bad={"失败查询"})
+        cache = CachedTextEmbedding(embedder, str(tmp_path / "embeddings.sqlite"))
+        cache.embed("失败查询")
+        cache.embed("失败查询")
+        assert embedder.texts == ["失败查询", "失败查询"]
+        cache.put("空向量", [])
+        assert cache.get("空向量") is None
+        cache.close()
+
+    def test_memory_lru_falls_back_to_sqlite(self, tmp_path):
+        """测试内存缓存按LRU淘汰，被淘汰的向量仍从SQLite命中"""
+        embedder = FakeTextEmbedder()
+        cache = CachedTextEmbedding(embedder, str(tmp_path / "embeddings.sqlite"), memory_entries=1)
+        cache.embed("萧炎")
+        cache.embed("萧战")
+        assert len(cache._memory) == 1
+        assert cache.embed("萧炎") == [2.0, 1.0]
+        assert embedder.texts == ["萧炎", "萧战"]
+        cache.close()
+
+
+class FakeEmbeddingsAPI:
+    """模拟同步向量接口，记录每次请求的输入"""
+
+    def __init__(self):
+        self.inputs = []
+
+    def with_options(self, **kwargs):
+        return self
+
+    @property
+    def embeddings(self):
+        return self
+
+    def create(self, input, model):
+        self.inputs.append(list(input))
+        data = [
+            SimpleNamespace(index=index, embedding=[float(len(text)), 1.0])
+            for index, text in reversed(list(enumerate(input)))
+        ]
+        return SimpleNamespace(data=data)
+
+
+class TestReportEmbedding:
+    """测试社区报告按内容哈希增量向量化"""
+
+    @staticmethod
+    def _embedder(cache_dir):
+        cache_dir.mkdir(exist_ok=True)
+        embedder = FakeTextEmbedder()
+        embedder.sync_client = FakeEmbeddingsAPI()
+        embedder.token_encoder = tiktoken.get_encoding("cl100k_base")
+        return CachedTextEmbedding(embedder, str(cache_dir / "embeddings.sqlite"))
+
+    @staticmethod
+    def _write_reports(input_dir, contents):
+        frame = pd.DataFrame({"id": [str(i) for i in range(len(contents))], "full_content": contents})
+        frame.to_parquet(input_dir / "create_final_community_reports.parquet")
+
+    def test_only_changed_reports_reembedded(self, tmp_path):
+        """测试只对新增或内容变化的报告请求向量接口，未变化的报告复用已有向量"""
+        self._write_reports(tmp_path, ["萧炎", "药老", "萧薰儿"])
+        first = self._embedder(tmp_path / "first")
+        report_df = embed_community_reports(str(tmp_path), first, batch_size=2)
+        assert sorted(sum(first.sync_client.inputs, [])) == sorted(["萧炎", "药老", "萧薰儿"])
+        assert np.allclose(report_df["full_content_embeddings"][1], np.array([2.0, 1.0]) / np.sqrt(5))
+        first.close()
+
+        # 新的缓存目录，确保复用的向量来自已有的向量文件而不是查询向量缓存
+        self._write_reports(tmp_path, ["萧炎", "药尘", "萧薰儿", "美杜莎"])
+        second = self._embedder(tmp_path / "second")
+        report_df = embed_community_reports(str(tmp_path), second)
+        assert second.sync_client.inputs == [["药尘", "美杜莎"]]
+        assert report_df["full_content_embeddings"].map(len).tolist() == [2, 2, 2, 2]
+        assert not (tmp_path / "create_final_community_reports_with_embeddings.parquet.tmp").exists()
+        second.close()
+
+    def test_missing_full_content(self, tmp_path):
+        """测试报告表缺少 full_content 列时报错"""
+        pd.DataFrame({"id": ["0"]}).to_parquet(tmp_path / "create_final_community_reports.parquet")
+        with pytest.raises(ValueError, match="full_content"):
+            embed_community_reports(str(tmp_path), self._embedder(tmp_path / "cache"))
+
+    def test_content_hash(self):
+        """测试内容哈希只取决于文本内容"""
+        assert content_hash("萧炎") == content_hash("萧炎")
+        assert content_hash("萧炎") != content_hash("萧炎 ")
+
+
+class TestCachedTokenEncoder:
+    """测试带缓存的 tiktoken 编码器"""
+
+    def test_pinned_entries_survive_lru_eviction(self):
+        """测试 pinned() 中编码的静态记录不被淘汰，查询相关文本按LRU淘汰"""
+        encoding = tiktoken.get_encoding("cl100k_base")
+        encoder = CachedTokenEncoder(encoding, max_entries=2)
+        with encoder.pinned("v1"):
+            encoder.count("萧炎的斗技")
+        encoder.count("第一个查询")
+        encoder.count("第二个查询")
+        encoder.count("第一个查询")
+        encoder.count("第三个查询")
+        assert list(encoder._lru) == ["第一个查询", "第三个查询"]
+        assert "萧炎的斗技" in encoder._static["v1"]
+
+        stats = encoder.stats()
+        assert (stats["static_entries"], stats["entries"]) == (1, 2)
+        assert encoder.count("萧炎的斗技") == len(encoding.encode("萧炎的斗技"))
+        assert encoder.stats()["hits"] == stats["hits"] + 1
+
+    def test_pinned_scopes_replaced_and_released(self):
+        """测试同一 scope 再次预编码时替换原有记录，release 丢弃该 scope，其他 scope 已有的文本同样计入新 scope"""
+        encoder = CachedTokenEncoder(tiktoken.get_encoding("cl100k_base"))
+        with encoder.pinned("v1"):
+            encoder.count("萧炎")
+            encoder.count("旧报告")
+        with encoder.pinned("v2"):
+            encoder.count("萧炎")
+            encoder.count("新报告")
+        assert set(encoder._static["v2"]) == {"萧炎", "新报告"}
+
+        encoder.release("v1")
+        assert set(encoder._static) == {"v2"}
+        misses = encoder.misses
+        encoder.count("萧炎")
+        assert encoder.misses == misses
+
+        with encoder.pinned("v2"):
+            encoder.count("新报告")
+        assert set(encoder._static["v2"]) == {"新报告"}
+        assert encoder.stats()["static_entries"] == 1
+
+        # 预编码失败时保留该 scope 原有的记录
+        with pytest.raises(RuntimeError):
+            with encoder.pinned("v2"):
+                encoder.count("半个报告")
+                raise RuntimeError("build failed")
+        assert set(encoder._static["v2"]) == {"新报告"}
+
+    def test_interface_matches_encoding(self):
+        """测试编码结果与 tiktoken 一致，过长文本和带参数的调用不缓存"""
+        encoding = tiktoken.get_encoding("cl100k_base")
+        encoder = CachedTokenEncoder(encoding, max_text_tokens=3)
+        text = "药老传授萧炎焚诀"
+        assert encoder.encode(text) == encoding.encode(text)
+        assert encoder.decode(encoder.encode("hi")) == "hi"
+        assert encoder.encode("<|endoftext|>", allowed_special="all") == [encoding.eot_token]
+        assert list(encoder._lru) == ["hi"]
+
+
+class TestMockLLMServer:
+    """测试离线压测使用的 OpenAI 兼容替身服务"""
+
+    @staticmethod
+    def _client(**kwargs):
+        config = MockLLMConfig(
+            ttft=LatencyDistribution("fixed:0"),
+            token_rate=0,
+            embedding_latency=LatencyDistribution("fixed:0"),
+            embedding_dim=64,
+            seed=7,
+            **kwargs,
+        )
+        return TestClient(create_app(config))
+
+    def test_latency_distribution(self):
+        """测试延迟分布的解析和采样"""
+        rng = random.Random(0)
+        assert LatencyDistribution("fixed:0.5").sample(rng) == 0.5
+        assert 0.2 <= LatencyDistribution("uniform:0.2,1.0").sample(rng) <= 1.0
+        assert LatencyDistribution("lognormal:0.5,0.6").sample(rng) > 0
+        for spec in ("fixed", "uniform:0.2", "gamma:1"):
+            with pytest.raises(ValueError):
+                LatencyDistribution(spec)
+
+    def test_chat_completions(self):
+        """测试普通回答、要求JSON的回答和流式回答"""
+        client = self._client(output_tokens=5)
+        body = {"model": "mock", "messages": [{"role": "user", "content": "萧炎是谁"}]}
+        response = client.post("/v1/chat/completions", json=body).json()
+        assert response["usage"]["completion_tokens"] == 5
+        assert response["usage"]["prompt_tokens"] == 4
+
+        json_body = dict(body, response_format={"type": "json_object"})
+        content = client.post("/v1/chat/completions", json=json_body).json()["choices"][0]["message"]["content"]
+        assert {"points", "response", "follow_up_queries"} <= set(json.loads(content))
+
+        with client.stream("POST", "/v1/chat/completions", json=dict(body, stream=True)) as stream:
+            lines = [line for line in stream.iter_lines() if line]
+        assert lines[-1] == "data: [DONE]"
+        assert len(lines) == 5 + 3
+
+    def test_embeddings_deterministic(self):
+        """测试向量确定、单位长度，且支持单条文本输入"""
+        client = self._client()
+        data = client.post("/v1/embeddings", json={"input": ["萧炎", "萧炎"]}).json()["data"]
+        assert data[0]["embedding"] == data[1]["embedding"] == hashed_embedding("萧炎", 64)
+        assert np.isclose(np.linalg.norm(data[0]["embedding"]), 1.0)
+        single = client.post("/v1/embeddings", json={"input": "萧炎"}).json()["data"]
+        assert single[0]["embedding"] == data[0]["embedding"]
+
+    def test_error_injection(self):
+        """测试按比例注入错误，429 带 Retry-After，并计入统计"""
+        client = self._client(error_rate=1.0, error_statuses=[429])
+        response = client.post("/v1/embeddings", json={"input": "萧炎"})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+        assert client.get("/stats").json() == {"embeddings.requests": 1, "embeddings.errors.429": 1}
+
+
+class RecordingContextBuilder:
+    """记录每次构建上下文时收到的参数，不产生上下文，全局搜索因此不调用LLM"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def build_context(self, query, conversation_history=None, **kwargs):
+        await asyncio.sleep(0.01)
+        self.calls.append((query, kwargs))
+        return SimpleNamespace(
+            context_chunks=[], context_records={}, llm_calls=0, prompt_tokens=0, output_tokens=0
+        )
+
+
+class TestProfiledGlobalSearch:
+    """测试按档位选择社区报告全文或摘要的全局搜索"""
+
+    @staticmethod
+    def _search(**kwargs):
+        return ProfiledGlobalSearch(
+            llm=None,
+            context_builder=RecordingContextBuilder(),
+            token_encoder=tiktoken.get_encoding("cl100k_base"),
+            context_builder_params={"max_tokens": 1000},
+            **kwargs,
+        )
+
+    def test_resolve_profile(self):
+        """测试 auto 档位按报告全文的 token 数选择全文或摘要，未知档位报错"""
+        assert self._search(full_content_tokens=100, full_content_max_tokens=100).resolve_profile() == "quality"
+        search = self._search(full_content_tokens=101, full_content_max_tokens=100)
+        assert search.resolve_profile() == "fast"
+        assert search.resolve_profile("quality") == "quality"
+        assert search.context_params_for("fast") == {"max_tokens": 1000, "use_community_summary": True}
+        assert search.context_builder_params == {"max_tokens": 1000, "use_community_summary": True}
+        with pytest.raises(ValueError):
+            search.resolve_profile("slow")
+        with pytest.raises(ValueError):
+            self._search(default_profile="slow")
+
+    def test_concurrent_requests_use_own_profile(self):
+        """测试并发请求的上下文参数互不影响，请求结束后恢复默认参数"""
+        search = self._search(default_profile="quality")
+
+        async def run():
+            await asyncio.gather(
+                search.asearch("萧炎", profile="fast"),
+                search.asearch("药老", profile="quality"),
+                search.asearch("萧薰儿"),
+            )
+
+        asyncio.run(run())
+        flags = {query: params["use_community_summary"] for query, params in search.context_builder.calls}
+        assert flags == {"萧炎": True, "药老": False, "萧薰儿": False}
+        assert search.context_builder_params["use_community_summary"] is False
+
+    def test_summarize_community_reports(self, tmp_path):
+        """测试紧凑摘要只保留标题、摘要和发现的标题，内容未变化的报告复用已有摘要"""
+        findings = [{"summary": "萧炎突破斗师", "explanation": "详细说明" * 100}, {"summary": None}]
+        assert compact_summary("萧炎", "主角", findings) == "# 萧炎\n\n主角\n\n- 萧炎突破斗师"
+        assert compact_summary("萧炎", "", None) == "# 萧炎"
+
+        reports = pd.DataFrame({
+            "id": ["0", "1"],
+            "title": ["萧炎", "药老"],
+            "summary": ["主角", "导师"],
+            "findings": [findings, []],
+            "full_content": ["萧炎" * 50, "药老" * 50],
+        })
+        reports.to_parquet(tmp_path / "create_final_community_reports.parquet")
+        encoder = CachedTokenEncoder(tiktoken.get_encoding("cl100k_base"))
+        first = summarize_community_reports(str(tmp_path), encoder)
+        assert (first["summary_tokens"] < first["full_content_tokens"]).all()
+
+        encoder.hits = encoder.misses = 0
+        second = summarize_community_reports(str(tmp_path), encoder)
+        assert encoder.hits + encoder.misses == 0
+        pd.testing.assert_frame_equal(first, second)
+
+
+class FailingTextEmbedder:
+    """查询向量化总是失败的向量模型"""
+
+    async def aembed(self, text, **kwargs):
+        raise RuntimeError("embedding endpoint unavailable")
+
+
+class TestEmbeddingCommunitySelection:
+    """测试全局搜索 map 阶段前的社区报告预筛选"""
+
+    @staticmethod
+    def _reports():
+        embeddings = [[1.0, 0.0], None, [0.0, 1.0], [0.8, 0.6]]
+        return [
+            CommunityReport(
+                id=str(i), short_id=str(i), title=f"社区{i}", community_id=str(i),
+                full_content_embedding=embedding,
+            )
+            for i, embedding in enumerate(embeddings)
+        ]
+
+    def test_rank_puts_reports_without_embedding_last(self):
+        """测试按相似度排序，没有向量的报告排在最后"""
+        selection = EmbeddingCommunitySelection(self._reports(), FakeTextEmbedder(), top_n=2)
+        assert selection.rank([2.0, 0.0]).tolist() == [0, 3, 2, 1]
+        assert selection.rank([0.0, 1.0]).tolist() == [2, 3, 0, 1]
+
+    def test_select_top_n(self):
+        """测试选出最相关的 top_n 个报告并保持原有顺序，不计LLM用量"""
+        reports = self._reports()
+        embedder = FakeTextEmbedder()
+        # FakeTextEmbedder 返回 [文本长度, 1.0]，"萧炎" 的向量为 [2, 1]，排名为 3、0、2、1
+        selection = EmbeddingCommunitySelection(reports, embedder, top_n=2)
+        selected, usage = asyncio.run(selection.select("萧炎"))
+        assert [report.id for report in selected] == ["0", "3"]
+        assert usage == {"llm_calls": 0, "prompt_tokens": 0, "output_tokens": 0}
+        assert embedder.texts == ["萧炎"]
+
+    def test_disabled(self):
+        """测试 top_n 不大于 0、报告数不超过 top_n 或没有报告带向量时不筛选"""
+        reports = self._reports()
+        for top_n in (0, -1, 4, 5):
+            selection = EmbeddingCommunitySelection(reports, FakeTextEmbedder(), top_n=top_n)
+            assert not selection.enabled()
+            assert asyncio.run(selection.select("萧"))[0] is reports
+            assert selection.text_embedder.texts == []
+        for report in reports:
+            report.full_content_embedding = None
+        assert not EmbeddingCommunitySelection(reports, FakeTextEmbedder(), top_n=2).enabled()
+
+    def test_embed_failure_falls_back_to_all_reports(self, caplog):
+        """测试查询向量化失败时使用全部报告并记录警告"""
+        reports = self._reports()
+        selection = EmbeddingCommunitySelection(reports, FailingTextEmbedder(), top_n=2)
+        with caplog.at_level("WARNING", logger="graphrag_report_prefilter"):
+            selected, _ = asyncio.run(selection.select("萧炎"))
+        assert selected is reports
+        assert "embedding endpoint unavailable" in caplog.text
@@ -26,3 +26,19 @@ def test_verify_password():
     # 确保错误的密码不能通过验证
     assert verify_password("wrongpassword", hashed_password) is False
     assert verify_password("", hashed_password) is False
+
+
+def test_import_timer():
+    """测试导入耗时统计只记录首次导入的模块"""
+    import sys
+    from app.utils.import_timer import ImportTimer
+
+    sys.modules.pop("colorsys", None)
+    with ImportTimer() as timer:
+        import colorsys  # noqa: F401
+        import os  # noqa: F401
+    report = timer.report()
+    assert "colorsys" in timer.records
+    assert "os" not in timer.records
+    assert report["total"] >= report["modules"][0]["self_time"]
+    assert "colorsys" in report["packages"]